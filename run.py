@@ -40,9 +40,8 @@ def run_openai_example():
     
     # 5. 第一次交互：设置激活记忆
     print("--- 第一次交互：设置用户偏好 ---")
-    agent.memory_manager.active_memory.set("user_preference_food", "清淡少油")
-    agent.memory_manager.active_memory.set("user_recent_trip", "下周去上海出差")
-    agent.memory_manager.persistence.save_active_memory(agent.memory_manager.active_memory)
+    agent.memory_manager.set_active_memory("user_preference_food", "清淡少油")
+    agent.memory_manager.set_active_memory("user_recent_trip", "下周去上海出差")
     
     query1 = "我最近总是感觉疲惫，有什么健康建议吗？"
     response1 = agent.process_query(query1)
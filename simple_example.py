@@ -113,8 +113,8 @@ class SimpleHealthAssistant:
         print("\n📋 记忆状态:")
         
         # 对话记忆
-        dialogue_count = len(self.agent.memory_manager.dialogue_memory.messages)
-        print(f"   对话记录: {dialogue_count} 条")
+        dialogue_stats = self.agent.memory_manager.get_dialogue_stats()
+        print(f"   对话记录: {dialogue_stats['total_messages']} 条 (内存中 {dialogue_stats['resident_messages']} 条)")
         
         # 专业记忆
         if self.agent.role.professional_knowledge_path:
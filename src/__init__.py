@@ -1,8 +1,9 @@
 from .agent import RolePlayingAgent
 from .role import Role
 from .memory.manager import MemoryManager
-from .memory.types import DialogueMemory, ActiveMemory, ProfessionalMemory
-from .llm.connector import LLMConnector
+from .memory.types import DialogueMemory, ActiveMemory, ActiveMemoryConfig, ProfessionalMemory
+from .llm.connector import LLMConnector, LLMConnectorError
+from .session_pool import AgentPool
 
 __all__ = [
     "RolePlayingAgent",
@@ -10,6 +11,9 @@ __all__ = [
     "MemoryManager",
     "DialogueMemory",
     "ActiveMemory",
+    "ActiveMemoryConfig",
     "ProfessionalMemory",
-    "LLMConnector"
+    "LLMConnector",
+    "LLMConnectorError",
+    "AgentPool"
 ]
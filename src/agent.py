@@ -1,25 +1,51 @@
-from typing import Optional
+import asyncio
+from typing import Optional, Iterator, AsyncIterator, Dict, Any, List, Tuple, Union
 from role import Role
 from memory.manager import MemoryManager
-from llm.connector import LLMConnector, MockLLMConnector, OpenAIConnector
+from memory.types import ProfessionalMemory
+from llm.connector import LLMConnector, LoopLocal, MockLLMConnector, OpenAIConnector
 
 class RolePlayingAgent:
     """
     角色扮演智能体核心类。
     负责接收用户输入，协调记忆管理和LLM连接器，生成响应。
     """
-    def __init__(self, user_id: str, role: Role, llm_connector: Optional[LLMConnector] = None):
+    def __init__(self, user_id: str, role: Role, llm_connector: Optional[LLMConnector] = None,
+                 memory_manager: Optional[MemoryManager] = None, multi_turn: bool = False):
         """
         初始化智能体。
         
         :param user_id: 用户的唯一ID。
         :param role: 绑定的 Role 实例。
         :param llm_connector: LLMConnector 实例。
+        :param memory_manager: 预先构建的 MemoryManager（如共享持久化层和 RAG 系统时）；
+            为 None 时使用默认配置创建。
+        :param multi_turn: 是否使用多轮消息模式（稳定的 system 前缀 + 历史轮次 + 易变上下文），
+            便于 LLM 服务端的前缀缓存命中；默认将所有记忆融合为单条 user 消息。
         """
         self.user_id = user_id
         self.role = role
-        self.memory_manager = MemoryManager(user_id=user_id, role=role)
+        self.memory_manager = memory_manager if memory_manager else MemoryManager(user_id=user_id, role=role)
         self.llm_connector = llm_connector if llm_connector else MockLLMConnector()
+        self.multi_turn = multi_turn
+        # 串行化同一智能体上的异步查询；asyncio.Lock 绑定事件循环，按循环分别创建
+        self._query_locks = LoopLocal(asyncio.Lock)
+
+    def warmup(self):
+        """
+        显式预热：默认情况下嵌入模型和向量库客户端在首次检索时才加载，
+        希望在启动阶段支付该开销的部署可在初始化后调用此方法。
+        """
+        self.memory_manager.warmup()
+
+    def _build_llm_request(self, user_query: str, professional_memory=None) -> Dict[str, Any]:
+        """记忆融合，返回 LLMConnector 调用参数（system_prompt / user_prompt / history）。"""
+        if self.multi_turn:
+            fused = self.memory_manager.fuse_memory_for_messages(user_query, professional_memory=professional_memory)
+            return {"system_prompt": fused.system_prompt, "user_prompt": fused.user_prompt, "history": fused.history}
+
+        fused_prompt = self.memory_manager.fuse_memory_for_prompt(user_query, professional_memory=professional_memory)
+        return {"system_prompt": self.role.system_prompt, "user_prompt": fused_prompt}
 
     def process_query(self, user_query: str) -> str:
         """
@@ -27,21 +53,18 @@ class RolePlayingAgent:
         
         :param user_query: 用户的输入文本。
         :return: 智能体的响应文本。
+        :raises LLMConnectorError: LLM 调用失败时抛出，此时不写入智能体响应。
         """
         # 1. 记录用户输入到对话记忆
         self.memory_manager.add_dialogue("user", user_query)
         
         # 2. 记忆融合：生成包含所有上下文的最终 Prompt
-        fused_prompt = self.memory_manager.fuse_memory_for_prompt(user_query)
+        # 默认模式下 fused_prompt 作为 user_prompt 传递，其中已包含 system_prompt 的内容；
+        # 多轮消息模式下则拆分为 system 前缀、历史轮次和末尾的易变上下文。
+        request = self._build_llm_request(user_query)
         
         # 3. 调用 LLM 生成响应
-        # 注意：这里将 fused_prompt 作为 user_prompt 传递给 LLM，
-        # 因为 fused_prompt 已经包含了 system_prompt 的内容（角色身份和指令）。
-        # 实际生产中，可以根据 LLM API 的要求调整传递方式。
-        response = self.llm_connector.generate_response(
-            system_prompt=self.role.system_prompt, # 也可以将 system_prompt 单独传递
-            user_prompt=fused_prompt
-        )
+        response = self.llm_connector.generate_response(**request)
         
         # 4. 记录智能体响应到对话记忆
         self.memory_manager.add_dialogue("assistant", response)
@@ -50,5 +73,172 @@ class RolePlayingAgent:
         
         return response
 
-# ----------------------------------------------------------------------
+    def process_query_stream(self, user_query: str) -> Iterator[str]:
+        """
+        以流式方式处理用户查询，逐个产出 LLM 生成的文本片段。
+
+        智能体响应在流结束时写入对话记忆；若调用方提前关闭生成器，
+        则保存已生成的部分内容。
+
+        :param user_query: 用户的输入文本。
+        :return: 响应文本片段的迭代器。
+        """
+        self.memory_manager.add_dialogue("user", user_query)
+        request = self._build_llm_request(user_query)
+
+        chunks = []
+        try:
+            for chunk in self.llm_connector.stream_response(**request):
+                chunks.append(chunk)
+                yield chunk
+        except GeneratorExit:
+            if chunks:
+                self.memory_manager.add_dialogue("assistant", "".join(chunks))
+            raise
 
+        self.memory_manager.add_dialogue("assistant", "".join(chunks))
+
+    async def aprocess_query(self, user_query: str, professional_memory: Optional[ProfessionalMemory] = None) -> str:
+        """
+        process_query 的异步版本。
+
+        用户消息的写入与专业记忆检索相互独立，二者并发执行；LLM 调用使用异步接口。
+        同一智能体上的并发调用按到达顺序串行处理，以保证对话历史的顺序一致。
+
+        :param user_query: 用户的输入文本。
+        :param professional_memory: 已检索好的专业记忆（如批量检索的结果）；为 None 时在此检索。
+        :return: 智能体的响应文本。
+        """
+        async with self._query_locks.get():
+            # 1-2. 记录用户输入 与 专业记忆检索 并发执行
+            if professional_memory is None:
+                _, professional_memory = await asyncio.gather(
+                    self.memory_manager.aadd_dialogue("user", user_query),
+                    self.memory_manager.aretrieve_professional_memory(user_query)
+                )
+            else:
+                await self.memory_manager.aadd_dialogue("user", user_query)
+
+            # 3. 记忆融合（复用已检索的专业记忆）
+            request = self._build_llm_request(user_query, professional_memory=professional_memory)
+
+            # 4. 异步调用 LLM
+            response = await self.llm_connector.agenerate_response(**request)
+
+            # 5. 记录智能体响应
+            await self.memory_manager.aadd_dialogue("assistant", response)
+
+        return response
+
+    async def aprocess_query_stream(self, user_query: str) -> AsyncIterator[str]:
+        """
+        process_query_stream 的异步版本。
+
+        智能体响应在流结束时写入对话记忆；若流被取消或提前关闭，则保存已生成的部分内容。
+        与 aprocess_query 相同，查询锁在整个流式过程中持有，同一智能体上的并发查询按到达顺序
+        完整地写入"用户消息 - 智能体响应"。提前停止迭代时应关闭生成器（aclose()，
+        或使用 contextlib.aclosing），以便立即释放锁；未关闭的生成器在被回收时由 asyncio 关闭。
+
+        :param user_query: 用户的输入文本。
+        :return: 响应文本片段的异步迭代器。
+        """
+        async with self._query_locks.get():
+            _, professional_memory = await asyncio.gather(
+                self.memory_manager.aadd_dialogue("user", user_query),
+                self.memory_manager.aretrieve_professional_memory(user_query)
+            )
+            request = self._build_llm_request(user_query, professional_memory=professional_memory)
+
+            chunks = []
+            try:
+                async for chunk in self.llm_connector.astream_response(**request):
+                    chunks.append(chunk)
+                    yield chunk
+            except (asyncio.CancelledError, GeneratorExit):
+                # 保存已生成的部分；放在独立任务中并 shield，再次取消时写入仍会完成
+                if chunks:
+                    await asyncio.shield(asyncio.ensure_future(
+                        self.memory_manager.aadd_dialogue("assistant", "".join(chunks))
+                    ))
+                raise
+
+            await self.memory_manager.aadd_dialogue("assistant", "".join(chunks))
+
+    @staticmethod
+    def process_batch(requests: List[Tuple["RolePlayingAgent", str]], max_concurrency: int = 8,
+                      return_exceptions: bool = False) -> List[Union[str, BaseException]]:
+        """
+        同步批量处理接口（如离线评测、批量重新生成），在新的事件循环中执行 aprocess_batch。
+        连接器与智能体的异步状态（客户端、锁、信号量）按事件循环创建，同一批智能体可重复调用。
+        """
+        return asyncio.run(RolePlayingAgent.aprocess_batch(requests, max_concurrency, return_exceptions))
+
+    @staticmethod
+    async def aprocess_batch(requests: List[Tuple["RolePlayingAgent", str]], max_concurrency: int = 8,
+                             return_exceptions: bool = False) -> List[Union[str, BaseException]]:
+        """
+        批量处理多个用户/角色的查询。
+
+        1. 按 (RAG 系统, knowledge_path, top_k) 分组，每组以一次 retrieve_many 完成批量嵌入和向量查询；
+        2. 各智能体的 LLM 调用并发执行（同时在途不超过 max_concurrency），
+           同一智能体的多条查询按输入顺序依次处理，保证对话历史顺序一致。
+
+        :param requests: (智能体, 查询) 列表。
+        :param max_concurrency: 同时在途的 LLM 调用数上限。
+        :param return_exceptions: 为 True 时单条失败以异常对象形式返回，不影响其余查询
+            （某组批量检索失败时，该组的每条查询都返回该异常，不再调用 LLM）；否则第一个异常会被抛出。
+        :return: 与 requests 一一对应的响应文本。
+        """
+        # 1. 分组批量检索（经过各智能体的检索门控与结果筛选）
+        groups: Dict[Tuple[int, str, int], List[int]] = {}
+        for i, (agent, user_query) in enumerate(requests):
+            manager = agent.memory_manager
+            knowledge_path = agent.role.professional_knowledge_path
+            if knowledge_path and manager.gate_retrieval(user_query):
+                groups.setdefault((id(manager.rag_system), knowledge_path, manager.retrieval_top_k), []).append(i)
+
+        memories: List[ProfessionalMemory] = [ProfessionalMemory() for _ in requests]
+        retrieval_errors: Dict[int, BaseException] = {}
+
+        async def retrieve_group(indices: List[int]):
+            manager = requests[indices[0]][0].memory_manager
+            try:
+                retrieved = await manager.rag_system.aretrieve_many(
+                    [requests[i][1] for i in indices], manager.role.professional_knowledge_path, manager.retrieval_top_k
+                )
+            except Exception as e:
+                if not return_exceptions:
+                    raise
+                for i in indices:
+                    retrieval_errors[i] = e
+                return
+            for i, memory in zip(indices, retrieved):
+                memories[i] = requests[i][0].memory_manager.filter_professional_memory(memory)
+
+        await asyncio.gather(*(retrieve_group(indices) for indices in groups.values()))
+
+        # 2. 并发生成：不同智能体并行，同一智能体内按顺序
+        semaphore = asyncio.Semaphore(max_concurrency)
+        results: List[Union[str, BaseException, None]] = [None] * len(requests)
+        by_agent: Dict[int, List[int]] = {}
+        for i, (agent, _) in enumerate(requests):
+            by_agent.setdefault(id(agent), []).append(i)
+
+        async def run_agent(indices: List[int]):
+            for i in indices:
+                if i in retrieval_errors:
+                    results[i] = retrieval_errors[i]
+                    continue
+                agent, user_query = requests[i]
+                async with semaphore:
+                    try:
+                        results[i] = await agent.aprocess_query(user_query, professional_memory=memories[i])
+                    except Exception as e:
+                        if not return_exceptions:
+                            raise
+                        results[i] = e
+
+        await asyncio.gather(*(run_agent(indices) for indices in by_agent.values()))
+        return results
+
+# ----------------------------------------------------------------------
@@ -0,0 +1,227 @@
+import os
+import json
+import time
+import hashlib
+import sqlite3
+import threading
+import contextvars
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional, Tuple
+from llm.connector import LLMConnector
+
+class ResponseCacheBackend(ABC):
+    """
+    LLM 响应缓存后端抽象。键为请求内容的哈希，值为完整的响应文本。
+    """
+    @abstractmethod
+    def get(self, key: str) -> Optional[str]:
+        """查询缓存；未命中或已过期返回 None。"""
+        pass
+
+    @abstractmethod
+    def put(self, key: str, response: str):
+        """写入缓存。"""
+        pass
+
+    @abstractmethod
+    def clear(self):
+        """清空缓存。"""
+        pass
+
+class InMemoryResponseCache(ResponseCacheBackend):
+    """
+    进程内 LRU 响应缓存，容量受限并带可选 TTL（秒）。线程安全。
+    """
+    def __init__(self, max_size: int = 1024, ttl: Optional[float] = None):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[str, Tuple[float, str]]" = OrderedDict()
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            stored_at, response = entry
+            if self.ttl is not None and time.time() - stored_at >= self.ttl:
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return response
+
+    def put(self, key: str, response: str):
+        with self._lock:
+            self._entries[key] = (time.time(), response)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+class SQLiteResponseCache(ResponseCacheBackend):
+    """
+    SQLite 磁盘响应缓存，进程重启后仍可命中（如回归测试的重复运行），带可选 TTL（秒）。
+    """
+    def __init__(self, db_path: str = "data/llm_cache/responses.db", ttl: Optional[float] = None):
+        self.db_path = db_path
+        self.ttl = ttl
+        self._lock = threading.Lock()
+
+        db_dir = os.path.dirname(db_path)
+        if db_dir:
+            os.makedirs(db_dir, exist_ok=True)
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            "key TEXT PRIMARY KEY, response TEXT NOT NULL, created_at REAL NOT NULL)"
+        )
+        self._conn.commit()
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT response, created_at FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            response, created_at = row
+            if self.ttl is not None and time.time() - created_at >= self.ttl:
+                with self._conn:
+                    self._conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                return None
+            return response
+
+    def put(self, key: str, response: str):
+        with self._lock:
+            with self._conn:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO responses (key, response, created_at) VALUES (?, ?, ?)",
+                    (key, response, time.time())
+                )
+
+    def clear(self):
+        with self._lock:
+            with self._conn:
+                self._conn.execute("DELETE FROM responses")
+
+# 当前上下文的缓存旁路设置：(跳过读取, 跳过写入)
+_BYPASS: contextvars.ContextVar[Tuple[bool, bool]] = contextvars.ContextVar("llm_cache_bypass", default=(False, False))
+
+class CachedLLMConnector(LLMConnector):
+    """
+    精确匹配的 LLM 响应缓存，可包装任意 LLMConnector（如 OpenAIConnector、MockLLMConnector）。
+
+    键为 (model_name, system_prompt, user_prompt, history, 采样参数) 的 SHA-256 哈希，
+    只有完全相同的请求才会命中。调用失败（抛出异常）的请求不会被缓存；流式响应在完整
+    生成后才写入缓存，命中时一次性产出完整响应。
+    """
+    def __init__(self, connector: LLMConnector, backend: Optional[ResponseCacheBackend] = None,
+                 enabled: bool = True):
+        """
+        :param connector: 被包装的 LLMConnector。
+        :param backend: 缓存后端，默认为 InMemoryResponseCache()。
+        :param enabled: 为 False 时完全绕过缓存（不读也不写）。
+        """
+        super().__init__(connector.model_name, connector.api_key)
+        self.connector = connector
+        self.backend = backend if backend is not None else InMemoryResponseCache()
+        self.enabled = enabled
+        self.hits = 0
+        self.misses = 0
+
+    @contextmanager
+    def bypass(self, refresh: bool = False):
+        """
+        在该上下文内（含其中的异步任务）绕过缓存读取。
+        refresh=True 时仍将新的响应写入缓存，用于强制刷新条目。
+        """
+        token = _BYPASS.set((True, not refresh))
+        try:
+            yield
+        finally:
+            _BYPASS.reset(token)
+
+    def sampling_params(self) -> Dict[str, Any]:
+        return self.connector.sampling_params()
+
+    def cache_key(self, system_prompt: str, user_prompt: str, history: List[Dict[str, str]] = None) -> str:
+        payload = json.dumps(
+            [self.connector.model_name, system_prompt, user_prompt, history or [], self.connector.sampling_params()],
+            ensure_ascii=False, sort_keys=True
+        )
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def _lookup(self, key: str) -> Optional[str]:
+        if not self.enabled or _BYPASS.get()[0]:
+            return None
+        response = self.backend.get(key)
+        if response is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return response
+
+    def _store(self, key: str, response: str):
+        if self.enabled and not _BYPASS.get()[1]:
+            self.backend.put(key, response)
+
+    def generate_response(self, system_prompt: str, user_prompt: str, history: List[Dict[str, str]] = None) -> str:
+        key = self.cache_key(system_prompt, user_prompt, history)
+        cached = self._lookup(key)
+        if cached is not None:
+            return cached
+
+        response = self.connector.generate_response(system_prompt, user_prompt, history)
+        self._store(key, response)
+        return response
+
+    async def agenerate_response(self, system_prompt: str, user_prompt: str, history: List[Dict[str, str]] = None) -> str:
+        key = self.cache_key(system_prompt, user_prompt, history)
+        cached = self._lookup(key)
+        if cached is not None:
+            return cached
+
+        response = await self.connector.agenerate_response(system_prompt, user_prompt, history)
+        self._store(key, response)
+        return response
+
+    def stream_response(self, system_prompt: str, user_prompt: str, history: List[Dict[str, str]] = None) -> Iterator[str]:
+        key = self.cache_key(system_prompt, user_prompt, history)
+        cached = self._lookup(key)
+        if cached is not None:
+            yield cached
+            return
+
+        # 仅缓存完整生成的响应；调用方提前关闭时不写入
+        chunks = []
+        for chunk in self.connector.stream_response(system_prompt, user_prompt, history):
+            chunks.append(chunk)
+            yield chunk
+        self._store(key, "".join(chunks))
+
+    async def astream_response(self, system_prompt: str, user_prompt: str, history: List[Dict[str, str]] = None) -> AsyncIterator[str]:
+        key = self.cache_key(system_prompt, user_prompt, history)
+        cached = self._lookup(key)
+        if cached is not None:
+            yield cached
+            return
+
+        chunks = []
+        async for chunk in self.connector.astream_response(system_prompt, user_prompt, history):
+            chunks.append(chunk)
+            yield chunk
+        self._store(key, "".join(chunks))
+
+    def stats(self) -> Dict[str, float]:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
@@ -1,7 +1,122 @@
 from abc import ABC, abstractmethod
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Iterator, AsyncIterator, Callable, Optional, Tuple
 import os
-from openai import OpenAI
+import time
+import random
+import asyncio
+import threading
+
+class LLMConnectorError(RuntimeError):
+    """
+    LLM 调用失败（不可重试的错误，或重试次数耗尽）。
+    调用方应显式处理该异常，而不是把错误文本当作智能体的回答写入对话记忆。
+    """
+    def __init__(self, message: str, status_code: Optional[int] = None, retryable: bool = False):
+        super().__init__(message)
+        self.status_code = status_code
+        self.retryable = retryable
+
+class TokenBucket:
+    """
+    令牌桶限速器：平均每秒 rate 个请求，允许 capacity 个请求的突发。线程安全。
+    获取令牌时先预留再等待，并发的调用方按到达顺序排队。
+    """
+    def __init__(self, rate: float, capacity: Optional[float] = None):
+        if rate <= 0:
+            raise ValueError("rate 必须为正数")
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(rate, 1.0)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _reserve(self) -> float:
+        """预留一个令牌，返回需要等待的秒数。"""
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self._tokens -= 1
+            return -self._tokens / self.rate if self._tokens < 0 else 0.0
+
+    def acquire(self):
+        wait = self._reserve()
+        if wait > 0:
+            time.sleep(wait)
+
+    async def aacquire(self):
+        wait = self._reserve()
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+class LoopLocal:
+    """
+    按事件循环隔离的惰性对象（异步客户端、asyncio.Lock 等）。
+
+    这类对象绑定到首次使用它们的事件循环，跨循环复用会失败（如多次调用 asyncio.run）。
+    get() 在当前运行的事件循环中首次调用时由 factory 创建，之后在该循环内复用；
+    已关闭的事件循环对应的对象在下次创建时被丢弃。
+    """
+    def __init__(self, factory: Callable[[], Any]):
+        self._factory = factory
+        self._values: Dict[asyncio.AbstractEventLoop, Any] = {}
+        self._lock = threading.Lock()
+
+    def get(self) -> Any:
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            value = self._values.get(loop)
+            if value is None:
+                for closed in [other for other in self._values if other.is_closed()]:
+                    del self._values[closed]
+                value = self._values[loop] = self._factory()
+            return value
+
+# 进程内共享的 HTTP 连接池，按 (最大连接数, 超时) 区分
+_SHARED_HTTP_CLIENTS: Dict[Tuple[int, float], Any] = {}
+_SHARED_HTTP_CLIENTS_LOCK = threading.Lock()
+
+def get_shared_http_client(max_connections: int = 100, timeout: float = 60.0):
+    """
+    获取进程内共享的同步 HTTP 客户端（带连接池与 keep-alive），供所有 OpenAIConnector 复用。
+    """
+    key = (max_connections, timeout)
+    with _SHARED_HTTP_CLIENTS_LOCK:
+        client = _SHARED_HTTP_CLIENTS.get(key)
+        if client is None:
+            import httpx
+            from openai import DefaultHttpxClient
+            client = DefaultHttpxClient(
+                limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections),
+                timeout=timeout
+            )
+            _SHARED_HTTP_CLIENTS[key] = client
+        return client
+
+# 进程内共享的异步 HTTP 连接池，按 (最大连接数, 超时) 区分，并按事件循环分别创建
+_SHARED_ASYNC_HTTP_CLIENTS: Dict[Tuple[int, float], LoopLocal] = {}
+
+def get_shared_async_http_client(max_connections: int = 100, timeout: float = 60.0):
+    """
+    获取当前事件循环中共享的异步 HTTP 客户端，供所有 OpenAIConnector 的异步调用复用。
+    异步连接绑定事件循环，每个事件循环各有一个连接池。需在运行中的事件循环内调用。
+    """
+    key = (max_connections, timeout)
+    with _SHARED_HTTP_CLIENTS_LOCK:
+        clients = _SHARED_ASYNC_HTTP_CLIENTS.get(key)
+        if clients is None:
+            clients = _SHARED_ASYNC_HTTP_CLIENTS[key] = LoopLocal(
+                lambda: _create_async_http_client(max_connections, timeout)
+            )
+    return clients.get()
+
+def _create_async_http_client(max_connections: int, timeout: float):
+    import httpx
+    from openai import DefaultAsyncHttpxClient
+    return DefaultAsyncHttpxClient(
+        limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections),
+        timeout=timeout
+    )
 
 class LLMConnector(ABC):
     """
@@ -11,6 +126,10 @@ class LLMConnector(ABC):
         self.model_name = model_name
         self.api_key = api_key
 
+    def sampling_params(self) -> Dict[str, Any]:
+        """影响生成结果的采样参数（如 temperature），用于响应缓存的键。"""
+        return {}
+
     @abstractmethod
     def generate_response(self, system_prompt: str, user_prompt: str, history: List[Dict[str, str]] = None) -> str:
         """
@@ -23,11 +142,52 @@ class LLMConnector(ABC):
         """
         pass
 
+    async def agenerate_response(self, system_prompt: str, user_prompt: str, history: List[Dict[str, str]] = None) -> str:
+        """
+        generate_response 的异步版本。
+        默认实现在线程池中执行同步调用；具备原生异步客户端的实现应覆盖此方法。
+        """
+        return await asyncio.to_thread(self.generate_response, system_prompt, user_prompt, history)
+
+    def stream_response(self, system_prompt: str, user_prompt: str, history: List[Dict[str, str]] = None) -> Iterator[str]:
+        """
+        以流式方式生成响应，逐个产出文本片段（token）。
+        默认实现一次性产出完整响应；支持流式输出的实现应覆盖此方法。
+        """
+        yield self.generate_response(system_prompt, user_prompt, history)
+
+    async def astream_response(self, system_prompt: str, user_prompt: str, history: List[Dict[str, str]] = None) -> AsyncIterator[str]:
+        """
+        stream_response 的异步版本。默认实现一次性产出 agenerate_response 的完整响应。
+        """
+        yield await self.agenerate_response(system_prompt, user_prompt, history)
+
 class OpenAIConnector(LLMConnector):
     """
     基于 OpenAI API 的 LLM 连接器实现。
+
+    同步与异步请求分别复用进程内共享的 HTTP 连接池（异步连接池按事件循环创建）；可配置请求超时、
+    并发上限（max_concurrency）与令牌桶限速（requests_per_second / burst）。429、5xx、超时和
+    连接错误按带抖动的指数退避重试，重试耗尽或不可重试的错误以 LLMConnectorError 抛出。
+    异步客户端与异步并发信号量在每个事件循环中首次使用时创建，同一连接器可跨多次 asyncio.run 使用。
     """
-    def __init__(self, model_name: str = "gpt-4o-mini", api_key: str = None, base_url: str = None):
+    def __init__(self, model_name: str = "gpt-4o-mini", api_key: str = None, base_url: str = None,
+                 timeout: float = 60.0, max_retries: int = 3,
+                 backoff_base: float = 0.5, backoff_max: float = 8.0,
+                 max_concurrency: Optional[int] = None,
+                 requests_per_second: Optional[float] = None, burst: Optional[float] = None,
+                 max_connections: int = 100, temperature: float = 0.7):
+        """
+        :param timeout: 单次请求超时（秒）。
+        :param max_retries: 可重试错误的最大重试次数。
+        :param backoff_base: 退避基数（秒），第 n 次重试前等待 [0, min(backoff_max, backoff_base * 2^n)] 内的随机时长；
+            响应带 Retry-After 时优先采用（不超过 backoff_max）。
+        :param max_concurrency: 该连接器同时在途的请求数上限（同步调用与每个事件循环分别计数），None 表示不限制。
+        :param requests_per_second: 令牌桶限速（请求/秒），None 表示不限速。
+        :param burst: 令牌桶容量（允许的突发请求数），默认等于 requests_per_second。
+        :param max_connections: 共享连接池的最大连接数。
+        :param temperature: 采样温度。
+        """
         # 优先使用传入的 api_key，否则尝试从环境变量获取
         key = api_key if api_key else os.environ.get("OPENAI_API_KEY")
         if not key:
@@ -38,45 +198,232 @@ class OpenAIConnector(LLMConnector):
         
         # 优先使用传入的 base_url，否则尝试从环境变量获取，最后使用 OpenAI 默认值
         self.base_url = base_url if base_url else os.environ.get("OPENAI_BASE_URL")
+        self.temperature = temperature
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.rate_limiter = TokenBucket(requests_per_second, burst) if requests_per_second else None
+        self._semaphore = threading.BoundedSemaphore(max_concurrency) if max_concurrency else None
+        self._async_semaphores = LoopLocal(lambda: asyncio.Semaphore(max_concurrency)) if max_concurrency else None
         
-        # 初始化 OpenAI 客户端
+        # openai 仅在使用该连接器时才导入
+        from openai import OpenAI
+
+        # 初始化 OpenAI 客户端（重试由本类统一处理，SDK 内置重试关闭）
         # 注意：在沙箱环境中，如果 base_url 为 None，OpenAI() 会使用沙箱预配置的代理。
         # 如果提供了 base_url，则使用提供的 base_url。
         self.client = OpenAI(
             api_key=self.api_key,
-            base_url=self.base_url
+            base_url=self.base_url,
+            timeout=timeout,
+            max_retries=0,
+            http_client=get_shared_http_client(max_connections, timeout)
+        )
+        self._timeout = timeout
+        self._max_connections = max_connections
+        # 异步客户端绑定事件循环，在每个事件循环中首次使用时创建
+        self._async_clients = LoopLocal(self._create_async_client)
+
+    def _create_async_client(self):
+        from openai import AsyncOpenAI
+
+        return AsyncOpenAI(
+            api_key=self.api_key,
+            base_url=self.base_url,
+            timeout=self._timeout,
+            max_retries=0,
+            http_client=get_shared_async_http_client(self._max_connections, self._timeout)
         )
 
+    def _async_semaphore(self) -> Optional[asyncio.Semaphore]:
+        """当前事件循环的并发信号量；未设置 max_concurrency 时为 None。"""
+        return self._async_semaphores.get() if self._async_semaphores is not None else None
+
+    @property
+    def async_client(self):
+        """当前事件循环的异步客户端，供 agenerate_response 在事件循环中并发调用。"""
+        return self._async_clients.get()
+
+    def sampling_params(self) -> Dict[str, Any]:
+        return {"temperature": self.temperature}
+
+    def _build_messages(self, system_prompt: str, user_prompt: str, history: List[Dict[str, str]] = None) -> List[Dict[str, str]]:
+        """构造消息列表：system + 历史对话 + 当前 user 消息。"""
+        messages = [{"role": "system", "content": system_prompt}]
+        if history:
+            messages.extend(history)
+        messages.append({"role": "user", "content": user_prompt})
+        return messages
+
+    def _wrap_error(self, e: Exception) -> LLMConnectorError:
+        """将 SDK 异常转换为 LLMConnectorError，并标记是否可重试（429、5xx、超时、连接错误）。"""
+        import openai
+
+        if isinstance(e, LLMConnectorError):
+            return e
+        if isinstance(e, openai.APIStatusError):
+            retryable = e.status_code in (408, 429) or e.status_code >= 500
+            return LLMConnectorError(f"LLM 服务返回错误 {e.status_code}: {e}", status_code=e.status_code, retryable=retryable)
+        if isinstance(e, openai.APIConnectionError):
+            return LLMConnectorError(f"LLM 服务连接失败: {e}", retryable=True)
+        return LLMConnectorError(f"LLM 调用失败: {type(e).__name__}: {e}")
+
+    def _backoff_delay(self, attempt: int, e: Exception) -> float:
+        """第 attempt 次重试前的等待时长：优先采用 Retry-After，否则为全抖动指数退避。"""
+        response = getattr(e, "response", None)
+        retry_after = response.headers.get("retry-after") if response is not None else None
+        if retry_after:
+            try:
+                return min(max(float(retry_after), 0.0), self.backoff_max)
+            except ValueError:
+                pass
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+
+    def _request(self, call: Callable[[], Any], hold_slot: bool = False) -> Any:
+        """
+        执行请求：限速、并发上限与重试。
+        hold_slot=True 时成功返回后继续占用并发槽位（流式响应），由调用方在流结束后释放。
+        """
+        attempt = 0
+        while True:
+            if self.rate_limiter is not None:
+                self.rate_limiter.acquire()
+            if self._semaphore is not None:
+                self._semaphore.acquire()
+            try:
+                result = call()
+            except Exception as e:
+                if self._semaphore is not None:
+                    self._semaphore.release()
+                error = self._wrap_error(e)
+                if not error.retryable or attempt >= self.max_retries:
+                    print(f"OpenAI API Call Error: {error}")
+                    raise error from e
+                delay = self._backoff_delay(attempt, e)
+                print(f"OpenAI API 调用失败，{delay:.2f} 秒后进行第 {attempt + 1} 次重试: {error}")
+                time.sleep(delay)
+                attempt += 1
+                continue
+            if not hold_slot and self._semaphore is not None:
+                self._semaphore.release()
+            return result
+
+    async def _arequest(self, call: Callable[[], Any], hold_slot: bool = False) -> Any:
+        """_request 的异步版本，call 返回 awaitable。"""
+        semaphore = self._async_semaphore()
+        attempt = 0
+        while True:
+            if self.rate_limiter is not None:
+                await self.rate_limiter.aacquire()
+            if semaphore is not None:
+                await semaphore.acquire()
+            try:
+                result = await call()
+            except BaseException as e:
+                if semaphore is not None:
+                    semaphore.release()
+                if not isinstance(e, Exception):
+                    raise
+                error = self._wrap_error(e)
+                if not error.retryable or attempt >= self.max_retries:
+                    print(f"OpenAI API Call Error: {error}")
+                    raise error from e
+                delay = self._backoff_delay(attempt, e)
+                print(f"OpenAI API 调用失败，{delay:.2f} 秒后进行第 {attempt + 1} 次重试: {error}")
+                await asyncio.sleep(delay)
+                attempt += 1
+                continue
+            if not hold_slot and semaphore is not None:
+                semaphore.release()
+            return result
+
     def generate_response(self, system_prompt: str, user_prompt: str, history: List[Dict[str, str]] = None) -> str:
         
         # 构造消息列表
-        messages = [
-            {"role": "system", "content": system_prompt},
-            {"role": "user", "content": user_prompt}
-        ]
+        messages = self._build_messages(system_prompt, user_prompt, history)
+
+        print(f"--- OpenAI LLM Call (Model: {self.model_name}, Base URL: {self.base_url or 'Default'}) ---")
+
+        response = self._request(lambda: self.client.chat.completions.create(
+            model=self.model_name,
+            messages=messages,
+            temperature=self.temperature,
+        ))
 
+        return response.choices[0].message.content
+
+    async def agenerate_response(self, system_prompt: str, user_prompt: str, history: List[Dict[str, str]] = None) -> str:
+        messages = self._build_messages(system_prompt, user_prompt, history)
+
+        print(f"--- OpenAI Async LLM Call (Model: {self.model_name}, Base URL: {self.base_url or 'Default'}) ---")
+
+        response = await self._arequest(lambda: self.async_client.chat.completions.create(
+            model=self.model_name,
+            messages=messages,
+            temperature=self.temperature,
+        ))
+
+        return response.choices[0].message.content
+
+    def stream_response(self, system_prompt: str, user_prompt: str, history: List[Dict[str, str]] = None) -> Iterator[str]:
+        """流式响应。仅在建立流之前重试；流中途断开时抛出 LLMConnectorError。"""
+        messages = self._build_messages(system_prompt, user_prompt, history)
+
+        print(f"--- OpenAI Streaming LLM Call (Model: {self.model_name}, Base URL: {self.base_url or 'Default'}) ---")
+
+        stream = self._request(lambda: self.client.chat.completions.create(
+            model=self.model_name,
+            messages=messages,
+            temperature=self.temperature,
+            stream=True,
+        ), hold_slot=True)
         try:
-            print(f"--- OpenAI LLM Call (Model: {self.model_name}, Base URL: {self.base_url or 'Default'}) ---")
-            
-            response = self.client.chat.completions.create(
-                model=self.model_name,
-                messages=messages,
-                temperature=0.7,
-            )
-            
-            return response.choices[0].message.content
-            
+            with stream:
+                for chunk in stream:
+                    if chunk.choices and chunk.choices[0].delta.content:
+                        yield chunk.choices[0].delta.content
+        except GeneratorExit:
+            raise
         except Exception as e:
-            print(f"OpenAI API Call Error: {e}")
-            return f"抱歉，LLM 服务调用失败。错误信息: {e}"
+            raise self._wrap_error(e) from e
+        finally:
+            if self._semaphore is not None:
+                self._semaphore.release()
+
+    async def astream_response(self, system_prompt: str, user_prompt: str, history: List[Dict[str, str]] = None) -> AsyncIterator[str]:
+        messages = self._build_messages(system_prompt, user_prompt, history)
+
+        print(f"--- OpenAI Async Streaming LLM Call (Model: {self.model_name}, Base URL: {self.base_url or 'Default'}) ---")
+
+        semaphore = self._async_semaphore()
+        stream = await self._arequest(lambda: self.async_client.chat.completions.create(
+            model=self.model_name,
+            messages=messages,
+            temperature=self.temperature,
+            stream=True,
+        ), hold_slot=True)
+        try:
+            async with stream:
+                async for chunk in stream:
+                    if chunk.choices and chunk.choices[0].delta.content:
+                        yield chunk.choices[0].delta.content
+        except (asyncio.CancelledError, GeneratorExit):
+            raise
+        except Exception as e:
+            raise self._wrap_error(e) from e
+        finally:
+            if semaphore is not None:
+                semaphore.release()
 
 
 class MockLLMConnector(LLMConnector):
     """
     模拟 LLM 连接器，用于测试和演示。
+    流式接口按字符逐个产出响应，token_delay 可模拟每个 token 的生成耗时（秒）。
     """
-    def __init__(self, model_name: str = "mock-gpt-4"):
+    def __init__(self, model_name: str = "mock-gpt-4", token_delay: float = 0.0):
         super().__init__(model_name)
+        self.token_delay = token_delay
 
     def generate_response(self, system_prompt: str, user_prompt: str, history: List[Dict[str, str]] = None) -> str:
         print(f"--- Mock LLM Call ---")
@@ -92,3 +439,15 @@ class MockLLMConnector(LLMConnector):
             return "我记得您上次提到您喜欢清淡的食物。在为您提供建议时，我会充分考虑您的这一偏好。"
         else:
             return f"您好，我是{self.model_name}模拟的角色扮演智能体。我已接收到您的请求：'{user_prompt}'。我正在努力融合我的专业记忆、对话记忆和激活记忆来为您提供最个性化的回答。"
+
+    def stream_response(self, system_prompt: str, user_prompt: str, history: List[Dict[str, str]] = None) -> Iterator[str]:
+        for token in self.generate_response(system_prompt, user_prompt, history):
+            if self.token_delay:
+                time.sleep(self.token_delay)
+            yield token
+
+    async def astream_response(self, system_prompt: str, user_prompt: str, history: List[Dict[str, str]] = None) -> AsyncIterator[str]:
+        for token in self.generate_response(system_prompt, user_prompt, history):
+            if self.token_delay:
+                await asyncio.sleep(self.token_delay)
+            yield token
@@ -0,0 +1,283 @@
+import sys
+import json
+import time
+import asyncio
+import argparse
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Deque, Dict, List, Optional
+
+from llm.connector import LLMConnectorError, OpenAIConnector
+
+class StubOpenAIServer:
+    """
+    本地模拟的 OpenAI 兼容服务（/v1/chat/completions），用于在无网络环境下检查 OpenAIConnector。
+
+    script 中预置的状态码按请求顺序依次返回（如 [429, 503] 表示前两次请求失败），之后返回 200；
+    delay 为每个请求的处理耗时（秒）。记录请求总数与同时在途请求数的峰值。
+    """
+    def __init__(self, delay: float = 0.0):
+        self.delay = delay
+        self.script: Deque[int] = deque()
+        self.requests = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), self._handler())
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    @property
+    def base_url(self) -> str:
+        return f"http://127.0.0.1:{self._server.server_port}/v1"
+
+    def reset(self, script: Optional[List[int]] = None, delay: Optional[float] = None):
+        with self._lock:
+            self.script = deque(script or [])
+            self.requests = 0
+            self.max_in_flight = 0
+            if delay is not None:
+                self.delay = delay
+
+    def __enter__(self) -> "StubOpenAIServer":
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def _next_status(self) -> int:
+        with self._lock:
+            self.requests += 1
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+            return self.script.popleft() if self.script else 200
+
+    def _handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                self.rfile.read(int(self.headers.get("content-length", 0)))
+                status = stub._next_status()
+                try:
+                    if stub.delay:
+                        time.sleep(stub.delay)
+                    if status == 200:
+                        body = {
+                            "id": "chatcmpl-stub", "object": "chat.completion", "created": 0, "model": "stub",
+                            "choices": [{"index": 0, "finish_reason": "stop",
+                                         "message": {"role": "assistant", "content": "ok"}}],
+                        }
+                    else:
+                        body = {"error": {"message": f"stub error {status}", "type": "stub", "code": status}}
+                    data = json.dumps(body).encode("utf-8")
+                    self.send_response(status)
+                    self.send_header("content-type", "application/json")
+                    self.send_header("content-length", str(len(data)))
+                    if status == 429:
+                        self.send_header("retry-after", "0")
+                    self.end_headers()
+                    self.wfile.write(data)
+                finally:
+                    with stub._lock:
+                        stub.in_flight -= 1
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+def _connector(server: StubOpenAIServer, **kwargs) -> OpenAIConnector:
+    kwargs.setdefault("backoff_base", 0.01)
+    kwargs.setdefault("backoff_max", 0.05)
+    return OpenAIConnector(model_name="stub", api_key="stub-key", base_url=server.base_url, **kwargs)
+
+def check_retries(server: StubOpenAIServer) -> Dict[str, Any]:
+    """429 / 5xx 按退避重试后成功；不可重试的 400 立即失败；重试耗尽后抛出 LLMConnectorError。"""
+    connector = _connector(server, max_retries=3)
+    server.reset([429, 503, 500])
+    response = connector.generate_response("system", "user")
+    retried = response == "ok" and server.requests == 4
+
+    server.reset([429, 502])
+    async_response = asyncio.run(connector.agenerate_response("system", "user"))
+    async_retried = async_response == "ok" and server.requests == 3
+
+    server.reset([400])
+    try:
+        connector.generate_response("system", "user")
+        not_retried = False
+    except LLMConnectorError as e:
+        not_retried = e.status_code == 400 and not e.retryable and server.requests == 1
+
+    server.reset([503] * 5)
+    try:
+        connector.generate_response("system", "user")
+        exhausted = False
+    except LLMConnectorError as e:
+        exhausted = e.status_code == 503 and server.requests == 4
+
+    return {"ok": retried and async_retried and not_retried and exhausted,
+            "retried": retried, "async_retried": async_retried,
+            "not_retried_400": not_retried, "exhausted": exhausted}
+
+def check_rate_limit(server: StubOpenAIServer, rate: float = 20.0, requests: int = 11) -> Dict[str, Any]:
+    """令牌桶限速：burst=1 时 requests 个请求至少耗时 (requests - 1) / rate 秒（同步与异步）。"""
+    connector = _connector(server, requests_per_second=rate, burst=1)
+    minimum = (requests - 1) / rate
+
+    server.reset()
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=requests) as executor:
+        list(executor.map(lambda _: connector.generate_response("system", "user"), range(requests)))
+    sync_elapsed = time.perf_counter() - started
+
+    async def burst():
+        await asyncio.gather(*(connector.agenerate_response("system", "user") for _ in range(requests)))
+
+    connector = _connector(server, requests_per_second=rate, burst=1)
+    started = time.perf_counter()
+    asyncio.run(burst())
+    async_elapsed = time.perf_counter() - started
+
+    return {"ok": sync_elapsed >= minimum * 0.95 and async_elapsed >= minimum * 0.95,
+            "min_seconds": round(minimum, 3),
+            "sync_seconds": round(sync_elapsed, 3), "async_seconds": round(async_elapsed, 3)}
+
+def check_concurrency(server: StubOpenAIServer, max_concurrency: int = 2, requests: int = 8) -> Dict[str, Any]:
+    """并发上限：服务端观察到的同时在途请求数不超过 max_concurrency（同步线程与异步协程）。"""
+    connector = _connector(server, max_concurrency=max_concurrency)
+
+    server.reset(delay=0.1)
+    with ThreadPoolExecutor(max_workers=requests) as executor:
+        list(executor.map(lambda _: connector.generate_response("system", "user"), range(requests)))
+    sync_peak = server.max_in_flight
+
+    async def burst():
+        await asyncio.gather(*(connector.agenerate_response("system", "user") for _ in range(requests)))
+
+    server.reset(delay=0.1)
+    asyncio.run(burst())
+    async_peak = server.max_in_flight
+    server.reset(delay=0.0)
+
+    return {"ok": sync_peak == max_concurrency and async_peak == max_concurrency,
+            "max_concurrency": max_concurrency, "sync_peak": sync_peak, "async_peak": async_peak}
+
+def check_event_loops(server: StubOpenAIServer, runs: int = 3) -> Dict[str, Any]:
+    """同一连接器在多个事件循环中使用（多次 asyncio.run），异步客户端与信号量按循环重新创建。"""
+    connector = _connector(server, max_concurrency=1)
+
+    async def burst():
+        return await asyncio.gather(*(connector.agenerate_response("system", "user") for _ in range(3)))
+
+    server.reset()
+    results = [asyncio.run(burst()) for _ in range(runs)]
+    return {"ok": all(result == ["ok"] * 3 for result in results), "runs": runs}
+
+def check_process_batch(server: StubOpenAIServer, rounds: int = 2) -> Dict[str, Any]:
+    """
+    RolePlayingAgent.process_batch 在同一批智能体上重复调用（每次一个新的事件循环），
+    共享一个设置了并发上限的 OpenAIConnector。
+    """
+    import shutil
+    import tempfile
+    from agent import RolePlayingAgent
+    from role import Role
+    from memory.manager import MemoryManager
+    from memory.persistence import FilePersistenceLayer
+
+    connector = _connector(server, max_concurrency=1)
+    role = Role("connector_check", "连接器检查", "你是一个用于连接器检查的角色。")
+    base_path = tempfile.mkdtemp(prefix="connector_check_")
+    try:
+        persistence = FilePersistenceLayer(base_path)
+        agents = [
+            RolePlayingAgent(user_id, role, llm_connector=connector,
+                             memory_manager=MemoryManager(user_id, role, persistence_layer=persistence))
+            for user_id in ("u1", "u2")
+        ]
+        requests = [(agents[0], "第一个问题"), (agents[1], "第二个问题"), (agents[0], "第三个问题")]
+        server.reset()
+        results = [RolePlayingAgent.process_batch(requests, max_concurrency=2) for _ in range(rounds)]
+    finally:
+        shutil.rmtree(base_path, ignore_errors=True)
+    return {"ok": all(result == ["ok"] * len(requests) for result in results),
+            "rounds": rounds, "requests": server.requests}
+
+def check_batch_retrieval_error(server: StubOpenAIServer) -> Dict[str, Any]:
+    """
+    process_batch(return_exceptions=True) 中某组批量检索抛出异常：该组的查询返回该异常，
+    其他检索组与无需检索的查询照常生成。
+    """
+    import shutil
+    import tempfile
+    from agent import RolePlayingAgent
+    from role import Role
+    from memory.manager import MemoryManager
+    from memory.persistence import FilePersistenceLayer, ProfessionalMemoryRAG
+    from memory.types import ProfessionalMemory
+
+    class FailingRAG(ProfessionalMemoryRAG):
+        def retrieve(self, query: str, knowledge_path: str, top_k: int = 3) -> ProfessionalMemory:
+            raise RuntimeError("knowledge base unavailable")
+
+    class EmptyRAG(ProfessionalMemoryRAG):
+        def retrieve(self, query: str, knowledge_path: str, top_k: int = 3) -> ProfessionalMemory:
+            return ProfessionalMemory()
+
+    connector = _connector(server)
+    base_path = tempfile.mkdtemp(prefix="connector_check_")
+    try:
+        persistence = FilePersistenceLayer(base_path)
+
+        def agent(user_id: str, rag_system: ProfessionalMemoryRAG) -> RolePlayingAgent:
+            role = Role(f"role_{user_id}", "连接器检查", "你是一个用于连接器检查的角色。",
+                        professional_knowledge_path=f"kb_{user_id}")
+            manager = MemoryManager(user_id, role, persistence_layer=persistence, rag_system=rag_system)
+            return RolePlayingAgent(user_id, role, llm_connector=connector, memory_manager=manager)
+
+        failing, healthy = agent("u1", FailingRAG()), agent("u2", EmptyRAG())
+        requests = [(failing, "第一个问题"), (healthy, "第二个问题"), (failing, "第三个问题")]
+        server.reset()
+        results = RolePlayingAgent.process_batch(requests, return_exceptions=True)
+    finally:
+        shutil.rmtree(base_path, ignore_errors=True)
+    failed = [isinstance(result, RuntimeError) for result in results]
+    return {"ok": failed == [True, False, True] and results[1] == "ok" and server.requests == 1,
+            "results": [repr(result) for result in results], "requests": server.requests}
+
+CHECKS: Dict[str, Callable[[StubOpenAIServer], Dict[str, Any]]] = {
+    "retries": check_retries,
+    "rate_limit": check_rate_limit,
+    "concurrency": check_concurrency,
+    "event_loops": check_event_loops,
+    "process_batch": check_process_batch,
+    "batch_retrieval_error": check_batch_retrieval_error,
+}
+
+def run_checks(names: Optional[List[str]] = None) -> Dict[str, Dict[str, Any]]:
+    """在本地模拟服务上依次执行各项检查，返回 检查名 -> 结果（含 ok）。"""
+    report: Dict[str, Dict[str, Any]] = {}
+    with StubOpenAIServer() as server:
+        for name in names or list(CHECKS):
+            try:
+                report[name] = CHECKS[name](server)
+            except Exception as e:
+                report[name] = {"ok": False, "error": f"{type(e).__name__}: {e}"}
+    return report
+
+if __name__ == '__main__':
+    # cd src && python -m llm.connector_check
+    parser = argparse.ArgumentParser(description="在本地模拟的 OpenAI 兼容服务上检查 OpenAIConnector 的重试、限速与并发上限")
+    parser.add_argument("--check", action="append", choices=list(CHECKS), help="只执行指定的检查，可重复指定")
+    args = parser.parse_args()
+
+    results = run_checks(args.check)
+    for name, result in results.items():
+        print(f"[{'OK' if result['ok'] else 'FAIL'}] {name}: {result}")
+    sys.exit(0 if all(result["ok"] for result in results.values()) else 1)
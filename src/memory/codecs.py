@@ -0,0 +1,201 @@
+import json
+import time
+import argparse
+from abc import ABC, abstractmethod
+from functools import lru_cache
+from typing import Any, Callable, Dict, List, Optional, Tuple, Union
+
+# 二进制格式的文件头。0xc1 在 msgpack 规范中永不使用，也不是合法的 UTF-8 首字节，
+# 因此不会与 JSON 文本或裸 msgpack 数据混淆
+MSGPACK_MAGIC = b"\xc1RPM1"
+
+class Codec(ABC):
+    """
+    记忆快照的序列化编解码器：在 model_dump(mode='json') 得到的 JSON 兼容对象与文件字节之间转换。
+    text 为 True 的编解码器输出 JSON 文本，可用于 JSONL 对话日志的逐行编码。
+    """
+    name: str = ""
+    extension: str = "json"
+    text: bool = True
+
+    @abstractmethod
+    def encode(self, obj: Any) -> bytes:
+        pass
+
+    @abstractmethod
+    def decode(self, data: bytes) -> Any:
+        pass
+
+class JSONCodec(Codec):
+    """标准库 json。indent=None 时输出紧凑 JSON（无缩进、无多余空格）。"""
+    def __init__(self, indent: Optional[int] = None):
+        self.indent = indent
+        self.name = "json" if indent is None else "json-pretty"
+        self._separators = (",", ":") if indent is None else None
+
+    def encode(self, obj: Any) -> bytes:
+        return json.dumps(obj, ensure_ascii=False, indent=self.indent, separators=self._separators).encode("utf-8")
+
+    def decode(self, data: bytes) -> Any:
+        return json.loads(data)
+
+class OrjsonCodec(Codec):
+    """orjson（可选依赖）：输出紧凑 JSON，编解码速度约为标准库的数倍。"""
+    name = "orjson"
+
+    def __init__(self):
+        import orjson
+        self._orjson = orjson
+
+    def encode(self, obj: Any) -> bytes:
+        return self._orjson.dumps(obj)
+
+    def decode(self, data: bytes) -> Any:
+        return self._orjson.loads(data)
+
+class MsgspecJSONCodec(Codec):
+    """msgspec.json（可选依赖）：输出紧凑 JSON。"""
+    name = "msgspec"
+
+    def __init__(self):
+        import msgspec
+        self._encoder = msgspec.json.Encoder()
+        self._decoder = msgspec.json.Decoder()
+        self._error = msgspec.DecodeError
+
+    def encode(self, obj: Any) -> bytes:
+        return self._encoder.encode(obj)
+
+    def decode(self, data: bytes) -> Any:
+        try:
+            return self._decoder.decode(data)
+        except self._error as e:
+            # 与标准库 json 一致，损坏的数据抛出 ValueError
+            raise ValueError(str(e)) from e
+
+class MsgpackCodec(Codec):
+    """
+    msgpack 二进制格式，带 MSGPACK_MAGIC 文件头以便自动识别。
+    优先使用 msgpack 包，未安装时使用 msgspec.msgpack（均为可选依赖）。
+    """
+    name = "msgpack"
+    extension = "msgpack"
+    text = False
+
+    def __init__(self):
+        try:
+            import msgpack
+            self._packb: Callable[[Any], bytes] = lambda obj: msgpack.packb(obj, use_bin_type=True)
+            self._unpackb: Callable[[bytes], Any] = lambda data: msgpack.unpackb(data, raw=False)
+            self._errors: Tuple[type, ...] = (ValueError, msgpack.UnpackException)
+        except ImportError:
+            import msgspec
+            self._packb = msgspec.msgpack.Encoder().encode
+            self._unpackb = msgspec.msgpack.Decoder().decode
+            self._errors = (ValueError, msgspec.DecodeError)
+
+    def encode(self, obj: Any) -> bytes:
+        return MSGPACK_MAGIC + self._packb(obj)
+
+    def decode(self, data: bytes) -> Any:
+        if not data.startswith(MSGPACK_MAGIC):
+            raise ValueError("不是 msgpack 记忆文件（缺少文件头）")
+        try:
+            return self._unpackb(memoryview(data)[len(MSGPACK_MAGIC):])
+        except self._errors as e:
+            raise ValueError(str(e)) from e
+
+_CODEC_FACTORIES: Dict[str, Callable[[], Codec]] = {
+    "json": JSONCodec,
+    "json-pretty": lambda: JSONCodec(indent=4),
+    "orjson": OrjsonCodec,
+    "msgspec": MsgspecJSONCodec,
+    "msgpack": MsgpackCodec,
+}
+
+# 所有编解码器可能使用的文件扩展名，加载时按此查找已有快照（存储切换编解码器后仍可读取旧文件）
+SNAPSHOT_EXTENSIONS: Tuple[str, ...] = ("json", "msgpack")
+
+@lru_cache(maxsize=None)
+def get_codec(name: str) -> Codec:
+    """
+    按名称获取（并缓存）编解码器：json、json-pretty、orjson、msgspec、msgpack。
+    可选依赖未安装时抛出 ImportError。
+    """
+    factory = _CODEC_FACTORIES.get(name)
+    if factory is None:
+        raise ValueError(f"未知的编解码器: {name}，可选 {sorted(_CODEC_FACTORIES)}")
+    return factory()
+
+def resolve_codec(codec: Union[str, Codec]) -> Codec:
+    return get_codec(codec) if isinstance(codec, str) else codec
+
+@lru_cache(maxsize=None)
+def fastest_json_codec() -> Codec:
+    """已安装的最快 JSON 编解码器：orjson > msgspec > 标准库（紧凑）。"""
+    for name in ("orjson", "msgspec"):
+        try:
+            return get_codec(name)
+        except ImportError:
+            continue
+    return get_codec("json")
+
+def detect_codec(data: bytes) -> Codec:
+    """根据文件内容识别编解码器：带 MSGPACK_MAGIC 文件头的为 msgpack，其余按 JSON 解码。"""
+    if data.startswith(MSGPACK_MAGIC):
+        return get_codec("msgpack")
+    return fastest_json_codec()
+
+def decode_auto(data: bytes) -> Any:
+    """自动识别格式并解码。"""
+    return detect_codec(data).decode(data)
+
+def available_codecs() -> List[str]:
+    """当前环境可用的编解码器名称。"""
+    names = []
+    for name in _CODEC_FACTORIES:
+        try:
+            get_codec(name)
+        except ImportError:
+            continue
+        names.append(name)
+    return names
+
+def benchmark(sizes: Tuple[int, ...] = (10_000, 100_000), rounds: int = 3) -> Dict[int, Dict[str, Dict[str, float]]]:
+    """
+    在模拟对话（DialogueMemory.model_dump(mode='json') 的结构）上比较各可用编解码器的
+    编码、解码耗时（毫秒，取 rounds 轮最小值）与编码后大小（KB）。json-pretty 即原先 indent=4 的格式。
+    """
+    from memory.dialogue_benchmark import synthetic_records
+
+    report: Dict[int, Dict[str, Dict[str, float]]] = {}
+    for n in sizes:
+        obj = {"user_id": "u", "role_id": "r", "messages": synthetic_records(n), "last_updated": "2024-01-01T08:00:00"}
+        report[n] = {}
+        for name in available_codecs():
+            codec = get_codec(name)
+            encode_s = decode_s = float("inf")
+            for _ in range(rounds):
+                started = time.perf_counter()
+                data = codec.encode(obj)
+                encode_s = min(encode_s, time.perf_counter() - started)
+                started = time.perf_counter()
+                decoded = codec.decode(data)
+                decode_s = min(decode_s, time.perf_counter() - started)
+            assert decoded == obj
+            report[n][name] = {
+                "encode_ms": round(encode_s * 1000, 1),
+                "decode_ms": round(decode_s * 1000, 1),
+                "size_kb": round(len(data) / 1024, 1),
+            }
+            print(f"[{n} 条消息][{name}] 编码 {report[n][name]['encode_ms']} ms, "
+                  f"解码 {report[n][name]['decode_ms']} ms, 大小 {report[n][name]['size_kb']} KB")
+    return report
+
+if __name__ == '__main__':
+    # python -m memory.codecs --messages 10000 --messages 100000
+    parser = argparse.ArgumentParser(description="记忆快照编解码器基准：编码/解码耗时与文件大小")
+    parser.add_argument("--messages", type=int, action="append", help="模拟对话的消息条数，可重复指定")
+    parser.add_argument("--rounds", type=int, default=3, help="测量轮数（取最小值）")
+    args = parser.parse_args()
+    benchmark(tuple(args.messages or (10_000, 100_000)), args.rounds)
@@ -0,0 +1,95 @@
+import gc
+import json
+import time
+import argparse
+import tracemalloc
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, List, Tuple
+
+from memory.types import DialogueMemory, Message, CompactMessageList
+
+def synthetic_records(n: int) -> List[Dict[str, Any]]:
+    """生成 n 条模拟对话消息（model_dump(mode='json') 的结构），用户与助手交替、中英文混合。"""
+    started = datetime(2024, 1, 1, 8, 0, 0)
+    records = []
+    for i in range(n):
+        if i % 2 == 0:
+            content = f"第{i // 2}个问题：最近总是感觉疲惫，晚上睡不好，有什么建议吗？"
+        else:
+            content = f"针对第{i // 2}个问题，建议规律作息、减少咖啡因摄入，并保持适量运动 (ref #{i})。"
+        records.append({
+            "sender": "user" if i % 2 == 0 else "assistant",
+            "content": content,
+            "timestamp": (started + timedelta(seconds=30 * i, microseconds=i)).isoformat(),
+        })
+    return records
+
+def _traced(build: Callable[[], Any]) -> Tuple[Any, int, float]:
+    """执行 build，返回 (结果, 新增分配的字节数, 耗时秒)。"""
+    gc.collect()
+    tracemalloc.start()
+    baseline = tracemalloc.get_traced_memory()[0]
+    started = time.perf_counter()
+    result = build()
+    elapsed = time.perf_counter() - started
+    allocated = tracemalloc.get_traced_memory()[0] - baseline
+    tracemalloc.stop()
+    return result, allocated, elapsed
+
+def _timed(build: Callable[[], Any], rounds: int) -> float:
+    best = float("inf")
+    for _ in range(rounds):
+        gc.collect()
+        started = time.perf_counter()
+        build()
+        best = min(best, time.perf_counter() - started)
+    return best
+
+def benchmark(n: int = 100_000, rounds: int = 3) -> Dict[str, Dict[str, float]]:
+    """
+    比较逐条 pydantic Message 列表（原实现）与 CompactMessageList 的常驻内存和加载耗时。
+
+    - bytes_per_message：以 tracemalloc 统计构建 n 条消息新增分配的字节数 / n；
+    - validate_ms：由已解析的消息字典构建（DialogueMemory.model_validate 的路径）；
+    - jsonl_load_ms：由 JSONL 文本行解析并构建（FilePersistenceLayer 完整加载的路径）。
+    加载耗时取 rounds 轮中的最小值。
+    """
+    records = synthetic_records(n)
+    lines = [json.dumps(record, ensure_ascii=False) for record in records]
+
+    def load_models() -> List[Message]:
+        return [Message.model_validate(record) for record in records]
+
+    def load_compact() -> CompactMessageList:
+        return DialogueMemory.model_validate({"user_id": "u", "role_id": "r", "messages": records}).messages
+
+    def parse_models() -> List[Message]:
+        return [Message.model_validate(json.loads(line)) for line in lines]
+
+    def parse_compact() -> CompactMessageList:
+        messages = CompactMessageList()
+        for line in lines:
+            messages.append_record(json.loads(line))
+        return messages
+
+    report = {}
+    for name, load, parse in (("pydantic", load_models, parse_models), ("compact", load_compact, parse_compact)):
+        result, allocated, _ = _traced(load)
+        assert len(result) == n
+        del result
+        report[name] = {
+            "bytes_per_message": round(allocated / n, 1),
+            "validate_ms": round(_timed(load, rounds) * 1000, 1),
+            "jsonl_load_ms": round(_timed(parse, rounds) * 1000, 1),
+        }
+        print(f"[{name}] {report[name]['bytes_per_message']} B/消息, "
+              f"构建 {report[name]['validate_ms']} ms, JSONL 加载 {report[name]['jsonl_load_ms']} ms")
+    return report
+
+if __name__ == '__main__':
+    # python -m memory.dialogue_benchmark --messages 100000
+    parser = argparse.ArgumentParser(description="对话消息内存表示基准：pydantic Message 列表 vs 紧凑列式存储")
+    parser.add_argument("--messages", type=int, default=100_000, help="模拟消息条数")
+    parser.add_argument("--rounds", type=int, default=3, help="加载耗时测量轮数（取最小值）")
+    args = parser.parse_args()
+    benchmark(args.messages, args.rounds)
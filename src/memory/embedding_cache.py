@@ -0,0 +1,134 @@
+import os
+import re
+import hashlib
+import sqlite3
+import threading
+import unicodedata
+from array import array
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+def normalize_query(text: str) -> str:
+    """
+    归一化查询文本：NFKC（全角/半角统一）、去除首尾空白、合并连续空白、英文小写。
+    """
+    text = unicodedata.normalize("NFKC", text)
+    text = re.sub(r"\s+", " ", text).strip()
+    return text.lower()
+
+class EmbeddingCache:
+    """
+    查询嵌入缓存，键为 (嵌入模型 ID, 归一化查询文本)。
+
+    第一层为容量受限的内存 LRU；第二层为可选的 SQLite 磁盘缓存（disk_path），
+    进程重启后仍可命中。hits / disk_hits / misses 计数可通过 stats() 查看。
+    """
+    def __init__(self, max_size: int = 1024, disk_path: Optional[str] = None):
+        self.max_size = max_size
+        self.disk_path = disk_path
+        self._lock = threading.Lock()
+        self._memory: "OrderedDict[Tuple[str, str], List[float]]" = OrderedDict()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+        self._conn = None
+        if disk_path:
+            disk_dir = os.path.dirname(disk_path)
+            if disk_dir:
+                os.makedirs(disk_dir, exist_ok=True)
+            self._conn = sqlite3.connect(disk_path, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS embeddings ("
+                "model_id TEXT NOT NULL, key TEXT NOT NULL, vector BLOB NOT NULL, "
+                "PRIMARY KEY (model_id, key))"
+            )
+            self._conn.commit()
+
+    def _key(self, model_id: str, text: str) -> Tuple[str, str]:
+        return model_id, hashlib.sha256(normalize_query(text).encode("utf-8")).hexdigest()
+
+    def get(self, model_id: str, text: str) -> Optional[List[float]]:
+        """查询缓存；未命中返回 None。磁盘命中的向量会回填到内存层。"""
+        key = self._key(model_id, text)
+        with self._lock:
+            vector = self._memory.get(key)
+            if vector is not None:
+                self._memory.move_to_end(key)
+                self.hits += 1
+                return vector
+
+            if self._conn is not None:
+                row = self._conn.execute(
+                    "SELECT vector FROM embeddings WHERE model_id = ? AND key = ?", key
+                ).fetchone()
+                if row:
+                    vector = array("f", row[0]).tolist()
+                    self._remember(key, vector)
+                    self.disk_hits += 1
+                    return vector
+
+            self.misses += 1
+            return None
+
+    def put(self, model_id: str, text: str, vector: Sequence[float]):
+        """写入缓存（内存层，以及配置了磁盘层时同时写入磁盘）。"""
+        key = self._key(model_id, text)
+        vector = [float(x) for x in vector]
+        with self._lock:
+            self._remember(key, vector)
+            if self._conn is not None:
+                with self._conn:
+                    self._conn.execute(
+                        "INSERT OR REPLACE INTO embeddings (model_id, key, vector) VALUES (?, ?, ?)",
+                        (key[0], key[1], array("f", vector).tobytes())
+                    )
+
+    def get_or_compute(self, model_id: str, texts: List[str],
+                       embed: Callable[[List[str]], Sequence[Sequence[float]]]) -> List[List[float]]:
+        """
+        批量获取嵌入：命中的直接返回，未命中的文本一次性交给 embed 计算后写入缓存。
+        """
+        vectors: Dict[int, List[float]] = {}
+        missing = []
+        for i, text in enumerate(texts):
+            vector = self.get(model_id, text)
+            if vector is None:
+                missing.append(i)
+            else:
+                vectors[i] = vector
+
+        if missing:
+            computed = embed([texts[i] for i in missing])
+            for i, vector in zip(missing, computed):
+                self.put(model_id, texts[i], vector)
+                vectors[i] = [float(x) for x in vector]
+
+        return [vectors[i] for i in range(len(texts))]
+
+    def _remember(self, key: Tuple[str, str], vector: List[float]):
+        self._memory[key] = vector
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_size:
+            self._memory.popitem(last=False)
+
+    def stats(self) -> Dict[str, float]:
+        """返回命中统计。"""
+        with self._lock:
+            lookups = self.hits + self.disk_hits + self.misses
+            return {
+                "size": len(self._memory),
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_rate": (self.hits + self.disk_hits) / lookups if lookups else 0.0,
+            }
+
+    def clear(self):
+        """清空内存层和磁盘层。"""
+        with self._lock:
+            self._memory.clear()
+            if self._conn is not None:
+                with self._conn:
+                    self._conn.execute("DELETE FROM embeddings")
@@ -0,0 +1,112 @@
+import os
+import time
+import tempfile
+import threading
+from contextlib import contextmanager
+from typing import BinaryIO, Dict, Iterator, Tuple
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+class LockTimeout(TimeoutError):
+    """在超时时间内未能获得文件锁。"""
+
+# 每个线程已持有的锁：锁文件路径 -> (文件描述符, 重入次数)
+_held = threading.local()
+
+def _held_locks() -> Dict[str, Tuple[int, int]]:
+    locks = getattr(_held, "locks", None)
+    if locks is None:
+        locks = _held.locks = {}
+    return locks
+
+def _try_lock(fd: int) -> bool:
+    try:
+        if fcntl is not None:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        else:
+            msvcrt.locking(fd, msvcrt.LK_NBLCK, 1)
+        return True
+    except OSError:
+        return False
+
+def _unlock(fd: int):
+    if fcntl is not None:
+        fcntl.flock(fd, fcntl.LOCK_UN)
+    else:
+        os.lseek(fd, 0, os.SEEK_SET)
+        msvcrt.locking(fd, msvcrt.LK_UNLCK, 1)
+
+@contextmanager
+def file_lock(path: str, timeout: float = 10.0, poll_interval: float = 0.005) -> Iterator[None]:
+    """
+    以 path 为锁文件的排他建议锁（POSIX flock / Windows msvcrt.locking），跨进程、跨线程互斥。
+
+    同一线程内可重入：已持有该锁时直接进入。超过 timeout 秒仍未获得时抛出 LockTimeout；
+    等待期间按指数退避轮询（上限 50ms）。进程崩溃时操作系统自动释放锁，不会遗留死锁。
+    """
+    path = os.path.abspath(path)
+    locks = _held_locks()
+    if path in locks:
+        fd, depth = locks[path]
+        locks[path] = (fd, depth + 1)
+        try:
+            yield
+        finally:
+            fd, depth = locks[path]
+            locks[path] = (fd, depth - 1)
+        return
+
+    fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+    try:
+        deadline = time.monotonic() + timeout
+        delay = poll_interval
+        while not _try_lock(fd):
+            if time.monotonic() >= deadline:
+                raise LockTimeout(f"等待文件锁超时（{timeout} 秒）: {path}")
+            time.sleep(delay)
+            delay = min(delay * 2, 0.05)
+    except BaseException:
+        os.close(fd)
+        raise
+
+    locks[path] = (fd, 1)
+    try:
+        yield
+    finally:
+        del locks[path]
+        try:
+            _unlock(fd)
+        finally:
+            os.close(fd)
+
+@contextmanager
+def atomic_write(path: str) -> Iterator[BinaryIO]:
+    """
+    原子写入：在同一目录的唯一临时文件中写入并 fsync，完成后 rename 覆盖 path。
+    读取方只会看到旧文件或完整的新文件；写入过程中出错时临时文件被删除，path 保持不变。
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=f".{os.path.basename(path)}.", suffix=".tmp")
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            # mkstemp 创建的文件权限为 0600，沿用原文件权限（新文件为 0644）
+            if hasattr(os, "fchmod"):
+                try:
+                    mode = os.stat(path).st_mode & 0o777
+                except FileNotFoundError:
+                    mode = 0o644
+                os.fchmod(f.fileno(), mode)
+            yield f
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
@@ -0,0 +1,302 @@
+import os
+import json
+import time
+import uuid
+import argparse
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, Future
+from typing import Any, Deque, Dict, Iterator, List, Optional, Tuple
+
+from .rag_utils import (
+    CHROMA_REGISTRY, build_document_chunks, collection_metadata_for_update, document_file_key, file_content_hash,
+    get_default_embedding_function
+)
+
+# 扩展名 -> langchain 文档加载器（在工作进程中按需导入）
+LOADERS = {
+    ".txt": ("langchain_community.document_loaders", "TextLoader"),
+    ".md": ("langchain_community.document_loaders", "TextLoader"),
+    ".pdf": ("langchain_community.document_loaders", "PyPDFLoader"),
+    ".docx": ("langchain_community.document_loaders", "Docx2txtLoader"),
+}
+
+def _load_and_split(path: str, rel_path: str, root: str, collection_name: str,
+                    chunk_size: int, chunk_overlap: int, file_hash: str) -> Dict[str, Any]:
+    """
+    工作进程任务：加载并分块单个文件。返回可序列化的结果，错误以字符串形式返回。
+    分块 ID 与元数据由 build_document_chunks 生成，与 index_documents_to_chroma(root=root) 一致。
+    """
+    import importlib
+    from langchain_text_splitters import CharacterTextSplitter
+
+    try:
+        module_name, class_name = LOADERS[os.path.splitext(path)[1].lower()]
+        loader_class = getattr(importlib.import_module(module_name), class_name)
+        documents = loader_class(path).load()
+        docs = CharacterTextSplitter(chunk_size=chunk_size, chunk_overlap=chunk_overlap).split_documents(documents)
+    except Exception as e:
+        return {"path": rel_path, "error": f"{type(e).__name__}: {e}", "chunks": []}
+
+    chunks = [
+        {"id": chunk_id, "text": text, "metadata": metadata}
+        for chunk_id, (text, metadata) in build_document_chunks(docs, collection_name, path, root, file_hash).items()
+    ]
+    return {"path": rel_path, "error": None, "chunks": chunks}
+
+class IngestionState:
+    """
+    断点续传状态：以 JSONL 记录已完整写入 ChromaDB 的文件及其哈希。
+    中断后重新运行时，哈希未变化的已完成文件将被跳过。
+
+    首行记录所属 Collection 的 ID：Collection 被删除或重建后 ID 改变，旧状态随之作废
+    （没有该记录的旧版状态文件同样作废），不会因过期的状态跳过实际未索引的文件。
+    """
+    def __init__(self, path: str, collection_id: str):
+        self.path = path
+        self.collection_id = collection_id
+        self.completed: Dict[str, str] = {}
+        entries: List[Dict[str, Any]] = []
+        if os.path.exists(path):
+            with open(path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        entries.append(json.loads(line))
+                    except ValueError:
+                        continue
+        if not entries or entries[0].get("collection_id") != collection_id:
+            self.reset()
+            return
+        for entry in entries[1:]:
+            if entry.get("hash") is None:
+                self.completed.pop(entry["file"], None)
+            else:
+                self.completed[entry["file"]] = entry["hash"]
+
+    def reset(self):
+        """清空状态，重新写入 Collection ID。"""
+        self.completed = {}
+        with open(self.path, 'w', encoding='utf-8') as f:
+            f.write(json.dumps({"collection_id": self.collection_id}) + "\n")
+
+    def _append(self, entry: Dict[str, Any]):
+        with open(self.path, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+
+    def mark_done(self, rel_path: str, file_hash: str):
+        self.completed[rel_path] = file_hash
+        self._append({"file": rel_path, "hash": file_hash})
+
+    def mark_removed(self, rel_path: str):
+        self.completed.pop(rel_path, None)
+        self._append({"file": rel_path, "hash": None})
+
+def iter_knowledge_files(root: str, extensions: Optional[List[str]] = None) -> Iterator[Tuple[str, str]]:
+    """遍历目录，按稳定顺序产出 (路径, 文件标识)，文件标识见 document_file_key。"""
+    extensions = [ext.lower() for ext in (extensions or LOADERS)]
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames.sort()
+        for name in sorted(filenames):
+            if os.path.splitext(name)[1].lower() in extensions:
+                path = os.path.join(dirpath, name)
+                yield path, document_file_key(path, root)
+
+def _removed_file_chunks(collection, root: str, page_size: int = 1000) -> Dict[str, List[str]]:
+    """Collection 中文件标识（file 元数据）在 root 下已不存在的分块：文件标识 -> 分块 ID。"""
+    removed: Dict[str, List[str]] = {}
+    exists: Dict[str, bool] = {}
+    offset = 0
+    while True:
+        page = collection.get(include=['metadatas'], limit=page_size, offset=offset)
+        if not page['ids']:
+            break
+        for chunk_id, meta in zip(page['ids'], page['metadatas']):
+            file_key = (meta or {}).get("file")
+            if not file_key:
+                continue
+            if file_key not in exists:
+                exists[file_key] = os.path.isfile(os.path.join(root, *file_key.split("/")))
+            if not exists[file_key]:
+                removed.setdefault(file_key, []).append(chunk_id)
+        offset += len(page['ids'])
+    return removed
+
+def ingest_directory(root: str, collection_name: str, db_path: str = "data/chroma_db",
+                     workers: Optional[int] = None, batch_size: int = 64,
+                     chunk_size: int = 1000, chunk_overlap: int = 200,
+                     extensions: Optional[List[str]] = None,
+                     state_path: Optional[str] = None,
+                     lexical_store_path: Optional[str] = None,
+                     prune: bool = True) -> Dict[str, Any]:
+    """
+    流式批量导入目录下的知识文档到 ChromaDB Collection。
+
+    文件在进程池中并行加载和分块（同时在途的文件数有上限），分块按固定批大小嵌入
+    并以 upsert 批量写入，内存占用与批大小和并发数成正比而与文档总量无关。
+    每个文件的全部分块写入后记录到状态文件，中断后重新运行会跳过已完成的文件。
+
+    分块 ID 以相对 root 的路径为文件标识，与 index_documents_to_chroma(root=root) 相同，两者可混用。
+    Collection 在导入前非空时，写入每个文件前先删除该文件已有但不在新分块中的分块
+    （文件内容已变化、上次中断时写入的旧版本部分分块，或经其他索引路径写入的分块）；
+    prune=True 时还会删除 root 下已不存在的文件（被删除或重命名）的全部分块——
+    Collection 视为 root 目录的镜像，这一步需要分页读取全部分块的元数据。
+
+    :param root: 知识文档目录。
+    :param collection_name: 目标 Collection 名称（角色的 knowledge_path）。
+    :param db_path: ChromaDB 存储路径。
+    :param workers: 加载/分块进程数，默认使用 CPU 核数。
+    :param batch_size: 每批嵌入和写入的分块数。
+    :param extensions: 需要导入的扩展名，默认为 LOADERS 中支持的全部格式。
+    :param state_path: 断点续传状态文件，默认位于 db_path 下。
+    :param lexical_store_path: 设置时在导入结束后由 Collection 重新构建 BM25 词法索引，
+        供 LexicalRAG / HybridRAG 检索到新导入的文档。
+    :param prune: 是否删除已不存在的文件的分块。
+    :return: 统计信息（文件数、分块数、删除的文件数与旧分块数、耗时与吞吐量）。
+    """
+    embed = get_default_embedding_function()
+    collection = CHROMA_REGISTRY.get_client(db_path).get_or_create_collection(
+        name=collection_name,
+        embedding_function=embed
+    )
+    state = IngestionState(state_path or os.path.join(db_path, f"ingest_state_{collection_name}.jsonl"),
+                           str(collection.id))
+
+    stats = {"files": 0, "files_skipped": 0, "files_failed": 0, "files_removed": 0, "chunks": 0, "chunks_deleted": 0}
+    started = time.perf_counter()
+    # 空 Collection 中不存在旧分块，无需逐文件比对；此前的状态（如分块已被全部删除）也不再有效
+    fresh_collection = collection.count() == 0
+    if fresh_collection and state.completed:
+        state.reset()
+
+    # 待写入的分块缓冲区，以及每个文件尚未写入的分块数
+    buffer: List[Tuple[str, Dict[str, Any]]] = []
+    pending_chunks: Dict[str, int] = {}
+    file_hashes: Dict[str, str] = {}
+
+    def flush():
+        if not buffer:
+            return
+        texts = [chunk["text"] for _, chunk in buffer]
+        collection.upsert(
+            ids=[chunk["id"] for _, chunk in buffer],
+            embeddings=embed(texts),
+            documents=texts,
+            metadatas=[chunk["metadata"] for _, chunk in buffer]
+        )
+        stats["chunks"] += len(buffer)
+        for rel_path, _ in buffer:
+            pending_chunks[rel_path] -= 1
+            if pending_chunks[rel_path] == 0:
+                finish(rel_path)
+        buffer.clear()
+
+    def finish(rel_path: str):
+        del pending_chunks[rel_path]
+        state.mark_done(rel_path, file_hashes.pop(rel_path))
+        stats["files"] += 1
+        if stats["files"] % 100 == 0:
+            report()
+
+    def report():
+        elapsed = time.perf_counter() - started
+        print(
+            f"[ingest] {stats['files']} 个文件, {stats['chunks']} 个文本块, "
+            f"{stats['files'] / elapsed:.1f} docs/s, {stats['chunks'] / elapsed:.1f} chunks/s"
+        )
+
+    def consume(future: Future):
+        result = future.result()
+        rel_path = result["path"]
+        if result["error"]:
+            print(f"Error loading document {rel_path}: {result['error']}")
+            stats["files_failed"] += 1
+            file_hashes.pop(rel_path, None)
+            return
+
+        # 删除该文件已有的、不属于当前版本的分块
+        if not fresh_collection:
+            chunk_ids = {chunk["id"] for chunk in result["chunks"]}
+            stale = [
+                chunk_id for chunk_id in collection.get(where={"file": rel_path}, include=[])['ids']
+                if chunk_id not in chunk_ids
+            ]
+            if stale:
+                collection.delete(ids=stale)
+                stats["chunks_deleted"] += len(stale)
+
+        if not result["chunks"]:
+            pending_chunks[rel_path] = 0
+            finish(rel_path)
+            return
+        pending_chunks[rel_path] = len(result["chunks"])
+        for chunk in result["chunks"]:
+            buffer.append((rel_path, chunk))
+            if len(buffer) >= batch_size:
+                flush()
+
+    workers = workers or os.cpu_count() or 1
+    in_flight: Deque[Future] = deque()
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        for path, rel_path in iter_knowledge_files(root, extensions):
+            file_hash = file_content_hash(path, chunk_size, chunk_overlap)
+            if state.completed.get(rel_path) == file_hash:
+                stats["files_skipped"] += 1
+                continue
+
+            file_hashes[rel_path] = file_hash
+            in_flight.append(executor.submit(
+                _load_and_split, path, rel_path, root, collection_name, chunk_size, chunk_overlap, file_hash
+            ))
+            # 限制在途文件数，避免分块结果在内存中堆积
+            if len(in_flight) >= workers * 2:
+                consume(in_flight.popleft())
+
+        while in_flight:
+            consume(in_flight.popleft())
+    flush()
+
+    # 删除已不存在的文件的分块
+    if prune and not fresh_collection:
+        for file_key, chunk_ids in _removed_file_chunks(collection, root).items():
+            collection.delete(ids=chunk_ids)
+            state.mark_removed(file_key)
+            stats["files_removed"] += 1
+            stats["chunks_deleted"] += len(chunk_ids)
+
+    if stats["files"] or stats["files_removed"]:
+        # 内容有变化：更新索引版本，使检索结果缓存失效
+        metadata = collection_metadata_for_update(collection)
+        metadata["index_version"] = uuid.uuid4().hex
+        collection.modify(metadata=metadata)
+        CHROMA_REGISTRY.invalidate(db_path, collection_name)
+    if lexical_store_path:
+        from .lexical import lexical_index_exists, build_lexical_index_from_chroma
+        if stats["files"] or stats["files_removed"] or not lexical_index_exists(lexical_store_path, collection_name):
+            build_lexical_index_from_chroma(collection_name, db_path, lexical_store_path)
+
+    elapsed = time.perf_counter() - started
+    stats["elapsed_seconds"] = round(elapsed, 3)
+    stats["docs_per_second"] = round(stats["files"] / elapsed, 2) if elapsed else 0.0
+    stats["chunks_per_second"] = round(stats["chunks"] / elapsed, 2) if elapsed else 0.0
+    print(
+        f"成功导入 {stats['files']} 个文件（跳过 {stats['files_skipped']}，失败 {stats['files_failed']}，"
+        f"移除 {stats['files_removed']}），{stats['chunks']} 个文本块到 ChromaDB Collection: {collection_name}"
+        f"（删除旧分块 {stats['chunks_deleted']}）；"
+        f"{stats['docs_per_second']} docs/s, {stats['chunks_per_second']} chunks/s"
+    )
+    return stats
+
+if __name__ == '__main__':
+    # 批量导入命令：python -m memory.ingest <目录> <collection_name> [--db-path ...]
+    parser = argparse.ArgumentParser(description="并行批量导入知识文档目录到 ChromaDB")
+    parser.add_argument("root", help="知识文档目录")
+    parser.add_argument("collection_name", help="目标 Collection 名称（角色的 knowledge_path）")
+    parser.add_argument("--db-path", default="data/chroma_db", help="ChromaDB 存储路径")
+    parser.add_argument("--workers", type=int, default=None, help="加载/分块进程数")
+    parser.add_argument("--batch-size", type=int, default=64, help="每批嵌入和写入的分块数")
+    parser.add_argument("--lexical-store-path", default=None, help="导入后重新构建 BM25 词法索引的目录（供混合检索）")
+    parser.add_argument("--no-prune", action="store_true", help="保留目录中已不存在的文件的分块")
+    args = parser.parse_args()
+
+    ingest_directory(args.root, args.collection_name, db_path=args.db_path,
+                     workers=args.workers, batch_size=args.batch_size,
+                     lexical_store_path=args.lexical_store_path, prune=not args.no_prune)
@@ -0,0 +1,321 @@
+import os
+import re
+import json
+import math
+import uuid
+import argparse
+import threading
+from collections import Counter
+from typing import Any, Dict, List, Optional, Tuple
+
+from .persistence import ProfessionalMemoryRAG
+from .file_lock import atomic_write
+from .types import ProfessionalMemory, ProfessionalMemoryResult
+from .embedding_cache import normalize_query
+from .rag_utils import CHROMA_REGISTRY, document_file_key, load_document_chunks
+
+# 中日韩字符连续片段按字符 unigram + bigram 切分，字母数字按词切分，其余字符（标点等）忽略
+_TOKEN_PATTERN = re.compile(r"[\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff]+|[a-z0-9]+")
+_CJK_PATTERN = re.compile(r"[\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff]")
+
+def tokenize(text: str) -> List[str]:
+    """将文本切分为词项：中文为字符 1-gram 与 2-gram，英文/数字为小写单词。"""
+    tokens: List[str] = []
+    for match in _TOKEN_PATTERN.finditer(normalize_query(text)):
+        run = match.group()
+        if _CJK_PATTERN.match(run):
+            tokens.extend(run)
+            tokens.extend(run[i:i + 2] for i in range(len(run) - 1))
+        else:
+            tokens.append(run)
+    return tokens
+
+class BM25Index:
+    """
+    基于倒排表的 BM25 索引。postings 为 词项 -> [[文档序号, 词频], ...]。
+    """
+    def __init__(self, ids: List[str], documents: List[str], metadatas: List[Dict[str, Any]],
+                 index_version: Optional[str] = None, k1: float = 1.5, b: float = 0.75,
+                 postings: Optional[Dict[str, List[List[int]]]] = None,
+                 doc_lens: Optional[List[int]] = None):
+        self.ids = ids
+        self.documents = documents
+        self.metadatas = metadatas
+        self.index_version = index_version
+        self.k1 = k1
+        self.b = b
+
+        if postings is None or doc_lens is None:
+            postings, doc_lens = {}, []
+            for i, document in enumerate(documents):
+                counts = Counter(tokenize(document))
+                doc_lens.append(sum(counts.values()))
+                for term, tf in counts.items():
+                    postings.setdefault(term, []).append([i, tf])
+        self.postings = postings
+        self.doc_lens = doc_lens
+        self.avgdl = sum(doc_lens) / len(doc_lens) if doc_lens else 0.0
+
+    def search(self, query: str, top_k: int = 3) -> List[Tuple[int, float]]:
+        """返回得分最高的 top_k 个 (文档序号, BM25 得分)，无匹配词项的文档不返回。"""
+        n = len(self.documents)
+        if n == 0 or top_k <= 0:
+            return []
+
+        scores: Dict[int, float] = {}
+        for term, qtf in Counter(tokenize(query)).items():
+            posting = self.postings.get(term)
+            if not posting:
+                continue
+            idf = math.log(1 + (n - len(posting) + 0.5) / (len(posting) + 0.5))
+            for i, tf in posting:
+                norm = tf + self.k1 * (1 - self.b + self.b * self.doc_lens[i] / self.avgdl)
+                scores[i] = scores.get(i, 0.0) + qtf * idf * tf * (self.k1 + 1) / norm
+        return sorted(scores.items(), key=lambda item: item[1], reverse=True)[:top_k]
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "index_version": self.index_version,
+            "k1": self.k1,
+            "b": self.b,
+            "ids": self.ids,
+            "documents": self.documents,
+            "metadatas": self.metadatas,
+            "doc_lens": self.doc_lens,
+            "postings": self.postings,
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "BM25Index":
+        return cls(
+            data["ids"], data["documents"], data["metadatas"], index_version=data.get("index_version"),
+            k1=data.get("k1", 1.5), b=data.get("b", 0.75),
+            postings=data["postings"], doc_lens=data["doc_lens"]
+        )
+
+def _index_file(store_path: str, knowledge_path: str) -> str:
+    return os.path.join(store_path, f"{knowledge_path}.bm25.json")
+
+def lexical_index_exists(store_path: str, knowledge_path: str) -> bool:
+    return os.path.exists(_index_file(store_path, knowledge_path))
+
+def load_lexical_index(store_path: str, knowledge_path: str) -> BM25Index:
+    with open(_index_file(store_path, knowledge_path), 'r', encoding='utf-8') as f:
+        return BM25Index.from_dict(json.load(f))
+
+def write_lexical_index(store_path: str, knowledge_path: str, ids: List[str], documents: List[str],
+                        metadatas: List[Dict[str, Any]], index_version: Optional[str] = None) -> BM25Index:
+    """构建并写入（原子替换）一个知识库的 BM25 索引。"""
+    index = BM25Index(ids, documents, metadatas, index_version=index_version or uuid.uuid4().hex)
+    os.makedirs(store_path, exist_ok=True)
+    path = _index_file(store_path, knowledge_path)
+    with atomic_write(path) as f:
+        f.write(json.dumps(index.to_dict(), ensure_ascii=False).encode('utf-8'))
+    return index
+
+def build_lexical_index_from_chroma(collection_name: str, db_path: str = "data/chroma_db",
+                                    store_path: str = "data/lexical_index", page_size: int = 1000) -> int:
+    """
+    以 ChromaDB Collection 中的全部分块重新构建 BM25 索引，沿用 Collection 的 index_version。
+    :return: 索引的分块数。
+    """
+    collection = CHROMA_REGISTRY.get_client(db_path).get_collection(name=collection_name)
+    ids: List[str] = []
+    documents: List[str] = []
+    metadatas: List[Dict[str, Any]] = []
+    offset = 0
+    while True:
+        page = collection.get(include=['documents', 'metadatas'], limit=page_size, offset=offset)
+        if not page['ids']:
+            break
+        ids.extend(page['ids'])
+        documents.extend(page['documents'])
+        metadatas.extend(meta or {} for meta in page['metadatas'])
+        offset += len(page['ids'])
+
+    write_lexical_index(store_path, collection_name, ids, documents, metadatas,
+                        index_version=(collection.metadata or {}).get("index_version"))
+    print(f"词法索引构建完成 {collection_name}: {len(ids)} 个文本块")
+    return len(ids)
+
+def index_documents_lexical(file_path: str, collection_name: str, store_path: str = "data/lexical_index",
+                            chunk_size: int = 1000, chunk_overlap: int = 200, root: Optional[str] = None) -> int:
+    """
+    仅构建词法索引（不加载嵌入模型，适用于纯词法部署）。分块与 index_documents_to_chroma 一致；
+    同一文件重新索引时替换该文件此前的分块。
+    :param root: 知识库根目录，含义同 index_documents_to_chroma。
+    :return: 该文件的分块数。
+    """
+    chunks = load_document_chunks(file_path, collection_name, chunk_size, chunk_overlap, root)
+    if chunks is None:
+        return 0
+
+    source = document_file_key(file_path, root)
+    ids: List[str] = []
+    documents: List[str] = []
+    metadatas: List[Dict[str, Any]] = []
+    if lexical_index_exists(store_path, collection_name):
+        existing = load_lexical_index(store_path, collection_name)
+        for chunk_id, document, metadata in zip(existing.ids, existing.documents, existing.metadatas):
+            if metadata.get("file") != source:
+                ids.append(chunk_id)
+                documents.append(document)
+                metadatas.append(metadata)
+    for chunk_id, (document, metadata) in chunks.items():
+        ids.append(chunk_id)
+        documents.append(document)
+        metadatas.append(metadata)
+
+    write_lexical_index(store_path, collection_name, ids, documents, metadatas)
+    print(f"词法索引完成 {collection_name}/{source}: {len(chunks)} 个文本块")
+    return len(chunks)
+
+class LexicalRAG(ProfessionalMemoryRAG):
+    """
+    纯词法检索：字符 n-gram 上的 BM25，完全不加载嵌入模型，适用于 CPU 受限的部署，
+    对中文专业术语的精确匹配也优于英文嵌入模型。索引文件被替换后自动重新加载。
+    score 为 BM25 原始得分。
+    """
+    def __init__(self, store_path: str = "data/lexical_index"):
+        self.store_path = store_path
+        self._lock = threading.Lock()
+        self._indexes: Dict[str, Tuple[int, BM25Index]] = {}
+
+    def _get_index(self, knowledge_path: str) -> BM25Index:
+        mtime_ns = os.stat(_index_file(self.store_path, knowledge_path)).st_mtime_ns
+        entry = self._indexes.get(knowledge_path)
+        if entry is None or entry[0] != mtime_ns:
+            entry = (mtime_ns, load_lexical_index(self.store_path, knowledge_path))
+            with self._lock:
+                self._indexes[knowledge_path] = entry
+        return entry[1]
+
+    def warmup(self, knowledge_path: Optional[str] = None):
+        if knowledge_path:
+            try:
+                self._get_index(knowledge_path)
+            except Exception as e:
+                print(f"Error loading lexical index {knowledge_path}: {e}")
+
+    def store_identity(self) -> Tuple[str, str]:
+        return "lexical", os.path.abspath(self.store_path)
+
+    def index_version(self, knowledge_path: str) -> Optional[str]:
+        try:
+            return self._get_index(knowledge_path).index_version
+        except Exception:
+            return None
+
+    def retrieve(self, query: str, knowledge_path: str, top_k: int = 3) -> ProfessionalMemory:
+        """
+        根据查询和知识路径进行 BM25 检索。
+        """
+        try:
+            index = self._get_index(knowledge_path)
+        except Exception as e:
+            print(f"Error loading lexical index {knowledge_path}: {e}")
+            return ProfessionalMemory(error=str(e))
+
+        return ProfessionalMemory(results=[
+            ProfessionalMemoryResult(
+                content=index.documents[i],
+                source=index.metadatas[i].get('source', 'N/A'),
+                score=score
+            )
+            for i, score in index.search(query, top_k)
+        ])
+
+class HybridRAG(ProfessionalMemoryRAG):
+    """
+    词法 + 向量混合检索。两路各取 candidate_k 个候选，得分分别做 min-max 归一化后按
+    alpha * 向量得分 + (1 - alpha) * 词法得分 融合（只出现在一路中的候选另一路记 0）。
+    """
+    def __init__(self, dense: ProfessionalMemoryRAG, lexical: LexicalRAG,
+                 alpha: float = 0.5, candidate_k: int = 10):
+        """
+        :param dense: 向量检索实现（如 ChromaDBRAG、NumpyVectorRAG）。
+        :param lexical: 词法检索实现。
+        :param alpha: 向量得分权重，取值 [0, 1]。
+        :param candidate_k: 每一路召回的候选数。
+        """
+        self.dense = dense
+        self.lexical = lexical
+        self.alpha = alpha
+        self.candidate_k = candidate_k
+
+    @staticmethod
+    def _normalized(memory: ProfessionalMemory) -> Dict[str, Tuple[float, ProfessionalMemoryResult]]:
+        if not memory.results:
+            return {}
+        scores = [result.score for result in memory.results]
+        low, high = min(scores), max(scores)
+        return {
+            result.content: ((result.score - low) / (high - low) if high > low else 1.0, result)
+            for result in memory.results
+        }
+
+    def _fuse(self, dense: ProfessionalMemory, lexical: ProfessionalMemory, top_k: int) -> ProfessionalMemory:
+        dense_scores = self._normalized(dense)
+        lexical_scores = self._normalized(lexical)
+        fused: List[ProfessionalMemoryResult] = []
+        for content in {**dense_scores, **lexical_scores}:
+            dense_score, result = dense_scores.get(content, (0.0, None))
+            lexical_score, lexical_result = lexical_scores.get(content, (0.0, None))
+            fused.append(ProfessionalMemoryResult(
+                content=content,
+                source=(result or lexical_result).source,
+                score=self.alpha * dense_score + (1 - self.alpha) * lexical_score
+            ))
+        fused.sort(key=lambda result: result.score, reverse=True)
+        return ProfessionalMemory(results=fused[:top_k], error=dense.error or lexical.error)
+
+    def retrieve(self, query: str, knowledge_path: str, top_k: int = 3) -> ProfessionalMemory:
+        """
+        根据查询和知识路径进行混合检索。
+        """
+        candidate_k = max(self.candidate_k, top_k)
+        return self._fuse(
+            self.dense.retrieve(query, knowledge_path, candidate_k),
+            self.lexical.retrieve(query, knowledge_path, candidate_k),
+            top_k
+        )
+
+    def retrieve_many(self, queries: List[str], knowledge_path: str, top_k: int = 3) -> List[ProfessionalMemory]:
+        candidate_k = max(self.candidate_k, top_k)
+        dense = self.dense.retrieve_many(queries, knowledge_path, candidate_k)
+        lexical = self.lexical.retrieve_many(queries, knowledge_path, candidate_k)
+        return [self._fuse(d, l, top_k) for d, l in zip(dense, lexical)]
+
+    def warmup(self, knowledge_path: Optional[str] = None):
+        self.dense.warmup(knowledge_path)
+        self.lexical.warmup(knowledge_path)
+
+    def store_identity(self) -> Tuple[Any, Any]:
+        return self.dense.store_identity(), self.lexical.store_identity()
+
+    def index_version(self, knowledge_path: str) -> Optional[str]:
+        dense_version = self.dense.index_version(knowledge_path)
+        lexical_version = self.lexical.index_version(knowledge_path)
+        if dense_version is None or lexical_version is None:
+            return None
+        return f"{dense_version}:{lexical_version}"
+
+if __name__ == '__main__':
+    # 从已有 Collection 构建：python -m memory.lexical from-chroma <collection_name>
+    # 仅词法索引文档：python -m memory.lexical index <collection_name> <file> [<file> ...]
+    parser = argparse.ArgumentParser(description="构建 BM25 字符 n-gram 词法索引")
+    parser.add_argument("command", choices=["from-chroma", "index"])
+    parser.add_argument("collection_name", help="Collection 名称（角色的 knowledge_path）")
+    parser.add_argument("files", nargs="*", help="index 命令要索引的文档")
+    parser.add_argument("--db-path", default="data/chroma_db", help="ChromaDB 存储路径")
+    parser.add_argument("--store-path", default="data/lexical_index", help="词法索引目录")
+    parser.add_argument("--chunk-size", type=int, default=1000, help="分块大小")
+    parser.add_argument("--chunk-overlap", type=int, default=200, help="分块重叠大小")
+    args = parser.parse_args()
+
+    if args.command == "from-chroma":
+        build_lexical_index_from_chroma(args.collection_name, db_path=args.db_path, store_path=args.store_path)
+    else:
+        for file_path in args.files:
+            index_documents_lexical(file_path, args.collection_name, store_path=args.store_path,
+                                    chunk_size=args.chunk_size, chunk_overlap=args.chunk_overlap)
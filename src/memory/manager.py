@@ -1,16 +1,44 @@
-from typing import Optional
-from memory.types import DialogueMemory, ActiveMemory, ProfessionalMemory, ProfessionalMemoryQuery
+import sys
+import asyncio
+import threading
+from typing import Optional, Dict, Any, List, Set
+from memory.types import DialogueMemory, ActiveMemory, ActiveMemoryConfig, ProfessionalMemory, ProfessionalMemoryQuery, Message
 from memory.persistence import PersistenceLayer, FilePersistenceLayer, ProfessionalMemoryRAG
+from memory.window import DialogueWindow
+from memory.retrieval_gate import RetrievalGate, RetrievalPolicy
+from memory.write_behind import WriteBehindFlusher
+from memory.retrieval_cache import CachedProfessionalMemoryRAG, RetrievalResultCache
+from memory.prompt_budget import PromptBudget, PromptSection, FusedPrompt, FusedMessages, fit_sections, count_tokens, get_tokenizer
 from role import Role
 from memory.rag_utils import ChromaDBRAG # 导入新的 RAG 实现
 
+# 进程内所有 MemoryManager 共享的默认检索结果缓存
+SHARED_RETRIEVAL_CACHE = RetrievalResultCache()
+
 class MemoryManager:
     """
     记忆管理核心类。负责加载、保存、检索和融合所有类型的记忆。
     """
     def __init__(self, user_id: str, role: Role, 
                  persistence_layer: Optional[PersistenceLayer] = None,
-                 rag_system: Optional[ProfessionalMemoryRAG] = None):
+                 rag_system: Optional[ProfessionalMemoryRAG] = None,
+                 dialogue_window: Optional[int] = 100,
+                 prompt_budget: Optional[PromptBudget] = None,
+                 retrieval_gate: Optional[RetrievalGate] = None,
+                 retrieval_policy: Optional[RetrievalPolicy] = None,
+                 write_behind: Optional[WriteBehindFlusher] = None,
+                 active_memory_config: Optional[ActiveMemoryConfig] = None):
+        """
+        :param dialogue_window: 内存中保留的最近对话条数；None 表示完整加载历史。
+            持久化层不支持部分历史（supports_partial_dialogue 为 False）时忽略该参数。
+        :param prompt_budget: 记忆融合的 token 预算；设置后 fuse_memory_for_prompt 按预算截断各片段。
+        :param retrieval_gate: 检索门控；判定无需检索（寒暄、致谢等）时跳过 RAG 调用。
+        :param retrieval_policy: 检索结果筛选策略（top_k、最低得分、自适应 k）；None 时沿用 top_k=3 且不筛选。
+        :param write_behind: 写回刷新器；设置后对话消息与激活记忆的写盘移出响应路径，
+            由后台合并写入（最长延迟 max_staleness 秒）。flush() 始终同步落盘。
+        :param active_memory_config: 激活记忆的容量、淘汰策略（lru / lfu / ttl）与注入 Prompt 的条目上限；
+            None 时不限容量、全部注入。
+        """
         
         self.user_id = user_id
         self.role = role
@@ -20,70 +48,308 @@ class MemoryManager:
             base_path=f"/home/jijingbo/Role-playing-with-mem/data/memory_store/{role.role_id}"
         )
         
-        # 2. RAG 系统：默认使用 ChromaDBRAG
-        self.rag_system = rag_system if rag_system else ChromaDBRAG(
-            db_path="/home/jijingbo/Role-playing-with-mem/data/chroma_db"
+        # 2. RAG 系统：默认使用带结果缓存的 ChromaDBRAG
+        self.rag_system = rag_system if rag_system else CachedProfessionalMemoryRAG(
+            ChromaDBRAG(db_path="/home/jijingbo/Role-playing-with-mem/data/chroma_db"),
+            cache=SHARED_RETRIEVAL_CACHE
         )
         
-        # 3. 内存中的记忆实例
-        self.dialogue_memory: DialogueMemory = self.persistence.load_dialogue_memory(user_id, role.role_id)
+        # 3. 写回模式：待写入的消息与激活记忆键，由 write_behind 后台合并写盘
+        self.write_behind = write_behind
+        self._pending_lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._pending_messages: List[Message] = []
+        self._pending_active_keys: Set[str] = set()
+
+        # 4. 内存中的记忆实例
+        if not self.persistence.supports_partial_dialogue:
+            dialogue_window = None
+        self.dialogue_window = DialogueWindow(
+            self.persistence, user_id, role.role_id, window_size=dialogue_window,
+            # 写回模式下从持久化层读取历史前先落盘未写入的消息
+            before_read=self.flush_pending if write_behind is not None else None
+        )
+        self.dialogue_memory: DialogueMemory = self.dialogue_window.memory
         self.active_memory: ActiveMemory = self.persistence.load_active_memory(user_id, role.role_id)
+        # 按当前配置清理已过期、超出容量的条目（容量可能比上次运行时更小）
+        evicted = self.active_memory.configure(active_memory_config or ActiveMemoryConfig())
+        if evicted:
+            self.persistence.save_active_memory_items(self.active_memory, evicted)
+
+        # 5. Prompt 预算（可选）及最近一次预算融合的 token 使用报告
+        self.prompt_budget = prompt_budget
+        self.last_prompt_report: Optional[FusedPrompt] = None
+        self.last_message_report: Optional[FusedMessages] = None
+        # 调试/统计开关：多轮消息模式下额外执行一次单条 Prompt 融合，报告 legacy_tokens / saved_tokens。
+        # 会使每轮的融合与分词开销翻倍，默认关闭
+        self.compare_legacy_prompt = False
+        # 上一轮多轮消息模式发送的消息，用于统计前缀缓存可复用的 token 数
+        self._last_prefix_messages: List[Dict[str, str]] = []
+
+        # 6. 检索门控与结果筛选，以及跳过/筛除所节省的 Prompt token 统计
+        self.retrieval_gate = retrieval_gate
+        self.retrieval_policy = retrieval_policy
+        self.retrieval_stats: Dict[str, int] = {
+            "retrievals": 0,
+            "skipped": 0,
+            "filtered_results": 0,
+            "context_tokens": 0,
+            "tokens_saved": 0,
+        }
 
     def add_dialogue(self, sender: str, content: str):
         """
         添加一条对话记录到 Dialogue Memory。
+        :raises WriteBehindError: 写回模式下背压等待超时且存储持续写入失败（消息仍保留在内存中等待重试）。
+        """
+        message = self.dialogue_window.add_message(sender, content)
+        if self.write_behind is not None:
+            if self._buffer_message(message):
+                self.write_behind.wait_for_capacity()
+            return
+        # 仅追加新消息，避免每轮对话都重写完整历史
+        self.persistence.append_dialogue_message(self.dialogue_memory, message)
+
+    async def aadd_dialogue(self, sender: str, content: str):
         """
-        self.dialogue_memory.add_message(sender, content)
-        self.persistence.save_dialogue_memory(self.dialogue_memory)
+        add_dialogue 的异步版本。内存中的对话窗口同步更新，仅磁盘写入异步执行。
+        """
+        message = self.dialogue_window.add_message(sender, content)
+        if self.write_behind is not None:
+            if self._buffer_message(message) and self.write_behind.over_capacity:
+                # 背压：在线程池中等待，避免阻塞事件循环
+                await asyncio.to_thread(self.write_behind.wait_for_capacity)
+            return
+        await self.persistence.aappend_dialogue_message(self.dialogue_memory, message)
+
+    def _buffer_message(self, message: Message) -> bool:
+        """消息入队并在同一把锁内计入刷新器的待写数；刷新器已关闭时同步写入并返回 False。"""
+        with self._pending_lock:
+            self._pending_messages.append(message)
+            if self.write_behind.record(self, messages=1):
+                return True
+        # 刷新器已关闭（进程退出中）
+        self.flush_pending()
+        return False
 
     def get_recent_dialogue(self, n: int = 5) -> str:
         """
         获取最近 n 条对话记录，格式化为 Prompt 字符串。
         """
-        recent_messages = self.dialogue_memory.messages[-n:]
+        recent_messages = self.dialogue_window.recent(n)
         
         formatted_dialogue = "--- 最近对话历史 ---\n"
         for msg in recent_messages:
-            formatted_dialogue += f"[{msg.timestamp.strftime('%H:%M')}] {msg.sender.capitalize()}: {msg.content}\n"
+            formatted_dialogue += self._format_message(msg)
         formatted_dialogue += "----------------------\n"
         
         return formatted_dialogue
 
+    def set_active_memory(self, key: str, value):
+        """
+        设置一条 Active Memory 并立即持久化（写入该键，并删除因容量淘汰的键）；写回模式下由后台合并写入。
+        """
+        if self.write_behind is not None:
+            with self._pending_lock:
+                evicted = self.active_memory.set(key, value)
+                self._pending_active_keys.add(key)
+                self._pending_active_keys.update(evicted)
+            self.write_behind.mark_dirty(self)
+            return
+        evicted = self.active_memory.set(key, value)
+        self.persistence.save_active_memory_items(self.active_memory, [key, *evicted])
+
+    def get_active_memory(self, key: str) -> Optional[Any]:
+        """
+        读取一条 Active Memory，更新其访问时间与读取次数（决定 LRU / LFU 淘汰顺序和 Prompt 排名）并持久化；
+        写回模式下访问统计由后台合并写入，读取不产生同步 I/O。
+        """
+        if self.write_behind is not None:
+            with self._pending_lock:
+                value = self.active_memory.get(key)
+                self._pending_active_keys.add(key)
+            self.write_behind.mark_dirty(self)
+            return value
+        value = self.active_memory.get(key)
+        # 已过期的键在 get 中被删除，save_active_memory_item 会同步删除
+        self.persistence.save_active_memory_item(self.active_memory, key)
+        return value
+
+    def get_dialogue_stats(self) -> Dict[str, Any]:
+        """
+        获取对话记忆的内存占用统计（窗口大小、常驻消息数、历史总数、近似字节数）。
+        """
+        return self.dialogue_window.memory_stats()
+
+    def estimate_resident_bytes(self) -> int:
+        """
+        估算该会话常驻内存的字节数（对话窗口 + 激活记忆），用于会话池的内存上限控制。
+        """
+        active_bytes = sum(
+            sys.getsizeof(key) + sys.getsizeof(item) + sys.getsizeof(item.value)
+            for key, item in self.active_memory.items.items()
+        )
+        return self.dialogue_window.memory_stats()["resident_bytes"] + active_bytes
+
+    def flush(self):
+        """
+        将内存中的记忆同步持久化（会话淘汰、进程退出前调用）：写入写回模式下尚未落盘的消息，
+        并保存完整的激活记忆（包括直接调用 active_memory.get 产生的访问统计）。
+        """
+        with self._flush_lock:
+            self._write_pending(save_all_active=True)
+
+    def has_pending_writes(self) -> bool:
+        """写回模式下是否有尚未落盘的变更。"""
+        with self._pending_lock:
+            return bool(self._pending_messages or self._pending_active_keys)
+
+    def flush_pending(self):
+        """将写回模式下累积的变更合并写入：所有待写消息一次批量追加，激活记忆按变更的键保存。"""
+        with self._flush_lock:
+            self._write_pending(save_all_active=False)
+
+    def _write_pending(self, save_all_active: bool):
+        # 调用方需持有 _flush_lock，保证多次写入按顺序进行
+        with self._pending_lock:
+            messages, self._pending_messages = self._pending_messages, []
+            active_keys, self._pending_active_keys = self._pending_active_keys, set()
+            # 激活记忆可能被调用方线程并发修改，写入其快照
+            active_snapshot = self.active_memory.model_copy(deep=True) if (active_keys or save_all_active) else None
+
+        try:
+            if messages:
+                self.persistence.append_dialogue_messages(self.dialogue_memory, messages)
+            if save_all_active:
+                # 按键保存全部条目而非整体覆盖，保留其他进程写入的键
+                self.persistence.save_active_memory_items(active_snapshot, active_keys | set(active_snapshot.items))
+            elif active_keys:
+                self.persistence.save_active_memory_items(active_snapshot, active_keys)
+        except Exception as e:
+            # 写入失败：放回待写队列，等待下次刷新重试
+            with self._pending_lock:
+                self._pending_messages[:0] = messages
+                self._pending_active_keys |= active_keys
+                if self.write_behind is not None:
+                    self.write_behind.flushed(self, 0, error=e)
+            raise
+        if self.write_behind is not None:
+            # 在待写队列锁内回调：与 _buffer_message 的入队和计数互斥，计数与脏标记不会错位
+            with self._pending_lock:
+                pending = bool(self._pending_messages or self._pending_active_keys)
+                self.write_behind.flushed(self, len(messages), pending=pending)
+
     def get_active_memory_context(self) -> str:
         """
         获取 Active Memory 的上下文，格式化为 Prompt 字符串。
+        仅包含按淘汰策略排名前 active_memory_config.context_items 的未过期条目。
         """
-        if not self.active_memory.items:
+        items = self.active_memory.context_items()
+        if not items:
             return "无高频激活记忆。"
         
         context = "--- 高频激活记忆 (用户偏好/近期信息) ---\n"
-        for key, item in self.active_memory.items.items():
-            context += f"{key}: {item.value} (最后访问: {item.last_accessed.strftime('%Y-%m-%d %H:%M')})\n"
+        for item in items:
+            context += self._format_active_item(item.key, item)
         context += "--------------------------------------\n"
         
         return context
 
+    @property
+    def retrieval_top_k(self) -> int:
+        """传给 RAG 系统的 top_k。"""
+        return self.retrieval_policy.max_k if self.retrieval_policy is not None else 3
+
+    def gate_retrieval(self, query: str) -> bool:
+        """
+        检索门控：返回是否需要检索专业记忆。跳过时按已完成检索的平均专业知识上下文
+        token 数估算节省量并计入 retrieval_stats。
+        """
+        if self.retrieval_gate is None or self.retrieval_gate.should_retrieve(query):
+            return True
+        self.retrieval_stats["skipped"] += 1
+        if self.retrieval_stats["retrievals"]:
+            self.retrieval_stats["tokens_saved"] += (
+                self.retrieval_stats["context_tokens"] // self.retrieval_stats["retrievals"]
+            )
+        return False
+
+    def filter_professional_memory(self, memory: ProfessionalMemory) -> ProfessionalMemory:
+        """按 retrieval_policy 筛选检索结果，并记录筛除片段节省的 token 数。"""
+        self.retrieval_stats["retrievals"] += 1
+        if self.retrieval_policy is not None:
+            filtered = self.retrieval_policy.apply(memory)
+            kept = {id(result) for result in filtered.results}
+            for i, result in enumerate(memory.results):
+                if id(result) not in kept:
+                    self.retrieval_stats["filtered_results"] += 1
+                    self.retrieval_stats["tokens_saved"] += count_tokens(ProfessionalMemory.format_result(i, result))
+            memory = filtered
+        self.retrieval_stats["context_tokens"] += count_tokens(memory.to_prompt_context())
+        return memory
+
+    def get_retrieval_stats(self) -> Dict[str, Any]:
+        """返回检索门控与筛选的统计：检索次数、跳过次数、筛除片段数及节省的 Prompt token 数。"""
+        stats: Dict[str, Any] = dict(self.retrieval_stats)
+        total = stats["retrievals"] + stats["skipped"]
+        stats["skip_rate"] = stats["skipped"] / total if total else 0.0
+        return stats
+
     def retrieve_professional_memory(self, query: str) -> ProfessionalMemory:
         """
-        检索 Professional Memory。
+        检索 Professional Memory。经过检索门控（可能直接返回空结果）与结果筛选策略。
         """
         if not self.role.professional_knowledge_path:
             print("警告: 未在角色配置中找到 professional_knowledge_path。无法进行专业记忆检索。")
             return ProfessionalMemory()
+        if not self.gate_retrieval(query):
+            return ProfessionalMemory()
             
-        return self.rag_system.retrieve(
+        memory = self.rag_system.retrieve(
             query=query,
-            knowledge_path=self.role.professional_knowledge_path
+            knowledge_path=self.role.professional_knowledge_path,
+            top_k=self.retrieval_top_k
         )
+        return self.filter_professional_memory(memory)
 
-    def fuse_memory_for_prompt(self, user_query: str) -> str:
+    async def aretrieve_professional_memory(self, query: str) -> ProfessionalMemory:
+        """
+        retrieve_professional_memory 的异步版本。
+        """
+        if not self.role.professional_knowledge_path:
+            print("警告: 未在角色配置中找到 professional_knowledge_path。无法进行专业记忆检索。")
+            return ProfessionalMemory()
+        if not self.gate_retrieval(query):
+            return ProfessionalMemory()
+
+        memory = await self.rag_system.aretrieve(
+            query=query,
+            knowledge_path=self.role.professional_knowledge_path,
+            top_k=self.retrieval_top_k
+        )
+        return self.filter_professional_memory(memory)
+
+    def warmup(self):
+        """
+        预热 RAG 系统（加载嵌入模型、打开角色知识库 Collection），将启动开销提前支付。
+        """
+        self.rag_system.warmup(self.role.professional_knowledge_path)
+
+    def fuse_memory_for_prompt(self, user_query: str, professional_memory: Optional[ProfessionalMemory] = None) -> str:
         """
         记忆融合：将所有记忆类型融合为一个完整的 Prompt 上下文。
+
+        :param professional_memory: 已检索好的专业记忆（如异步流程中并发检索的结果）；
+            为 None 时在此同步检索。
         """
+        if self.prompt_budget is not None:
+            return self.fuse_memory_for_prompt_budgeted(user_query, self.prompt_budget, professional_memory).prompt
+
         role_context = f"你的身份和核心指令：\n{self.role.system_prompt}\n\n"
         active_context = self.get_active_memory_context()
         dialogue_context = self.get_recent_dialogue(n=5)
-        professional_memory = self.retrieve_professional_memory(user_query)
+        if professional_memory is None:
+            professional_memory = self.retrieve_professional_memory(user_query)
         professional_context = professional_memory.to_prompt_context()
         
         fused_prompt = (
@@ -96,3 +362,165 @@ class MemoryManager:
         )
         
         return fused_prompt
+
+    def fuse_memory_for_prompt_budgeted(self, user_query: str, budget: PromptBudget,
+                                        professional_memory: Optional[ProfessionalMemory] = None) -> FusedPrompt:
+        """
+        预算模式的记忆融合：用户问题与回答指令始终保留，其余 token 按 budget 中各片段
+        （role / active / dialogue / professional）的份额与优先级分配，超出部分截断或整体丢弃。
+        对话历史优先保留最近的消息，专业知识和激活记忆优先保留靠前的条目。
+
+        :return: FusedPrompt，包含融合后的 Prompt 以及各片段使用的 token 数。
+        """
+        self.last_prompt_report = self._fuse_budgeted(user_query, budget, professional_memory)
+        return self.last_prompt_report
+
+    def _fuse_budgeted(self, user_query: str, budget: PromptBudget,
+                       professional_memory: Optional[ProfessionalMemory] = None) -> FusedPrompt:
+        if professional_memory is None:
+            professional_memory = self.retrieve_professional_memory(user_query)
+
+        query_context = (
+            f"用户当前的问题是：{user_query}\n\n"
+            "请根据上述所有信息，以你设定的角色身份，给出专业、个性化且连贯的回答。"
+        )
+        sections = self._build_prompt_sections(professional_memory, budget)
+        query_tokens = count_tokens(query_context)
+        texts, used, dropped, truncated = fit_sections(sections, budget, budget.total_tokens - query_tokens)
+
+        prompt = "".join(texts[section.name] for section in sections) + query_context
+        used["query"] = query_tokens
+        return FusedPrompt(
+            prompt=prompt,
+            section_tokens=used,
+            total_tokens=sum(used.values()),
+            dropped_sections=dropped,
+            truncated_sections=truncated
+        )
+
+    def fuse_memory_for_messages(self, user_query: str, professional_memory: Optional[ProfessionalMemory] = None,
+                                 history_messages: int = 4, compare_legacy: Optional[bool] = None) -> FusedMessages:
+        """
+        多轮消息模式的记忆融合，按变化频率从低到高排列，便于服务端前缀缓存命中：
+
+        1. system：角色指令 + 激活记忆（不含访问时间，内容不变时逐字节稳定）；
+        2. history：真实的历史对话轮次，而非拼接进单条 user 消息；
+        3. user：本轮检索到的专业知识 + 当前问题。
+
+        历史窗口的起点按 history_messages 对齐，窗口只在每 history_messages 条消息后整体
+        前移一次，其间每轮请求只是在上一轮的消息列表后追加，前缀保持不变。
+        需在当前用户消息写入对话记忆后调用（与 fuse_memory_for_prompt 相同）。
+
+        :param history_messages: 纳入的历史消息条数下限（实际为 history_messages 到 2 * history_messages - 1 条）。
+        :param compare_legacy: 是否额外执行单条 Prompt 融合以计算 legacy_tokens / saved_tokens；
+            None 时取 compare_legacy_prompt（默认关闭）。不会修改 last_prompt_report。
+        :return: FusedMessages，附带前缀复用 token 数；开启对比时还包含相对单条 Prompt 模式每轮少发送的
+            未缓存 token 数（saved_tokens）。
+        """
+        if professional_memory is None:
+            professional_memory = self.retrieve_professional_memory(user_query)
+
+        system_prompt = f"{self.role.system_prompt}\n\n"
+        active_items = self.active_memory.context_items()
+        if active_items:
+            system_prompt += "--- 高频激活记忆 (用户偏好/近期信息) ---\n"
+            for item in active_items:
+                system_prompt += f"{item.key}: {item.value}\n"
+            system_prompt += "--------------------------------------\n"
+
+        # 当前问题已写入对话记忆，作为最后一条消息，不计入历史
+        prior_count = self.dialogue_window.total_count
+        recent = self.dialogue_window.recent(1)
+        if recent and recent[-1].sender == "user" and recent[-1].content == user_query:
+            prior_count -= 1
+        if history_messages > 0:
+            start = max(prior_count - history_messages, 0) // history_messages * history_messages
+        else:
+            start = prior_count
+        history = [
+            {"role": "assistant" if msg.sender == "assistant" else "user", "content": msg.content}
+            for msg in self.dialogue_window.load_page(start, prior_count - start)
+        ] if prior_count > start else []
+
+        user_prompt = (
+            f"{professional_memory.to_prompt_context()}"
+            f"用户当前的问题是：{user_query}\n\n"
+            "请根据上述所有信息，以你设定的角色身份，给出专业、个性化且连贯的回答。"
+        )
+
+        # 统计：与上一轮逐条相同的前缀消息可命中服务端前缀缓存
+        prefix_messages = [{"role": "system", "content": system_prompt}] + history
+        prefix_tokens = 0
+        for previous, current in zip(self._last_prefix_messages, prefix_messages):
+            if previous != current:
+                break
+            prefix_tokens += count_tokens(current["content"])
+        self._last_prefix_messages = prefix_messages + [{"role": "user", "content": user_prompt}]
+
+        # 每轮都不同的文本直接计数，不进入 count_tokens 的缓存
+        tokenizer = get_tokenizer()
+        total_tokens = sum(count_tokens(message["content"]) for message in prefix_messages) + tokenizer(user_prompt)
+        self.last_message_report = FusedMessages(
+            system_prompt=system_prompt,
+            history=history,
+            user_prompt=user_prompt,
+            total_tokens=total_tokens,
+            prefix_tokens=prefix_tokens
+        )
+
+        if compare_legacy if compare_legacy is not None else self.compare_legacy_prompt:
+            # 单条 Prompt 模式：system_prompt 单独发送（可缓存），且在每轮变化的融合 Prompt 中重复一次
+            if self.prompt_budget is not None:
+                legacy_prompt = self._fuse_budgeted(user_query, self.prompt_budget, professional_memory).prompt
+            else:
+                legacy_prompt = self.fuse_memory_for_prompt(user_query, professional_memory=professional_memory)
+            legacy_uncached = tokenizer(legacy_prompt)
+            self.last_message_report.legacy_tokens = count_tokens(self.role.system_prompt) + legacy_uncached
+            self.last_message_report.saved_tokens = legacy_uncached - (total_tokens - prefix_tokens)
+        return self.last_message_report
+
+    def _build_prompt_sections(self, professional_memory: ProfessionalMemory, budget: PromptBudget):
+        """将各类记忆拆分为可按单元截断的片段，格式与 fuse_memory_for_prompt 一致。"""
+        role_section = PromptSection(
+            name="role", header="你的身份和核心指令：\n", units=[self.role.system_prompt], footer="\n\n"
+        )
+
+        # 按排名排列，预算不足时优先丢弃排名靠后的条目
+        active_items = self.active_memory.ranked_items(self.active_memory.config.context_items)
+        if active_items:
+            active_section = PromptSection(
+                name="active",
+                header="--- 高频激活记忆 (用户偏好/近期信息) ---\n",
+                units=[self._format_active_item(item.key, item) for item in active_items],
+                footer="--------------------------------------\n"
+            )
+        else:
+            active_section = PromptSection(name="active", units=["无高频激活记忆。"])
+
+        dialogue_section = PromptSection(
+            name="dialogue",
+            header="--- 最近对话历史 ---\n",
+            units=[self._format_message(msg) for msg in self.dialogue_window.recent(budget.dialogue_messages)],
+            footer="----------------------\n",
+            keep="tail"
+        )
+
+        if professional_memory.results:
+            professional_section = PromptSection(
+                name="professional",
+                header="以下是与用户查询相关的专业知识片段，请参考并融合到你的回答中：\n",
+                units=[ProfessionalMemory.format_result(i, result) for i, result in enumerate(professional_memory.results)],
+                footer="------------------------\n"
+            )
+        else:
+            professional_section = PromptSection(name="professional", units=["无相关专业知识。"])
+
+        return [role_section, active_section, dialogue_section, professional_section]
+
+    @staticmethod
+    def _format_message(msg) -> str:
+        return f"[{msg.timestamp.strftime('%H:%M')}] {msg.sender.capitalize()}: {msg.content}\n"
+
+    @staticmethod
+    def _format_active_item(key: str, item) -> str:
+        return f"{key}: {item.value} (最后访问: {item.last_accessed.strftime('%Y-%m-%d %H:%M')})\n"
@@ -0,0 +1,284 @@
+import os
+import json
+import time
+import uuid
+import argparse
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from .persistence import ProfessionalMemoryRAG
+from .file_lock import atomic_write, file_lock
+from .types import ProfessionalMemory, ProfessionalMemoryResult
+from .embedding_cache import EmbeddingCache
+from .rag_utils import (
+    CHROMA_REGISTRY, DEFAULT_EMBEDDING_MODEL, SHARED_EMBEDDING_CACHE, ChromaDBRAG, get_default_embedding_function
+)
+
+# 存储格式：每个知识库（knowledge_path）对应两个文件
+#   {knowledge_path}.{vectors_id}.npy —— 归一化后的 float32 嵌入矩阵，形状 (n, dim)，以 mmap 只读打开；
+#                                       每次导出使用新的 vectors_id，文件写入后不再修改
+#   {knowledge_path}.json             —— 元数据：index_version、嵌入模型、vectors_file（对应的 .npy 文件名）、
+#                                       ids、documents、metadatas
+# 元数据指明自己对应的 .npy 文件，读取方不会把新导出的向量与旧的文档配对。
+# 版本 1 的存储（固定的 {knowledge_path}.npy，元数据中无 vectors_file）仍可读取。
+NUMPY_STORE_VERSION = 2
+
+def _store_files(store_path: str, knowledge_path: str) -> Tuple[str, str]:
+    """返回 (版本 1 的 .npy 路径, 元数据路径)。"""
+    base = os.path.join(store_path, knowledge_path)
+    return f"{base}.npy", f"{base}.json"
+
+def _vectors_path(meta_path: str, meta: Dict[str, Any]) -> str:
+    vectors_file = meta.get("vectors_file")
+    if vectors_file is None:
+        return f"{meta_path[:-len('.json')]}.npy"
+    return os.path.join(os.path.dirname(meta_path), vectors_file)
+
+def _read_meta(meta_path: str) -> Optional[Dict[str, Any]]:
+    try:
+        with open(meta_path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return None
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+def write_numpy_store(store_path: str, knowledge_path: str, embeddings: np.ndarray,
+                      ids: List[str], documents: List[str], metadatas: List[Dict[str, Any]],
+                      index_version: Optional[str] = None) -> str:
+    """
+    写入（覆盖）一个知识库的向量存储。嵌入矩阵写入本次导出专用的新文件，再原子替换指向它的元数据，
+    正在读取旧文件的进程不受影响；同一知识库的并发导出按文件锁串行执行。
+    替换完成后删除上一次导出的嵌入文件（已 mmap 打开的读取方在 POSIX 上不受影响）。
+    :return: 新的 index_version。
+    """
+    os.makedirs(store_path, exist_ok=True)
+    legacy_npy_path, meta_path = _store_files(store_path, knowledge_path)
+    vectors_file = f"{os.path.basename(legacy_npy_path)[:-len('.npy')]}.{uuid.uuid4().hex}.npy"
+    npy_path = os.path.join(os.path.dirname(meta_path), vectors_file)
+    embeddings = _normalize(np.asarray(embeddings, dtype=np.float32).reshape(len(ids), -1))
+    index_version = index_version or uuid.uuid4().hex
+
+    meta = json.dumps({
+        "format_version": NUMPY_STORE_VERSION,
+        "index_version": index_version,
+        "embedding_model": DEFAULT_EMBEDDING_MODEL,
+        "dim": int(embeddings.shape[1]) if len(ids) else 0,
+        "vectors_file": vectors_file,
+        "ids": ids,
+        "documents": documents,
+        "metadatas": metadatas,
+    }, ensure_ascii=False).encode('utf-8')
+    with file_lock(f"{meta_path}.lock"):
+        previous = _read_meta(meta_path)
+        with atomic_write(npy_path) as f:
+            np.save(f, embeddings)
+        # 元数据最后替换：读取方以元数据文件的变化作为重新加载的信号
+        with atomic_write(meta_path) as f:
+            f.write(meta)
+        stale = {legacy_npy_path}
+        if previous is not None:
+            stale.add(_vectors_path(meta_path, previous))
+        for path in stale - {npy_path}:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+    return index_version
+
+class _LoadedIndex:
+    """已加载的知识库：mmap 嵌入矩阵 + 元数据。"""
+    def __init__(self, meta_path: str):
+        # 先打开再 stat：记录的标识与读到的内容来自同一个文件（替换后 inode 改变）
+        with open(meta_path, 'r', encoding='utf-8') as f:
+            stat = os.fstat(f.fileno())
+            meta = json.load(f)
+        self.file_id = (stat.st_ino, stat.st_mtime_ns)
+        self.index_version: Optional[str] = meta.get("index_version")
+        self.documents: List[str] = meta["documents"]
+        self.metadatas: List[Dict[str, Any]] = meta["metadatas"]
+        # 只读 mmap：多个工作进程共享操作系统页缓存中的同一份数据
+        npy_path = _vectors_path(meta_path, meta)
+        self.embeddings = np.load(npy_path, mmap_mode='r') if self.documents else np.zeros((0, 0), dtype=np.float32)
+        if self.embeddings.shape[0] != len(self.documents):
+            raise ValueError(f"向量存储 {npy_path} 与元数据条数不一致（可能正在被重新导出）")
+
+class NumpyVectorRAG(ProfessionalMemoryRAG):
+    """
+    进程内的精确向量检索实现，适用于数百到数千个分块的小型角色知识库。
+
+    嵌入以归一化 float32 矩阵存放在 mmap 只读打开的 .npy 文件中，检索为一次向量化点积
+    （余弦相似度）加 argpartition 取 top-k，无需 Chroma 的 SQLite / HNSW / 客户端开销。
+    元数据文件被替换（重新导出）后自动重新加载。score 为余弦相似度。
+    """
+    def __init__(self, store_path: str = "data/vector_store", embedding_cache: Optional[EmbeddingCache] = None):
+        self.store_path = store_path
+        self.embedding_cache = embedding_cache if embedding_cache is not None else SHARED_EMBEDDING_CACHE
+        self._lock = threading.Lock()
+        self._indexes: Dict[str, _LoadedIndex] = {}
+
+    def _get_index(self, knowledge_path: str) -> _LoadedIndex:
+        _, meta_path = _store_files(self.store_path, knowledge_path)
+        stat = os.stat(meta_path)
+        index = self._indexes.get(knowledge_path)
+        if index is None or index.file_id != (stat.st_ino, stat.st_mtime_ns):
+            try:
+                index = _LoadedIndex(meta_path)
+            except FileNotFoundError:
+                # 读取元数据后、打开嵌入文件前恰好完成了一次重新导出（旧嵌入文件已删除），重读新的元数据
+                index = _LoadedIndex(meta_path)
+            with self._lock:
+                self._indexes[knowledge_path] = index
+        return index
+
+    def warmup(self, knowledge_path: Optional[str] = None):
+        """加载嵌入模型，并将 knowledge_path 的嵌入矩阵读入页缓存。"""
+        get_default_embedding_function()(["warmup"])
+        if knowledge_path:
+            try:
+                index = self._get_index(knowledge_path)
+                float(np.asarray(index.embeddings).sum())
+            except Exception as e:
+                print(f"Error loading vector store {knowledge_path}: {e}")
+
+    def store_identity(self) -> Tuple[str, str]:
+        return "numpy", os.path.abspath(self.store_path)
+
+    def index_version(self, knowledge_path: str) -> Optional[str]:
+        try:
+            return self._get_index(knowledge_path).index_version
+        except Exception:
+            return None
+
+    def retrieve(self, query: str, knowledge_path: str, top_k: int = 3) -> ProfessionalMemory:
+        """
+        根据查询和知识路径进行精确向量检索。
+        """
+        return self.retrieve_many([query], knowledge_path, top_k)[0]
+
+    def retrieve_many(self, queries: List[str], knowledge_path: str, top_k: int = 3) -> List[ProfessionalMemory]:
+        if not queries:
+            return []
+        try:
+            index = self._get_index(knowledge_path)
+        except Exception as e:
+            print(f"Error loading vector store {knowledge_path}: {e}")
+            return [ProfessionalMemory(error=str(e)) for _ in queries]
+
+        n = len(index.documents)
+        if n == 0 or top_k <= 0:
+            return [ProfessionalMemory() for _ in queries]
+
+        query_vectors = np.asarray(
+            self.embedding_cache.get_or_compute(DEFAULT_EMBEDDING_MODEL, queries, get_default_embedding_function()),
+            dtype=np.float32
+        )
+        scores = _normalize(query_vectors) @ index.embeddings.T
+
+        k = min(top_k, n)
+        if k < n:
+            candidates = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        else:
+            candidates = np.tile(np.arange(n), (len(queries), 1))
+
+        memories: List[ProfessionalMemory] = []
+        for row, row_candidates in zip(scores, candidates):
+            ranked = row_candidates[np.argsort(-row[row_candidates])]
+            memories.append(ProfessionalMemory(results=[
+                ProfessionalMemoryResult(
+                    content=index.documents[i],
+                    source=index.metadatas[i].get('source', 'N/A'),
+                    score=float(row[i])
+                )
+                for i in ranked
+            ]))
+        return memories
+
+def export_chroma_collection(collection_name: str, db_path: str = "data/chroma_db",
+                             store_path: str = "data/vector_store", page_size: int = 1000) -> int:
+    """
+    将已有的 ChromaDB Collection（嵌入、文档与元数据）导出为 NumpyVectorRAG 的存储格式，
+    沿用 Collection 的 index_version。
+    :return: 导出的分块数。
+    """
+    collection = CHROMA_REGISTRY.get_client(db_path).get_collection(name=collection_name)
+    ids: List[str] = []
+    documents: List[str] = []
+    metadatas: List[Dict[str, Any]] = []
+    embeddings: List[np.ndarray] = []
+
+    offset = 0
+    while True:
+        page = collection.get(
+            include=['embeddings', 'documents', 'metadatas'], limit=page_size, offset=offset
+        )
+        if not page['ids']:
+            break
+        ids.extend(page['ids'])
+        documents.extend(page['documents'])
+        metadatas.extend(meta or {} for meta in page['metadatas'])
+        embeddings.append(np.asarray(page['embeddings'], dtype=np.float32))
+        offset += len(page['ids'])
+
+    matrix = np.concatenate(embeddings) if embeddings else np.zeros((0, 0), dtype=np.float32)
+    write_numpy_store(
+        store_path, collection_name, matrix, ids, documents, metadatas,
+        index_version=(collection.metadata or {}).get("index_version")
+    )
+    print(f"已导出 {len(ids)} 个分块: {collection_name} -> {store_path}")
+    return len(ids)
+
+def benchmark(collection_name: str, queries: List[str], db_path: str = "data/chroma_db",
+              store_path: str = "data/vector_store", top_k: int = 3, rounds: int = 20) -> Dict[str, Dict[str, float]]:
+    """
+    比较 ChromaDBRAG 与 NumpyVectorRAG 的检索延迟（毫秒）。
+    查询嵌入预先写入缓存，计时只包含检索本身。
+    """
+    embedding_cache = EmbeddingCache(max_size=max(len(queries), 1))
+    systems = {
+        "chroma": ChromaDBRAG(db_path, embedding_cache=embedding_cache),
+        "numpy": NumpyVectorRAG(store_path, embedding_cache=embedding_cache),
+    }
+    for rag in systems.values():
+        rag.warmup(collection_name)
+        rag.retrieve_many(queries, collection_name, top_k)
+
+    report = {}
+    for name, rag in systems.items():
+        latencies = []
+        for _ in range(rounds):
+            for query in queries:
+                started = time.perf_counter()
+                rag.retrieve(query, collection_name, top_k)
+                latencies.append((time.perf_counter() - started) * 1000)
+        latencies.sort()
+        report[name] = {
+            "p50_ms": round(latencies[len(latencies) // 2], 3),
+            "p95_ms": round(latencies[int(len(latencies) * 0.95)], 3),
+            "mean_ms": round(sum(latencies) / len(latencies), 3),
+        }
+        print(f"[{name}] p50={report[name]['p50_ms']}ms p95={report[name]['p95_ms']}ms mean={report[name]['mean_ms']}ms")
+    return report
+
+if __name__ == '__main__':
+    # 导出：python -m memory.numpy_store export <collection_name>
+    # 基准：python -m memory.numpy_store benchmark <collection_name> --query ...
+    parser = argparse.ArgumentParser(description="NumPy 内存映射向量存储：从 ChromaDB 导出与延迟基准")
+    parser.add_argument("command", choices=["export", "benchmark"])
+    parser.add_argument("collection_name", help="Collection 名称（角色的 knowledge_path）")
+    parser.add_argument("--db-path", default="data/chroma_db", help="ChromaDB 存储路径")
+    parser.add_argument("--store-path", default="data/vector_store", help="NumPy 向量存储目录")
+    parser.add_argument("--query", action="append", help="基准测试查询，可重复指定")
+    parser.add_argument("--rounds", type=int, default=20, help="基准测试轮数")
+    args = parser.parse_args()
+
+    if args.command == "export":
+        export_chroma_collection(args.collection_name, db_path=args.db_path, store_path=args.store_path)
+    else:
+        benchmark(args.collection_name, args.query or ["我最近总是感觉疲惫", "如何改善睡眠", "饮食建议"],
+                  db_path=args.db_path, store_path=args.store_path, rounds=args.rounds)
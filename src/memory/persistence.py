@@ -1,8 +1,20 @@
 from abc import ABC, abstractmethod
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, List, Iterable, Tuple, Union
 import os
-import json
-from memory.types import DialogueMemory, ActiveMemory, ProfessionalMemory
+import uuid
+import asyncio
+import argparse
+import threading
+from memory.types import DialogueMemory, ActiveMemory, ProfessionalMemory, Message
+from memory.codecs import Codec, SNAPSHOT_EXTENSIONS, decode_auto, fastest_json_codec, resolve_codec
+from memory.file_lock import atomic_write, file_lock
+
+# 追加式对话日志的格式标识与版本（写入日志首行的 header 中）
+DIALOGUE_LOG_FORMAT = "dialogue_log"
+DIALOGUE_LOG_VERSION = 1
+
+class PersistenceConflictError(RuntimeError):
+    """整体覆盖写入时发现文件在本进程加载之后已被其他进程修改（乐观版本检查失败）。"""
 
 class PersistenceLayer(ABC):
     """
@@ -19,6 +31,57 @@ class PersistenceLayer(ABC):
         """保存对话记忆。"""
         pass
 
+    def append_dialogue_message(self, memory: DialogueMemory, message: Message):
+        """
+        追加一条新消息到对话记忆。
+        默认实现退化为整体保存；支持增量写入的实现应覆盖此方法。
+        """
+        self.save_dialogue_memory(memory)
+
+    def append_dialogue_messages(self, memory: DialogueMemory, messages: List[Message]):
+        """
+        批量追加多条消息（如写回模式合并后的写入）。
+        默认逐条调用 append_dialogue_message；支持批量写入的实现应覆盖此方法。
+        """
+        for message in messages:
+            self.append_dialogue_message(memory, message)
+
+    async def aappend_dialogue_message(self, memory: DialogueMemory, message: Message):
+        """
+        append_dialogue_message 的异步版本。默认在线程池中执行同步写入，避免阻塞事件循环。
+        """
+        await asyncio.to_thread(self.append_dialogue_message, memory, message)
+
+    def load_recent_messages(self, user_id: str, role_id: str, n: int) -> List[Message]:
+        """
+        加载最近 n 条消息（按时间正序返回）。
+        默认实现加载完整历史后切片；支持尾部读取的实现应覆盖此方法。
+        """
+        if n <= 0:
+            return []
+        return self.load_dialogue_memory(user_id, role_id).messages[-n:]
+
+    def load_messages(self, user_id: str, role_id: str, offset: int = 0, limit: Optional[int] = None) -> List[Message]:
+        """
+        分页加载对话历史（按时间正序，offset 从最早的消息开始计数）。
+        默认实现加载完整历史后切片；支持分页查询的实现应覆盖此方法。
+        """
+        messages = self.load_dialogue_memory(user_id, role_id).messages
+        end = None if limit is None else offset + limit
+        return messages[offset:end]
+
+    def count_messages(self, user_id: str, role_id: str) -> int:
+        """统计指定用户和角色的对话消息数量。"""
+        return len(self.load_dialogue_memory(user_id, role_id).messages)
+
+    @property
+    def supports_partial_dialogue(self) -> bool:
+        """
+        是否支持只持有部分对话历史的记忆实例（即追加写入不依赖内存中的完整历史）。
+        为 False 时，调用方必须在内存中保留完整的 DialogueMemory。
+        """
+        return False
+
     @abstractmethod
     def load_active_memory(self, user_id: str, role_id: str) -> Optional[ActiveMemory]:
         """加载指定用户和角色的激活记忆。"""
@@ -29,50 +92,384 @@ class PersistenceLayer(ABC):
         """保存激活记忆。"""
         pass
 
+    def save_active_memory_item(self, memory: ActiveMemory, key: str):
+        """
+        保存激活记忆中的单个键（键已被删除时同步删除）。
+        默认实现退化为整体保存；按行存储的实现应覆盖此方法。
+        """
+        self.save_active_memory(memory)
+
+    def save_active_memory_items(self, memory: ActiveMemory, keys: Iterable[str]):
+        """
+        保存激活记忆中的若干个键（已被删除的键同步删除），不影响存储中的其他键。
+        默认实现：单个键调用 save_active_memory_item，多个键整体保存。
+        """
+        keys = list(keys)
+        if len(keys) == 1:
+            self.save_active_memory_item(memory, keys[0])
+        elif keys:
+            self.save_active_memory(memory)
+
+    async def asave_active_memory(self, memory: ActiveMemory):
+        """save_active_memory 的异步版本。默认在线程池中执行同步写入。"""
+        await asyncio.to_thread(self.save_active_memory, memory)
+
+    async def asave_active_memory_item(self, memory: ActiveMemory, key: str):
+        """save_active_memory_item 的异步版本。默认在线程池中执行同步写入。"""
+        await asyncio.to_thread(self.save_active_memory_item, memory, key)
+
 class FilePersistenceLayer(PersistenceLayer):
     """
     基于文件的简单持久化实现（用于快速原型和演示）。
+
+    对话记忆默认以追加式 JSONL 日志存储：首行为 header，其后每行一条消息，
+    每轮对话只追加新消息而不重写完整历史。旧版整体 JSON 文件仍可读取，
+    并会在首次追加或执行迁移命令时转换为日志格式。
+
+    激活记忆（以及 dialogue_format="json" 时的对话记忆）以整体快照保存，格式由 codec 决定：
+    json（紧凑）、json-pretty（旧版缩进格式）、orjson、msgspec 或二进制 msgpack。
+    加载时按文件内容自动识别格式，切换编解码器后旧文件仍可读取，下次保存时转换为新格式。
+
+    多进程安全：同一 (user_id, role_id) 的所有写入持有该会话的建议文件锁（超时抛出 LockTimeout）；
+    整体写入先写临时文件再原子替换，读取方不会看到写了一半的文件。按键保存激活记忆、
+    json 格式下追加消息均在锁内"读取最新-合并-写回"，不会覆盖其他进程的变更；整体保存
+    （save_active_memory、save_dialogue_memory）对加载时记录的文件版本做乐观检查，文件已被
+    其他进程修改时抛出 PersistenceConflictError。
     """
-    def __init__(self, base_path: str = "data/memory_store"):
+    def __init__(self, base_path: str = "data/memory_store", dialogue_format: str = "jsonl",
+                 codec: Union[str, Codec] = "json", lock_timeout: float = 10.0):
+        """
+        :param lock_timeout: 等待会话文件锁的最长时间（秒）。
+        """
+        if dialogue_format not in ("jsonl", "json"):
+            raise ValueError(f"不支持的对话记忆格式: {dialogue_format}")
         self.base_path = base_path
+        self.dialogue_format = dialogue_format
+        self.codec = resolve_codec(codec)
+        # JSONL 日志逐行编解码：文本编解码器直接使用，二进制编解码器时使用最快的 JSON 实现
+        self._line_codec = self.codec if self.codec.text else fastest_json_codec()
+        self.lock_timeout = lock_timeout
+        # 本进程最近一次加载/写入时各文件的版本 (inode, mtime_ns, size)，None 表示加载时文件不存在；
+        # 用于乐观并发检查
+        self._versions: Dict[str, Optional[Tuple[int, int, int]]] = {}
+        self._versions_lock = threading.Lock()
         os.makedirs(self.base_path, exist_ok=True)
 
-    def _get_path(self, user_id: str, role_id: str, memory_type: str) -> str:
+    def _session_lock(self, user_id: str, role_id: str):
+        """会话级排他文件锁（同一线程内可重入）。"""
+        return file_lock(os.path.join(self.base_path, f"{role_id}_{user_id}.lock"), timeout=self.lock_timeout)
+
+    @staticmethod
+    def _version_of(stat: os.stat_result) -> Tuple[int, int, int]:
+        # 原子替换会产生新的 inode，追加会改变大小和修改时间
+        return (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+
+    def _remember_version(self, path: str, stat: Optional[os.stat_result] = None):
+        try:
+            version = self._version_of(stat if stat is not None else os.stat(path))
+        except FileNotFoundError:
+            version = None
+        with self._versions_lock:
+            self._versions[path] = version
+
+    def _check_version(self, path: str):
+        """整体覆盖 path 前检查它在本进程上次加载/写入之后是否被其他进程修改（调用方需持有会话锁）。"""
+        with self._versions_lock:
+            if path not in self._versions:
+                return
+            expected = self._versions[path]
+        try:
+            current = self._version_of(os.stat(path))
+        except FileNotFoundError:
+            current = None
+        if current != expected:
+            raise PersistenceConflictError(f"{path} 在加载后已被其他进程修改，请重新加载后再保存")
+
+    def _get_path(self, user_id: str, role_id: str, memory_type: str, ext: str = "json") -> str:
         """获取记忆文件的路径。"""
-        return os.path.join(self.base_path, f"{role_id}_{user_id}_{memory_type}.json")
+        return os.path.join(self.base_path, f"{role_id}_{user_id}_{memory_type}.{ext}")
+
+    def _get_log_path(self, user_id: str, role_id: str) -> str:
+        """获取追加式对话日志的路径。"""
+        return self._get_path(user_id, role_id, "dialogue", ext="jsonl")
+
+    def _find_snapshot(self, user_id: str, role_id: str, memory_type: str) -> Optional[str]:
+        """查找已有的快照文件，优先当前编解码器的扩展名。"""
+        extensions = [self.codec.extension] + [ext for ext in SNAPSHOT_EXTENSIONS if ext != self.codec.extension]
+        for ext in extensions:
+            path = self._get_path(user_id, role_id, memory_type, ext=ext)
+            if os.path.exists(path):
+                return path
+        return None
+
+    def _remove_snapshots(self, user_id: str, role_id: str, memory_type: str, keep: Optional[str] = None):
+        for ext in SNAPSHOT_EXTENSIONS:
+            path = self._get_path(user_id, role_id, memory_type, ext=ext)
+            if path != keep and os.path.exists(path):
+                os.remove(path)
+                with self._versions_lock:
+                    self._versions.pop(path, None)
 
     def load_dialogue_memory(self, user_id: str, role_id: str) -> Optional[DialogueMemory]:
-        path = self._get_path(user_id, role_id, "dialogue")
-        return self._load_memory(path, DialogueMemory, user_id, role_id)
+        log_path = self._get_log_path(user_id, role_id)
+        if os.path.exists(log_path):
+            return self._load_dialogue_log(log_path, user_id, role_id)
+        self._remember_version(log_path)
+        return self._load_memory(DialogueMemory, user_id, role_id, "dialogue")
 
     def save_dialogue_memory(self, memory: DialogueMemory):
-        path = self._get_path(memory.user_id, memory.role_id, "dialogue")
-        self._save_memory(path, memory)
+        if self.dialogue_format == "jsonl":
+            self._write_dialogue_log(memory)
+            return
+        self._save_memory(memory, "dialogue")
+
+    def append_dialogue_message(self, memory: DialogueMemory, message: Message):
+        self.append_dialogue_messages(memory, [message])
+
+    def append_dialogue_messages(self, memory: DialogueMemory, messages: List[Message]):
+        if not messages:
+            return
+        with self._session_lock(memory.user_id, memory.role_id):
+            if self.dialogue_format != "jsonl":
+                # 在锁内读取磁盘上的最新历史并追加，不会覆盖其他进程追加的消息
+                latest = self._load_memory(DialogueMemory, memory.user_id, memory.role_id, "dialogue")
+                latest.messages.extend(messages)
+                latest.last_updated = memory.last_updated
+                self._save_memory(latest, "dialogue")
+                return
+            self._append_log(memory, messages)
+
+    def _append_log(self, memory: DialogueMemory, messages: List[Message]):
+        # 调用方需持有会话锁
+        log_path = self._get_log_path(memory.user_id, memory.role_id)
+        if not os.path.exists(log_path):
+            if self._find_snapshot(memory.user_id, memory.role_id, "dialogue") is not None:
+                # 旧版 JSON 文件：从磁盘迁移完整历史（内存中可能只有最近窗口）
+                self.compact_dialogue_memory(memory.user_id, memory.role_id)
+            else:
+                # 新会话：先写出仅含 header 的空日志
+                self._write_dialogue_log(DialogueMemory(user_id=memory.user_id, role_id=memory.role_id))
+
+        # 若上次追加被中断留下了不完整的尾行，先补换行，避免新消息与其粘连
+        with open(log_path, 'rb') as f:
+            f.seek(-1, os.SEEK_END)
+            torn = f.read(1) != b"\n"
+
+        # 多条消息合并为一次写入；若追加前的文件正是本进程记录的版本，同步更新版本
+        with self._versions_lock:
+            tracked = self._versions.get(log_path) == self._version_of(os.stat(log_path))
+        with open(log_path, 'ab') as f:
+            f.write((b"\n" if torn else b"") + b"".join(self._encode_message(message) for message in messages))
+        if tracked:
+            self._remember_version(log_path)
+
+    @property
+    def supports_partial_dialogue(self) -> bool:
+        return self.dialogue_format == "jsonl"
+
+    def load_recent_messages(self, user_id: str, role_id: str, n: int) -> List[Message]:
+        log_path = self._get_log_path(user_id, role_id)
+        if n <= 0 or not os.path.exists(log_path):
+            return super().load_recent_messages(user_id, role_id, n)
+        return self._parse_log_lines(self._read_tail_lines(log_path, n), log_path)[-n:]
+
+    def load_messages(self, user_id: str, role_id: str, offset: int = 0, limit: Optional[int] = None) -> List[Message]:
+        log_path = self._get_log_path(user_id, role_id)
+        if not os.path.exists(log_path):
+            return super().load_messages(user_id, role_id, offset, limit)
+
+        # 逐行跳过 offset 之前的消息，只解析目标页
+        lines = []
+        with open(log_path, 'r', encoding='utf-8') as f:
+            f.readline()
+            index = 0
+            for line in f:
+                if not line.strip():
+                    continue
+                if index >= offset:
+                    if limit is not None and len(lines) >= limit:
+                        break
+                    lines.append(line)
+                index += 1
+        return self._parse_log_lines(lines, log_path)
+
+    def count_messages(self, user_id: str, role_id: str) -> int:
+        log_path = self._get_log_path(user_id, role_id)
+        if not os.path.exists(log_path):
+            return super().count_messages(user_id, role_id)
+
+        # 统计完整的行数（不含 header），无需解析消息
+        count = 0
+        with open(log_path, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 16), b""):
+                count += block.count(b"\n")
+        return max(count - 1, 0)
 
     def load_active_memory(self, user_id: str, role_id: str) -> Optional[ActiveMemory]:
-        path = self._get_path(user_id, role_id, "active")
-        return self._load_memory(path, ActiveMemory, user_id, role_id)
+        return self._load_memory(ActiveMemory, user_id, role_id, "active")
 
     def save_active_memory(self, memory: ActiveMemory):
-        path = self._get_path(memory.user_id, memory.role_id, "active")
-        self._save_memory(path, memory)
+        self._save_memory(memory, "active")
+
+    def save_active_memory_item(self, memory: ActiveMemory, key: str):
+        self.save_active_memory_items(memory, [key])
+
+    def save_active_memory_items(self, memory: ActiveMemory, keys: Iterable[str]):
+        keys = list(keys)
+        if not keys:
+            return
+        with self._session_lock(memory.user_id, memory.role_id):
+            # 在锁内读取最新快照，只替换/删除这些键，保留其他进程写入的键
+            latest = self._load_memory(ActiveMemory, memory.user_id, memory.role_id, "active")
+            for key in keys:
+                item = memory.items.get(key)
+                if item is None:
+                    latest.items.pop(key, None)
+                else:
+                    latest.items[key] = item.model_copy()
+            self._save_memory(latest, "active")
+
+    def compact_dialogue_memory(self, user_id: str, role_id: str) -> DialogueMemory:
+        """
+        迁移/压缩单个会话的对话记忆：读取现有日志或旧版 JSON，
+        重写为一份干净的 JSONL 日志（去除损坏的尾行），并删除旧版 JSON 文件。
+        """
+        with self._session_lock(user_id, role_id):
+            memory = self.load_dialogue_memory(user_id, role_id)
+            self._write_dialogue_log(memory)
+        return memory
+
+    def migrate_dialogue_store(self) -> int:
+        """
+        将 base_path 下所有对话记忆迁移/压缩为 JSONL 日志格式。
+
+        :return: 处理的会话数量。
+        """
+        sessions = set()
+        for name in os.listdir(self.base_path):
+            if name.endswith("_dialogue.jsonl"):
+                ext = ".jsonl"
+            elif any(name.endswith(f"_dialogue.{snapshot_ext}") for snapshot_ext in SNAPSHOT_EXTENSIONS):
+                ext = os.path.splitext(name)[1]
+            else:
+                continue
+            session = self._read_session_ids(os.path.join(self.base_path, name), ext)
+            if session:
+                sessions.add(session)
+
+        for user_id, role_id in sorted(sessions):
+            self.compact_dialogue_memory(user_id, role_id)
+        return len(sessions)
+
+    def _read_session_ids(self, path: str, ext: str) -> Optional[Tuple[str, str]]:
+        """从记忆文件中读取 (user_id, role_id)，文件名中的下划线无法可靠拆分。"""
+        try:
+            with open(path, 'rb') as f:
+                data = self._line_codec.decode(f.readline()) if ext == ".jsonl" else decode_auto(f.read())
+            return data["user_id"], data["role_id"]
+        except (ValueError, KeyError) as e:
+            print(f"跳过无法识别的记忆文件 {path}: {e}")
+            return None
+
+    def _encode_message(self, message: Message) -> bytes:
+        return self._encode_record(message.model_dump(mode='json'))
+
+    def _encode_record(self, record: Dict[str, Any]) -> bytes:
+        return self._line_codec.encode(record) + b"\n"
+
+    def _write_dialogue_log(self, memory: DialogueMemory):
+        """整体写出对话日志（用于新建、迁移和压缩），在会话锁内写临时文件再原子替换。"""
+        log_path = self._get_log_path(memory.user_id, memory.role_id)
+        header = {
+            "format": DIALOGUE_LOG_FORMAT,
+            "version": DIALOGUE_LOG_VERSION,
+            "user_id": memory.user_id,
+            "role_id": memory.role_id,
+        }
+        with self._session_lock(memory.user_id, memory.role_id):
+            self._check_version(log_path)
+            with atomic_write(log_path) as f:
+                f.write(self._encode_record(header))
+                for record in memory.messages.records(mode='json'):
+                    f.write(self._encode_record(record))
+            self._remember_version(log_path)
+            self._remove_snapshots(memory.user_id, memory.role_id, "dialogue")
+
+    def _read_tail_lines(self, path: str, n: int, block_size: int = 8192) -> List[str]:
+        """从文件末尾向前按块读取，返回最后 n 行（不含 header），避免读取整个日志。"""
+        with open(path, 'rb') as f:
+            pos = f.seek(0, os.SEEK_END)
+            data = b""
+            while pos > 0 and data.count(b"\n") <= n:
+                read_size = min(block_size, pos)
+                pos -= read_size
+                f.seek(pos)
+                data = f.read(read_size) + data
+        # 首段要么是被截断的半行，要么（已读到文件开头时）是 header，均需丢弃
+        lines = data.split(b"\n")[1:]
+        return [line.decode('utf-8') for line in lines if line.strip()][-n:]
+
+    def _parse_log_lines(self, lines: List[str], path: str) -> List[Message]:
+        messages = []
+        for line in lines:
+            if not line.strip():
+                continue
+            try:
+                messages.append(Message.model_validate(self._line_codec.decode(line)))
+            except ValueError:
+                # 进程在追加过程中崩溃可能留下不完整的尾行，直接跳过
+                print(f"警告: 跳过对话日志 {path} 中损坏的行。")
+        return messages
+
+    def _load_dialogue_log(self, path: str, user_id: str, role_id: str) -> DialogueMemory:
+        memory = DialogueMemory(user_id=user_id, role_id=role_id)
+        with open(path, 'r', encoding='utf-8') as f:
+            # 读取前记录版本：读取期间其他进程追加的消息会使版本不一致，整体覆盖时保守地报告冲突
+            self._remember_version(path, os.fstat(f.fileno()))
+            header = self._line_codec.decode(f.readline())
+            if header.get("format") != DIALOGUE_LOG_FORMAT:
+                raise ValueError(f"无法识别的对话日志格式: {path}")
+            # 完整加载直接写入紧凑存储，不逐条创建 Message
+            messages = memory.messages
+            for line in f:
+                if not line.strip():
+                    continue
+                try:
+                    messages.append_record(self._line_codec.decode(line))
+                except ValueError:
+                    print(f"警告: 跳过对话日志 {path} 中损坏的行。")
+        if memory.messages:
+            memory.last_updated = memory.messages[-1].timestamp
+        return memory
 
-    def _load_memory(self, path: str, model_class, user_id: str, role_id: str):
-        if os.path.exists(path):
-            with open(path, 'r', encoding='utf-8') as f:
-                data = json.load(f)
+    def _load_memory(self, model_class, user_id: str, role_id: str, memory_type: str):
+        path = self._find_snapshot(user_id, role_id, memory_type)
+        if path is not None:
+            with open(path, 'rb') as f:
+                # 快照以原子替换写入，打开的文件即为完整的某个版本
+                self._remember_version(path, os.fstat(f.fileno()))
+                data = decode_auto(f.read())
             return model_class.model_validate(data)
         
-        # 如果文件不存在，返回一个新的空记忆实例
+        # 如果文件不存在，返回一个新的空记忆实例（记录"不存在"，之后若被其他进程创建则整体保存时报告冲突）
+        self._remember_version(self._get_path(user_id, role_id, memory_type, ext=self.codec.extension))
         if model_class == DialogueMemory:
             return DialogueMemory(user_id=user_id, role_id=role_id)
         elif model_class == ActiveMemory:
             return ActiveMemory(user_id=user_id, role_id=role_id)
         return None
 
-    def _save_memory(self, path: str, memory):
-        with open(path, 'w', encoding='utf-8') as f:
-            json.dump(memory.model_dump(mode='json'), f, ensure_ascii=False, indent=4)
+    def _save_memory(self, memory, memory_type: str):
+        path = self._get_path(memory.user_id, memory.role_id, memory_type, ext=self.codec.extension)
+        data = self.codec.encode(memory.model_dump(mode='json'))
+        with self._session_lock(memory.user_id, memory.role_id):
+            existing = self._find_snapshot(memory.user_id, memory.role_id, memory_type)
+            self._check_version(existing if existing is not None else path)
+            with atomic_write(path) as f:
+                f.write(data)
+            self._remember_version(path)
+            # 删除其他格式的旧快照，避免加载时读到过期文件
+            self._remove_snapshots(memory.user_id, memory.role_id, memory_type, keep=path)
 
 # ----------------------------------------------------------------------
 # 4. 专业记忆 RAG 抽象层
@@ -89,3 +486,55 @@ class ProfessionalMemoryRAG(ABC):
         返回 ProfessionalMemory 实例。
         """
         pass
+
+    async def aretrieve(self, query: str, knowledge_path: str, top_k: int = 3) -> ProfessionalMemory:
+        """
+        retrieve 的异步版本。默认在线程池中执行同步检索（向量库客户端通常是阻塞的）。
+        """
+        return await asyncio.to_thread(self.retrieve, query, knowledge_path, top_k)
+
+    def retrieve_many(self, queries: List[str], knowledge_path: str, top_k: int = 3) -> List[ProfessionalMemory]:
+        """
+        批量检索同一知识库的多条查询，结果与 queries 一一对应。
+        默认逐条调用 retrieve；支持批量嵌入与批量向量查询的实现应覆盖此方法。
+        """
+        return [self.retrieve(query, knowledge_path, top_k) for query in queries]
+
+    async def aretrieve_many(self, queries: List[str], knowledge_path: str, top_k: int = 3) -> List[ProfessionalMemory]:
+        """
+        retrieve_many 的异步版本。默认在线程池中执行同步批量检索。
+        """
+        return await asyncio.to_thread(self.retrieve_many, queries, knowledge_path, top_k)
+
+    def warmup(self, knowledge_path: Optional[str] = None):
+        """
+        预先加载检索所需的资源（如向量库客户端、嵌入模型）。默认无操作。
+        """
+        pass
+
+    def index_version(self, knowledge_path: str) -> Optional[str]:
+        """
+        返回知识库当前的索引版本/指纹，重新索引后应发生变化，用于检索结果缓存的失效。
+        默认返回 None（未知版本）。
+        """
+        return None
+
+    def store_identity(self) -> Any:
+        """
+        返回底层存储的标识（可哈希），用于进程级检索结果缓存的键，
+        避免知识路径相同但存储不同的实例互相命中。默认每个实例唯一。
+        """
+        identity = getattr(self, "_store_identity", None)
+        if identity is None:
+            identity = self._store_identity = f"{type(self).__name__}:{uuid.uuid4().hex}"
+        return identity
+
+
+if __name__ == '__main__':
+    # 一次性迁移/压缩命令：python -m memory.persistence <base_path>
+    parser = argparse.ArgumentParser(description="将对话记忆迁移/压缩为追加式 JSONL 日志格式")
+    parser.add_argument("base_path", help="记忆存储目录，如 data/memory_store/default_medical_assistant")
+    args = parser.parse_args()
+
+    count = FilePersistenceLayer(base_path=args.base_path).migrate_dialogue_store()
+    print(f"已迁移/压缩 {count} 个会话的对话记忆。")
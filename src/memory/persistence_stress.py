@@ -0,0 +1,98 @@
+import sys
+import time
+import shutil
+import argparse
+import tempfile
+import multiprocessing
+from collections import Counter
+from typing import Any, Dict
+
+from memory.persistence import FilePersistenceLayer
+from memory.types import ActiveMemory, DialogueMemory
+
+USER_ID = "stress_user"
+ROLE_ID = "stress_role"
+
+def _worker(base_path: str, worker_id: int, messages: int, dialogue_format: str, codec: str, compact_every: int):
+    persistence = FilePersistenceLayer(base_path, dialogue_format=dialogue_format, codec=codec)
+    memory = DialogueMemory(user_id=USER_ID, role_id=ROLE_ID)
+    active = ActiveMemory(user_id=USER_ID, role_id=ROLE_ID)
+    for i in range(messages):
+        # 每个进程持有独立的内存实例（只含自己追加的消息），模拟多个 worker 服务同一会话
+        message = memory.add_message("user", f"w{worker_id}-{i}")
+        persistence.append_dialogue_message(memory, message)
+        if i % 10 == 0 or i == messages - 1:
+            active.set(f"w{worker_id}", i)
+            persistence.save_active_memory_item(active, f"w{worker_id}")
+        if compact_every and worker_id == 0 and i % compact_every == 0 and dialogue_format == "jsonl":
+            # 与其他进程的追加并发压缩日志（整体重写 + 原子替换）
+            persistence.compact_dialogue_memory(USER_ID, ROLE_ID)
+
+def stress(processes: int = 8, messages: int = 200, dialogue_format: str = "jsonl", codec: str = "json",
+           compact_every: int = 50, base_path: str = None) -> Dict[str, Any]:
+    """
+    多进程并发写入同一会话的压力测试：processes 个进程各追加 messages 条消息、按键更新激活记忆，
+    进程 0 同时周期性压缩日志。结束后校验没有丢失、重复或乱序的消息，且每个进程的激活记忆键为最终值。
+    """
+    owns_dir = base_path is None
+    base_path = base_path or tempfile.mkdtemp(prefix="memory_stress_")
+    try:
+        started = time.perf_counter()
+        workers = [
+            multiprocessing.Process(
+                target=_worker, args=(base_path, worker_id, messages, dialogue_format, codec, compact_every)
+            )
+            for worker_id in range(processes)
+        ]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        elapsed = time.perf_counter() - started
+
+        persistence = FilePersistenceLayer(base_path, dialogue_format=dialogue_format, codec=codec)
+        contents = [message.content for message in persistence.load_dialogue_memory(USER_ID, ROLE_ID).messages]
+        counts = Counter(contents)
+        expected = {f"w{worker_id}-{i}" for worker_id in range(processes) for i in range(messages)}
+        # 同一进程的消息应保持追加顺序
+        out_of_order = 0
+        for worker_id in range(processes):
+            sequence = [int(content.split("-")[1]) for content in contents if content.startswith(f"w{worker_id}-")]
+            out_of_order += sum(1 for a, b in zip(sequence, sequence[1:]) if b <= a)
+        active = persistence.load_active_memory(USER_ID, ROLE_ID)
+        stale_keys = [
+            f"w{worker_id}" for worker_id in range(processes)
+            if active.items.get(f"w{worker_id}") is None or active.items[f"w{worker_id}"].value != messages - 1
+        ]
+
+        report = {
+            "processes": processes,
+            "messages_expected": len(expected),
+            "messages_found": len(contents),
+            "lost": len(expected - set(counts)),
+            "duplicated": sum(count - 1 for count in counts.values() if count > 1),
+            "out_of_order": out_of_order,
+            "stale_active_keys": len(stale_keys),
+            "failed_workers": sum(1 for worker in workers if worker.exitcode != 0),
+            "elapsed_s": round(elapsed, 2),
+        }
+        report["ok"] = not (report["lost"] or report["duplicated"] or report["out_of_order"]
+                            or report["stale_active_keys"] or report["failed_workers"])
+        return report
+    finally:
+        if owns_dir:
+            shutil.rmtree(base_path, ignore_errors=True)
+
+if __name__ == '__main__':
+    # python -m memory.persistence_stress --processes 8 --messages 200
+    parser = argparse.ArgumentParser(description="FilePersistenceLayer 多进程并发写入压力测试")
+    parser.add_argument("--processes", type=int, default=8, help="并发进程数")
+    parser.add_argument("--messages", type=int, default=200, help="每个进程追加的消息数")
+    parser.add_argument("--dialogue-format", default="jsonl", choices=["jsonl", "json"])
+    parser.add_argument("--codec", default="json", help="快照编解码器（json / orjson / msgspec / msgpack）")
+    parser.add_argument("--compact-every", type=int, default=50, help="进程 0 每追加多少条消息压缩一次日志，0 表示不压缩")
+    args = parser.parse_args()
+
+    result = stress(args.processes, args.messages, args.dialogue_format, args.codec, args.compact_every)
+    print(result)
+    sys.exit(0 if result["ok"] else 1)
@@ -0,0 +1,175 @@
+import re
+import math
+from functools import lru_cache
+from typing import Callable, Dict, List, Optional, Tuple
+from pydantic import BaseModel, Field
+
+# ----------------------------------------------------------------------
+# Token 计数
+# ----------------------------------------------------------------------
+
+_CJK_PATTERN = re.compile(r"[\u3000-\u303f\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff\uff00-\uffef]")
+
+def _approx_token_count(text: str) -> int:
+    """未安装 tiktoken 时的近似计数：每个中日韩字符/全角标点约 1 token，其余字符约 4 个 1 token。"""
+    cjk = len(_CJK_PATTERN.findall(text))
+    return cjk + math.ceil((len(text) - cjk) / 4)
+
+@lru_cache(maxsize=None)
+def get_tokenizer(encoding_name: str = "cl100k_base") -> Callable[[str], int]:
+    """
+    获取（并缓存）token 计数函数。优先使用 tiktoken（可选依赖），否则退化为近似计数。
+    """
+    try:
+        import tiktoken
+        encoding = tiktoken.get_encoding(encoding_name)
+        return lambda text: len(encoding.encode(text))
+    except Exception:
+        return _approx_token_count
+
+@lru_cache(maxsize=8192)
+def count_tokens(text: str) -> int:
+    """计算文本的 token 数（结果按文本缓存，系统提示词等稳定片段无需重复编码）。"""
+    return get_tokenizer()(text)
+
+def truncate_to_tokens(text: str, max_tokens: int, keep: str = "head") -> str:
+    """
+    将文本截断到不超过 max_tokens 个 token。keep="head" 保留开头，"tail" 保留结尾。
+    """
+    if max_tokens <= 0:
+        return ""
+    tokenizer = get_tokenizer()
+    if tokenizer(text) <= max_tokens:
+        return text
+
+    # 按字符数二分查找最长的可容纳片段（中间结果不进入 count_tokens 的缓存）
+    low, high = 0, len(text)
+    while low < high:
+        mid = (low + high + 1) // 2
+        piece = text[:mid] if keep == "head" else text[-mid:]
+        if tokenizer(piece) <= max_tokens:
+            low = mid
+        else:
+            high = mid - 1
+    if low == 0:
+        return ""
+    return text[:low] if keep == "head" else text[-low:]
+
+# ----------------------------------------------------------------------
+# 预算配置与结果
+# ----------------------------------------------------------------------
+
+class SectionBudget(BaseModel):
+    """单个上下文片段的预算策略"""
+    priority: int = Field(..., description="优先级，数值越小越优先获得剩余预算")
+    share: float = Field(..., description="保底份额（占可分配预算的比例）")
+
+def _default_sections() -> Dict[str, SectionBudget]:
+    return {
+        "role": SectionBudget(priority=0, share=0.2),
+        "active": SectionBudget(priority=1, share=0.1),
+        "dialogue": SectionBudget(priority=2, share=0.3),
+        "professional": SectionBudget(priority=3, share=0.4),
+    }
+
+class PromptBudget(BaseModel):
+    """记忆融合的 token 预算"""
+    total_tokens: int = Field(3000, description="整个融合 Prompt 的 token 上限")
+    sections: Dict[str, SectionBudget] = Field(default_factory=_default_sections, description="各片段的优先级与份额")
+    min_section_tokens: int = Field(16, description="片段可用预算低于该值时整体丢弃")
+    dialogue_messages: int = Field(5, description="最多纳入的最近对话条数")
+
+class FusedPrompt(BaseModel):
+    """预算模式下的记忆融合结果"""
+    prompt: str = Field(..., description="融合后的 Prompt")
+    section_tokens: Dict[str, int] = Field(default_factory=dict, description="各片段实际使用的 token 数")
+    total_tokens: int = Field(0, description="Prompt 总 token 数")
+    dropped_sections: List[str] = Field(default_factory=list, description="因预算不足被丢弃的片段")
+    truncated_sections: List[str] = Field(default_factory=list, description="被截断的片段")
+
+class FusedMessages(BaseModel):
+    """
+    多轮消息模式的记忆融合结果：稳定的 system 前缀 + 真实的历史轮次 + 末尾的易变上下文，
+    使服务端的前缀（KV）缓存可以跨轮命中。
+    """
+    system_prompt: str = Field(..., description="稳定前缀：角色指令与激活记忆")
+    history: List[Dict[str, str]] = Field(default_factory=list, description="历史轮次（OpenAI 消息格式）")
+    user_prompt: str = Field(..., description="易变部分：专业知识与当前问题")
+    total_tokens: int = Field(0, description="本轮发送的总 token 数")
+    prefix_tokens: int = Field(0, description="与上一轮请求逐条相同的前缀消息 token 数（可命中前缀缓存）")
+    legacy_tokens: Optional[int] = Field(None, description="同一轮若使用单条 Prompt 融合模式需发送的 token 数（仅在开启对比统计时计算）")
+    saved_tokens: Optional[int] = Field(None, description="相对单条 Prompt 模式节省的未缓存 token 数（可为负；仅在开启对比统计时计算）")
+
+class PromptSection(BaseModel):
+    """待装配的上下文片段：header + 若干单元 + footer。截断时按 keep 方向整单元丢弃。"""
+    name: str
+    header: str = ""
+    footer: str = ""
+    units: List[str] = Field(default_factory=list)
+    keep: str = Field("head", description="预算不足时保留开头（head）还是结尾（tail）的单元")
+
+    def render(self, units: List[str]) -> str:
+        return f"{self.header}{''.join(units)}{self.footer}"
+
+def fit_sections(sections: List[PromptSection], budget: PromptBudget,
+                 available_tokens: int) -> Tuple[Dict[str, str], Dict[str, int], List[str], List[str]]:
+    """
+    在 available_tokens 内为各片段分配预算并截断。
+
+    先按份额分配保底预算（不超过片段实际需要），剩余预算再按优先级依次补足。
+    :return: (片段文本, 片段 token 数, 被丢弃的片段, 被截断的片段)
+    """
+    available_tokens = max(available_tokens, 0)
+    need = {section.name: count_tokens(section.render(section.units)) for section in sections}
+    policies = {
+        section.name: budget.sections.get(section.name, SectionBudget(priority=len(budget.sections), share=0.0))
+        for section in sections
+    }
+
+    alloc = {name: min(need[name], int(policies[name].share * available_tokens)) for name in need}
+    leftover = available_tokens - sum(alloc.values())
+    for name in sorted(need, key=lambda name: policies[name].priority):
+        extra = min(need[name] - alloc[name], max(leftover, 0))
+        alloc[name] += extra
+        leftover -= extra
+
+    texts: Dict[str, str] = {}
+    used: Dict[str, int] = {}
+    dropped: List[str] = []
+    truncated: List[str] = []
+    for section in sections:
+        text = _fit_section(section, alloc[section.name], need[section.name], budget.min_section_tokens)
+        if not text:
+            dropped.append(section.name)
+        elif alloc[section.name] < need[section.name]:
+            truncated.append(section.name)
+        texts[section.name] = text
+        used[section.name] = count_tokens(text) if text else 0
+    return texts, used, dropped, truncated
+
+def _fit_section(section: PromptSection, alloc: int, need: int, min_tokens: int) -> str:
+    if alloc >= need:
+        return section.render(section.units)
+
+    available = alloc - count_tokens(section.render([]))
+    if available < min_tokens:
+        return ""
+
+    ordered = section.units if section.keep == "head" else list(reversed(section.units))
+    kept: List[str] = []
+    for unit in ordered:
+        cost = count_tokens(unit)
+        if cost <= available:
+            kept.append(unit)
+            available -= cost
+            continue
+        # 放不下的第一个单元按 token 截断，其后的单元全部丢弃
+        if available >= min_tokens:
+            kept.append(truncate_to_tokens(unit, available, keep=section.keep))
+        break
+
+    if not kept:
+        return ""
+    if section.keep == "tail":
+        kept.reverse()
+    return section.render(kept)
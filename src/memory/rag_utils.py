@@ -1,114 +1,407 @@
 import os
-from typing import List, Optional
-import chromadb
-from chromadb.utils import embedding_functions
-from langchain_community.document_loaders import TextLoader
-from langchain_text_splitters import CharacterTextSplitter
+import time
+import uuid
+import hashlib
+import threading
+from typing import List, Optional, Dict, Tuple, TYPE_CHECKING
 
 from .persistence import ProfessionalMemoryRAG
 from .types import ProfessionalMemory, ProfessionalMemoryResult
+from .embedding_cache import EmbeddingCache
+
+# chromadb / langchain / sentence-transformers 均在首次使用时才导入，
+# 使 import memory.rag_utils（以及 agent）保持轻量。
+if TYPE_CHECKING:
+    import chromadb
 
 # 默认使用 SentenceTransformer 的 all-MiniLM-L6-v2 作为嵌入模型
 # 注意：在沙箱环境中，由于网络限制，可能需要使用本地模型或预先下载的模型。
 # 为了演示，我们使用 ChromaDB 的默认嵌入函数，它通常是 all-MiniLM-L6-v2 的轻量级版本。
 # 实际生产环境应配置更强大的嵌入模型。
-DEFAULT_EMBEDDING_FUNCTION = embedding_functions.SentenceTransformerEmbeddingFunction(model_name="all-MiniLM-L6-v2")
+DEFAULT_EMBEDDING_MODEL = "all-MiniLM-L6-v2"
+
+_embedding_function = None
+_embedding_lock = threading.Lock()
+
+def get_default_embedding_function():
+    """
+    获取默认嵌入函数。首次调用时才导入 sentence-transformers 并加载模型，之后复用同一实例。
+    """
+    global _embedding_function
+    if _embedding_function is None:
+        with _embedding_lock:
+            if _embedding_function is None:
+                from chromadb.utils import embedding_functions
+                _embedding_function = embedding_functions.SentenceTransformerEmbeddingFunction(
+                    model_name=DEFAULT_EMBEDDING_MODEL
+                )
+    return _embedding_function
+
+def __getattr__(name: str):
+    # 兼容旧代码对模块常量 DEFAULT_EMBEDDING_FUNCTION 的引用（按需加载）
+    if name == "DEFAULT_EMBEDDING_FUNCTION":
+        return get_default_embedding_function()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+class ChromaClientRegistry:
+    """
+    进程级 ChromaDB 客户端与 Collection 句柄注册表。
+
+    同一 db_path 只创建一个 PersistentClient，Collection 句柄按 (db_path, 名称) 缓存，
+    检索时直接调用 collection.query；Collection 被重新索引时需调用 invalidate。
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._clients: Dict[str, "chromadb.ClientAPI"] = {}
+        self._collections: Dict[Tuple[str, str], "chromadb.Collection"] = {}
+
+    def get_client(self, db_path: str):
+        """获取（必要时创建）db_path 对应的共享客户端。"""
+        key = os.path.abspath(db_path)
+        with self._lock:
+            client = self._clients.get(key)
+            if client is None:
+                import chromadb
+                client = chromadb.PersistentClient(path=db_path)
+                self._clients[key] = client
+            return client
+
+    def get_collection(self, db_path: str, name: str):
+        """获取缓存的 Collection 句柄；不存在时由 chromadb 抛出异常。"""
+        key = (os.path.abspath(db_path), name)
+        collection = self._collections.get(key)
+        if collection is None:
+            collection = self.get_client(db_path).get_collection(
+                name=name,
+                embedding_function=get_default_embedding_function()
+            )
+            with self._lock:
+                self._collections[key] = collection
+        return collection
+
+    def refresh_collection(self, db_path: str, name: str):
+        """重新获取 Collection 句柄（读取最新的元数据，如其他进程写入的 index_version）并替换缓存。"""
+        collection = self.get_client(db_path).get_collection(
+            name=name,
+            embedding_function=get_default_embedding_function()
+        )
+        with self._lock:
+            self._collections[(os.path.abspath(db_path), name)] = collection
+        return collection
+
+    def invalidate(self, db_path: str, name: Optional[str] = None):
+        """使缓存的 Collection 句柄失效；name 为 None 时清除该 db_path 下的全部句柄。"""
+        db_key = os.path.abspath(db_path)
+        with self._lock:
+            for key in list(self._collections):
+                if key[0] == db_key and (name is None or key[1] == name):
+                    del self._collections[key]
+
+# 进程内共享的注册表实例
+CHROMA_REGISTRY = ChromaClientRegistry()
+
+# 进程内共享的查询嵌入缓存（仅内存层）；需要跨重启复用时可向 ChromaDBRAG 传入带 disk_path 的实例
+SHARED_EMBEDDING_CACHE = EmbeddingCache()
 
 class ChromaDBRAG(ProfessionalMemoryRAG):
     """
     基于 ChromaDB 的专业记忆 RAG 实现。
+    客户端与 Collection 句柄通过 CHROMA_REGISTRY 在进程内共享；
+    查询向量经 embedding_cache 缓存后以 query_embeddings 传给 Chroma，重复查询无需重新嵌入。
     """
-    def __init__(self, db_path: str = "data/chroma_db"):
+    def __init__(self, db_path: str = "data/chroma_db", embedding_cache: Optional[EmbeddingCache] = None,
+                 version_ttl: float = 1.0):
+        """
+        :param version_ttl: index_version 的重新读取间隔（秒）。缓存句柄上的元数据不会随其他进程的
+            重新索引而更新，超过该间隔后重新获取句柄。
+        """
         self.db_path = db_path
-        self.client = chromadb.PersistentClient(path=self.db_path)
+        self.embedding_cache = embedding_cache if embedding_cache is not None else SHARED_EMBEDDING_CACHE
+        self.version_ttl = version_ttl
+        # knowledge_path -> (读取 index_version 时的句柄, 读取时间)
+        self._version_checks: Dict[str, Tuple[object, float]] = {}
+
+    @property
+    def client(self):
+        """共享的 ChromaDB 客户端，首次访问时才创建。"""
+        return CHROMA_REGISTRY.get_client(self.db_path)
+
+    def warmup(self, knowledge_path: Optional[str] = None):
+        """
+        预先创建客户端、加载嵌入模型（执行一次嵌入），并缓存 knowledge_path 对应的 Collection 句柄。
+        """
+        get_default_embedding_function()(["warmup"])
+        if knowledge_path:
+            try:
+                CHROMA_REGISTRY.get_collection(self.db_path, knowledge_path)
+            except Exception as e:
+                print(f"Error getting collection {knowledge_path}: {e}")
+        else:
+            CHROMA_REGISTRY.get_client(self.db_path)
+
+    def store_identity(self) -> Tuple[str, str]:
+        return "chroma", os.path.abspath(self.db_path)
+
+    def index_version(self, knowledge_path: str) -> Optional[str]:
+        """
+        读取 Collection 元数据中由 index_documents_to_chroma 写入的 index_version。
+        同一句柄的元数据最多沿用 version_ttl 秒，之后重新获取句柄以发现其他进程的重新索引。
+        """
+        now = time.monotonic()
+        try:
+            collection = CHROMA_REGISTRY.get_collection(self.db_path, knowledge_path)
+            checked = self._version_checks.get(knowledge_path)
+            if checked is not None and checked[0] is collection and now - checked[1] >= self.version_ttl:
+                collection = CHROMA_REGISTRY.refresh_collection(self.db_path, knowledge_path)
+                checked = None
+            if checked is None or checked[0] is not collection:
+                self._version_checks[knowledge_path] = (collection, now)
+        except Exception:
+            return None
+        return (collection.metadata or {}).get("index_version")
 
     def retrieve(self, query: str, knowledge_path: str, top_k: int = 3) -> ProfessionalMemory:
         """
         根据查询和知识路径（Collection Name）进行 RAG 检索。
         """
         try:
-            collection = self.client.get_collection(
-                name=knowledge_path,
-                embedding_function=DEFAULT_EMBEDDING_FUNCTION
-            )
+            collection = CHROMA_REGISTRY.get_collection(self.db_path, knowledge_path)
         except Exception as e:
             print(f"Error getting collection {knowledge_path}: {e}")
-            return ProfessionalMemory()
+            return ProfessionalMemory(error=str(e))
 
-        results = collection.query(
-            query_texts=[query],
-            n_results=top_k,
-            include=['documents', 'metadatas', 'distances']
-        )
+        return self._query_collection(collection, [query], knowledge_path, top_k)[0]
+
+    def retrieve_many(self, queries: List[str], knowledge_path: str, top_k: int = 3) -> List[ProfessionalMemory]:
+        """
+        批量检索：未缓存的查询一次性嵌入，并以单次 collection.query 完成所有向量查询。
+        """
+        if not queries:
+            return []
+        try:
+            collection = CHROMA_REGISTRY.get_collection(self.db_path, knowledge_path)
+        except Exception as e:
+            print(f"Error getting collection {knowledge_path}: {e}")
+            return [ProfessionalMemory(error=str(e)) for _ in queries]
+
+        return self._query_collection(collection, queries, knowledge_path, top_k)
+
+    def _query_collection(self, collection, queries: List[str], knowledge_path: str, top_k: int) -> List[ProfessionalMemory]:
+        """在已获取的 Collection 句柄上嵌入并查询 queries。"""
+        try:
+            query_embeddings = self.embedding_cache.get_or_compute(
+                DEFAULT_EMBEDDING_MODEL, queries, get_default_embedding_function()
+            )
+            results = collection.query(
+                query_embeddings=query_embeddings,
+                n_results=top_k,
+                include=['documents', 'metadatas', 'distances']
+            )
+        except Exception as e:
+            # 句柄可能已失效（如 Collection 被其他进程删除重建），丢弃缓存以便下次重新获取
+            print(f"Error querying collection {knowledge_path}: {e}")
+            CHROMA_REGISTRY.invalidate(self.db_path, knowledge_path)
+            return [ProfessionalMemory(error=str(e)) for _ in queries]
 
-        professional_memory_results: List[ProfessionalMemoryResult] = []
-        if results and results.get('documents'):
-            for doc, meta, dist in zip(results['documents'][0], results['metadatas'][0], results['distances'][0]):
-                professional_memory_results.append(
-                    ProfessionalMemoryResult(
-                        content=doc,
-                        source=meta.get('source', 'N/A'),
-                        score=1.0 - dist # 简单地将距离转换为相似度得分
+        memories: List[ProfessionalMemory] = []
+        for i in range(len(queries)):
+            professional_memory_results: List[ProfessionalMemoryResult] = []
+            if results and results.get('documents'):
+                for doc, meta, dist in zip(results['documents'][i], results['metadatas'][i], results['distances'][i]):
+                    professional_memory_results.append(
+                        ProfessionalMemoryResult(
+                            content=doc,
+                            source=meta.get('source', 'N/A'),
+                            score=1.0 - dist # 简单地将距离转换为相似度得分
+                        )
                     )
-                )
-        
-        return ProfessionalMemory(results=professional_memory_results)
+            memories.append(ProfessionalMemory(results=professional_memory_results))
 
-def index_documents_to_chroma(file_path: str, collection_name: str, db_path: str = "data/chroma_db"):
+        return memories
+
+def _hash_text(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+def file_content_hash(file_path: str, chunk_size: int, chunk_overlap: int) -> str:
+    """文件内容连同分块参数的哈希（参数变化时需要重新分块），记录在该文件每个分块的 file_hash 元数据中。"""
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    digest.update(f"|{chunk_size}|{chunk_overlap}".encode())
+    return digest.hexdigest()
+
+def collection_metadata_for_update(collection) -> dict:
     """
-    加载、分块文档，并将其索引到 ChromaDB。
-    
-    :param file_path: 要索引的文档路径。
-    :param collection_name: ChromaDB Collection 的名称，作为角色的 knowledge_path。
-    :param db_path: ChromaDB 存储路径。
+    可传给 collection.modify 的 Collection 元数据：排除不可修改的 hnsw:* 配置项，
+    以及旧版本按文件记录在 Collection 元数据中的 file_hash:* 键（现记录在分块元数据中）。
     """
-    print(f"--- 正在索引文档: {file_path} 到 Collection: {collection_name} ---")
-    
-    # 1. 加载文档 (目前仅支持 TextLoader，可扩展支持 PDF, DOCX 等)
+    return {
+        k: v for k, v in (collection.metadata or {}).items()
+        if not k.startswith("hnsw:") and not k.startswith("file_hash:")
+    }
+
+def document_file_key(file_path: str, root: Optional[str] = None) -> str:
+    """
+    分块 ID 与 file 元数据中的文件标识：相对 root 的路径（以 / 分隔），未指定 root 时为文件名。
+    index_documents_to_chroma、index_documents_lexical 与 ingest_directory 共用，
+    同一文件无论经哪条路径索引都得到相同的分块 ID。
+    """
+    if root is None:
+        return os.path.basename(file_path)
+    return os.path.relpath(file_path, root).replace(os.sep, "/")
+
+def build_document_chunks(docs: list, collection_name: str, file_path: str,
+                          root: Optional[str] = None, file_hash: Optional[str] = None) -> Dict[str, Tuple[str, dict]]:
+    """
+    由分块后的 langchain 文档构建分块 ID 与元数据，以内容哈希作为 ID（同一文件内重复的分块追加序号）。
+    元数据仅保留 Chroma 支持的标量值；给定 file_hash（见 file_content_hash）时记录在每个分块中。
+    :return: 分块 ID -> (文本, 元数据)。
+    """
+    source = os.path.basename(file_path)
+    file_key = document_file_key(file_path, root)
+    chunks: Dict[str, Tuple[str, dict]] = {}
+    occurrences: Dict[str, int] = {}
+    for i, doc in enumerate(docs):
+        chunk_hash = _hash_text(doc.page_content)
+        n = occurrences.get(chunk_hash, 0)
+        occurrences[chunk_hash] = n + 1
+        chunk_id = f"{collection_name}_{file_key}_{chunk_hash[:16]}" + (f"_{n}" if n else "")
+        chunks[chunk_id] = (doc.page_content, {
+            "source": source,
+            "chunk_index": i,
+            **{k: v for k, v in doc.metadata.items() if isinstance(v, (str, int, float, bool))},
+            "file": file_key,
+            "chunk_hash": chunk_hash,
+            **({"file_hash": file_hash} if file_hash is not None else {}),
+        })
+    return chunks
+
+def load_document_chunks(file_path: str, collection_name: str, chunk_size: int = 1000,
+                         chunk_overlap: int = 200, root: Optional[str] = None,
+                         file_hash: Optional[str] = None) -> Optional[Dict[str, Tuple[str, dict]]]:
+    """
+    加载并分块文档（见 build_document_chunks）。向量索引与词法索引共用同一套分块。
+    :param root: 知识库根目录，设置时文件标识为相对该目录的路径（与 ingest_directory 一致）。
+    :param file_hash: 记录在分块元数据中的文件哈希。
+    :return: 分块 ID -> (文本, 元数据)；加载失败时返回 None。
+    """
+    from langchain_community.document_loaders import TextLoader
+    from langchain_text_splitters import CharacterTextSplitter
+
+    # 目前仅支持 TextLoader，可扩展支持 PDF, DOCX 等
     try:
         loader = TextLoader(file_path)
         documents = loader.load()
     except Exception as e:
         print(f"Error loading document {file_path}: {e}")
-        return
+        return None
 
-    # 2. 分块
-    text_splitter = CharacterTextSplitter(chunk_size=1000, chunk_overlap=200)
+    text_splitter = CharacterTextSplitter(chunk_size=chunk_size, chunk_overlap=chunk_overlap)
     docs = text_splitter.split_documents(documents)
-    
-    # 3. 准备数据
-    texts = [doc.page_content for doc in docs]
-    metadatas = [{
-        "source": os.path.basename(file_path),
-        "chunk_index": i,
-        **doc.metadata
-    } for i, doc in enumerate(docs)]
-    ids = [f"{collection_name}_{os.path.basename(file_path)}_{i}" for i in range(len(docs))]
-
-    # 4. 索引到 ChromaDB
-    client = chromadb.PersistentClient(path=db_path)
-    
-    # 确保 Collection 存在，如果存在则清空或更新
+    return build_document_chunks(docs, collection_name, file_path, root, file_hash)
+
+def index_documents_to_chroma(file_path: str, collection_name: str, db_path: str = "data/chroma_db",
+                              chunk_size: int = 1000, chunk_overlap: int = 200,
+                              lexical_store_path: Optional[str] = None, root: Optional[str] = None) -> Dict[str, int]:
+    """
+    加载、分块文档，并增量索引到 ChromaDB。
+
+    文件内容（连同分块参数）的哈希记录在该文件每个分块的 file_hash 元数据中，
+    已有分块的哈希均与当前文件一致时直接跳过整个文件；
+    否则按分块内容哈希生成 ID，只嵌入新增的分块、删除已消失的分块，
+    内容未变但位置变化的分块仅更新元数据。
+
+    :param file_path: 要索引的文档路径。
+    :param collection_name: ChromaDB Collection 的名称，作为角色的 knowledge_path。
+    :param db_path: ChromaDB 存储路径。
+    :param chunk_size: 分块大小。
+    :param chunk_overlap: 分块重叠大小。
+    :param lexical_store_path: 设置时同步（重新）构建该 Collection 的 BM25 词法索引，供 LexicalRAG / HybridRAG 使用。
+    :param root: 知识库根目录，设置时文件标识为相对该目录的路径，与以同一 root 运行的 ingest_directory 一致；
+        默认为文件名。
+    :return: 统计信息 {"added", "updated", "deleted", "skipped"}（按分块计数）。
+    """
+    print(f"--- 正在索引文档: {file_path} 到 Collection: {collection_name} ---")
+    stats = {"added": 0, "updated": 0, "deleted": 0, "skipped": 0}
+    source = document_file_key(file_path, root)
+
+    # 1. 计算文件哈希（包含分块参数，参数变化时需要重新分块）
     try:
-        collection = client.get_collection(
-            name=collection_name,
-            embedding_function=DEFAULT_EMBEDDING_FUNCTION
+        file_hash = file_content_hash(file_path, chunk_size, chunk_overlap)
+    except OSError as e:
+        print(f"Error loading document {file_path}: {e}")
+        return stats
+
+    client = CHROMA_REGISTRY.get_client(db_path)
+    collection = client.get_or_create_collection(
+        name=collection_name,
+        embedding_function=get_default_embedding_function()
+    )
+    existing = collection.get(where={"file": source}, include=['metadatas'])
+    if existing['ids'] and all((meta or {}).get("file_hash") == file_hash for meta in existing['metadatas']):
+        stats["skipped"] = len(existing['ids'])
+        print(f"文档 {source} 未变化，跳过索引（{stats['skipped']} 个文本块）。")
+        if lexical_store_path:
+            from .lexical import lexical_index_exists, build_lexical_index_from_chroma
+            if not lexical_index_exists(lexical_store_path, collection_name):
+                build_lexical_index_from_chroma(collection_name, db_path, lexical_store_path)
+        return stats
+
+    # 2-3. 加载并分块
+    chunks = load_document_chunks(file_path, collection_name, chunk_size, chunk_overlap, root, file_hash)
+    if chunks is None:
+        return stats
+
+    # 4. 与已有分块比较
+    existing_meta = dict(zip(existing['ids'], existing['metadatas']))
+    if not existing_meta:
+        # 首次增量索引该文件：清理旧版按序号命名（无 file 元数据）的分块
+        legacy_prefix = f"{collection_name}_{source}_"
+        legacy = collection.get(where={"source": os.path.basename(file_path)}, include=['metadatas'])
+        for chunk_id, meta in zip(legacy['ids'], legacy['metadatas']):
+            if chunk_id.startswith(legacy_prefix) and "file" not in (meta or {}):
+                existing_meta[chunk_id] = {}
+
+    to_add = [chunk_id for chunk_id in chunks if chunk_id not in existing_meta]
+    to_delete = [chunk_id for chunk_id in existing_meta if chunk_id not in chunks]
+    to_update = [
+        chunk_id for chunk_id in chunks
+        if chunk_id in existing_meta and existing_meta[chunk_id] != chunks[chunk_id][1]
+    ]
+    stats["added"] = len(to_add)
+    stats["deleted"] = len(to_delete)
+    stats["updated"] = len(to_update)
+    stats["skipped"] = len(chunks) - len(to_add) - len(to_update)
+
+    # 5. 写入 ChromaDB：仅新增分块需要嵌入，元数据更新不会重新嵌入
+    if to_delete:
+        collection.delete(ids=to_delete)
+    if to_add:
+        collection.add(
+            documents=[chunks[chunk_id][0] for chunk_id in to_add],
+            metadatas=[chunks[chunk_id][1] for chunk_id in to_add],
+            ids=to_add
         )
-        # 简单处理：如果 Collection 存在，先删除所有内容
-        collection.delete(ids=[id for id in collection.get()['ids']])
-        print(f"Existing collection '{collection_name}' cleared.")
-    except:
-        # Collection 不存在，创建新的
-        collection = client.create_collection(
-            name=collection_name,
-            embedding_function=DEFAULT_EMBEDDING_FUNCTION
+    if to_update:
+        collection.update(
+            ids=to_update,
+            metadatas=[chunks[chunk_id][1] for chunk_id in to_update]
         )
-        print(f"New collection '{collection_name}' created.")
 
-    # 5. 添加文档
-    collection.add(
-        documents=texts,
-        metadatas=metadatas,
-        ids=ids
+    # 6. 内容有变化时更新索引版本，使检索结果缓存中的旧条目失效
+    if to_add or to_delete or to_update:
+        metadata = collection_metadata_for_update(collection)
+        metadata["index_version"] = uuid.uuid4().hex
+        collection.modify(metadata=metadata)
+
+    # 重新索引后丢弃缓存的句柄，检索方将获取最新的 Collection
+    CHROMA_REGISTRY.invalidate(db_path, collection_name)
+    if lexical_store_path:
+        from .lexical import build_lexical_index_from_chroma
+        build_lexical_index_from_chroma(collection_name, db_path, lexical_store_path)
+    print(
+        f"索引完成 {collection_name}/{source}: 新增 {stats['added']}，更新 {stats['updated']}，"
+        f"删除 {stats['deleted']}，跳过 {stats['skipped']} 个文本块"
     )
-    print(f"成功索引 {len(texts)} 个文本块到 ChromaDB Collection: {collection_name}")
+    return stats
@@ -0,0 +1,126 @@
+import time
+import asyncio
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+from memory.types import ProfessionalMemory
+from memory.persistence import ProfessionalMemoryRAG
+from memory.embedding_cache import normalize_query
+
+class RetrievalResultCache:
+    """
+    专业记忆检索结果缓存：容量受限（LRU 淘汰）并带 TTL。
+
+    键包含知识库的索引版本（index_version），知识库被重新索引后版本变化，
+    旧条目不再命中并随 LRU 淘汰，因此不会返回过期知识。
+    """
+    def __init__(self, max_size: int = 2048, ttl: Optional[float] = 600.0):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[Tuple[Any, ...], Tuple[float, ProfessionalMemory]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Tuple[Any, ...]) -> Optional[ProfessionalMemory]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                stored_at, memory = entry
+                if self.ttl is None or time.monotonic() - stored_at < self.ttl:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return memory.model_copy(deep=True)
+                del self._entries[key]
+            self.misses += 1
+            return None
+
+    def put(self, key: Tuple[Any, ...], memory: ProfessionalMemory):
+        with self._lock:
+            self._entries[key] = (time.monotonic(), memory.model_copy(deep=True))
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, knowledge_path: Optional[str] = None):
+        """清除指定知识库（或全部）的缓存条目。"""
+        with self._lock:
+            if knowledge_path is None:
+                self._entries.clear()
+                return
+            for key in [key for key in self._entries if key[0] == knowledge_path]:
+                del self._entries[key]
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
+
+class CachedProfessionalMemoryRAG(ProfessionalMemoryRAG):
+    """
+    在任意 ProfessionalMemoryRAG 前加一层结果缓存。
+
+    缓存键为 (knowledge_path, 存储标识, 归一化查询, top_k, index_version)，其中存储标识来自
+    底层实现的 store_identity()，共享同一缓存的不同存储不会互相命中。底层实现无法提供
+    index_version（返回 None）时，条目仅依靠 TTL 过期。检索出错的结果（error 非空）不缓存。
+    """
+    def __init__(self, rag_system: ProfessionalMemoryRAG, cache: Optional[RetrievalResultCache] = None):
+        self.rag_system = rag_system
+        self.cache = cache if cache is not None else RetrievalResultCache()
+
+    def _key(self, query: str, knowledge_path: str, top_k: int, version: Optional[str]) -> Tuple[Any, ...]:
+        return knowledge_path, self.rag_system.store_identity(), normalize_query(query), top_k, version
+
+    def _put(self, key: Tuple[Any, ...], memory: ProfessionalMemory):
+        if memory.error is None:
+            self.cache.put(key, memory)
+
+    def retrieve(self, query: str, knowledge_path: str, top_k: int = 3) -> ProfessionalMemory:
+        key = self._key(query, knowledge_path, top_k, self.rag_system.index_version(knowledge_path))
+        cached = self.cache.get(key)
+        if cached is not None:
+            return cached
+
+        memory = self.rag_system.retrieve(query, knowledge_path, top_k)
+        self._put(key, memory)
+        return memory
+
+    async def aretrieve(self, query: str, knowledge_path: str, top_k: int = 3) -> ProfessionalMemory:
+        # 索引版本的查询可能阻塞（如首次创建向量库客户端、TTL 到期后读取元数据），在线程池中执行
+        version = await asyncio.to_thread(self.rag_system.index_version, knowledge_path)
+        key = self._key(query, knowledge_path, top_k, version)
+        cached = self.cache.get(key)
+        if cached is not None:
+            return cached
+
+        memory = await self.rag_system.aretrieve(query, knowledge_path, top_k)
+        self._put(key, memory)
+        return memory
+
+    def retrieve_many(self, queries: List[str], knowledge_path: str, top_k: int = 3) -> List[ProfessionalMemory]:
+        # 索引版本只查询一次；未命中的查询合并为一次底层批量检索
+        version = self.rag_system.index_version(knowledge_path)
+        keys = [self._key(query, knowledge_path, top_k, version) for query in queries]
+        memories: List[Optional[ProfessionalMemory]] = [self.cache.get(key) for key in keys]
+
+        missing = [i for i, memory in enumerate(memories) if memory is None]
+        if missing:
+            retrieved = self.rag_system.retrieve_many([queries[i] for i in missing], knowledge_path, top_k)
+            for i, memory in zip(missing, retrieved):
+                self._put(keys[i], memory)
+                memories[i] = memory
+        return memories
+
+    def index_version(self, knowledge_path: str) -> Optional[str]:
+        return self.rag_system.index_version(knowledge_path)
+
+    def store_identity(self) -> Any:
+        return self.rag_system.store_identity()
+
+    def warmup(self, knowledge_path: Optional[str] = None):
+        self.rag_system.warmup(knowledge_path)
@@ -0,0 +1,69 @@
+import sys
+import time
+import asyncio
+import argparse
+from typing import Any, Dict, Optional
+
+from memory.types import ProfessionalMemory, ProfessionalMemoryResult
+from memory.persistence import ProfessionalMemoryRAG
+from memory.retrieval_cache import CachedProfessionalMemoryRAG
+
+class _SlowVersionRAG(ProfessionalMemoryRAG):
+    """index_version 阻塞 version_delay 秒（模拟向量库冷启动或读取元数据），检索本身很快。"""
+    def __init__(self, version_delay: float):
+        self.version_delay = version_delay
+
+    def index_version(self, knowledge_path: str) -> Optional[str]:
+        time.sleep(self.version_delay)
+        return "v1"
+
+    def store_identity(self) -> Any:
+        return "slow_version"
+
+    def retrieve(self, query: str, knowledge_path: str, top_k: int = 3) -> ProfessionalMemory:
+        return ProfessionalMemory(results=[ProfessionalMemoryResult(content=query, source=knowledge_path, score=1.0)])
+
+def check_event_loop_responsive(version_delay: float = 0.3, tick: float = 0.01, max_stall: float = 0.1) -> Dict[str, Any]:
+    """
+    aretrieve 查询索引版本（未命中与命中各一次）期间，事件循环上的其他协程仍能按 tick 间隔运行：
+    观察到的最长调度间隔应远小于 version_delay。
+    """
+    rag = CachedProfessionalMemoryRAG(_SlowVersionRAG(version_delay))
+
+    async def run():
+        stalls = []
+        done = asyncio.Event()
+
+        async def ticker():
+            last = time.perf_counter()
+            while not done.is_set():
+                await asyncio.sleep(tick)
+                now = time.perf_counter()
+                stalls.append(now - last)
+                last = now
+
+        task = asyncio.create_task(ticker())
+        await asyncio.sleep(tick)
+        miss = await rag.aretrieve("问题", "kbase")
+        hit = await rag.aretrieve("问题", "kbase")
+        done.set()
+        await task
+        return miss, hit, max(stalls)
+
+    miss, hit, stall = asyncio.run(run())
+    return {
+        "ok": stall < max_stall and hit.results == miss.results and rag.cache.hits == 1,
+        "version_delay_s": version_delay,
+        "max_stall_s": round(stall, 3),
+        "cache": rag.cache.stats(),
+    }
+
+if __name__ == '__main__':
+    # cd src && python -m memory.retrieval_cache_check
+    parser = argparse.ArgumentParser(description="检查 CachedProfessionalMemoryRAG.aretrieve 不在事件循环上阻塞查询索引版本")
+    parser.add_argument("--version-delay", type=float, default=0.3, help="模拟的 index_version 耗时（秒）")
+    args = parser.parse_args()
+
+    result = check_event_loop_responsive(args.version_delay)
+    print(result)
+    sys.exit(0 if result["ok"] else 1)
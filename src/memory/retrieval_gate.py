@@ -0,0 +1,92 @@
+import re
+from typing import Callable, List, Optional
+from pydantic import BaseModel, Field
+from memory.types import ProfessionalMemory
+from memory.embedding_cache import normalize_query
+
+# 寒暄、致谢、应答等无需检索专业知识的短语（去除标点和语气词后整句匹配）
+DEFAULT_CHITCHAT_PHRASES: List[str] = [
+    "你好", "您好", "嗨", "哈喽", "hi", "hello", "hey", "早上好", "晚上好", "下午好",
+    "谢谢", "谢谢你", "谢谢您", "多谢", "感谢", "thanks", "thank you",
+    "好的", "好", "行", "可以", "嗯", "嗯嗯", "哦", "ok", "okay", "收到", "明白", "明白了", "知道了", "了解",
+    "再见", "拜拜", "bye", "晚安", "哈哈", "哈哈哈",
+]
+
+_PUNCTUATION = re.compile(r"[\s\W_]+")
+_PARTICLES = "啊呀吧啦哦了呢哈嘛"
+
+class RetrievalGate:
+    """
+    检索前的轻量门控：判断当前查询是否值得调用 RAG。
+
+    依次应用：寒暄/致谢短语整句匹配、短查询启发式（去除标点后字符数少于 min_query_chars），
+    以及可选的分类器钩子 classifier(query) -> bool（返回 False 表示跳过检索）。
+    """
+    def __init__(self, min_query_chars: int = 2,
+                 chitchat_phrases: Optional[List[str]] = None,
+                 classifier: Optional[Callable[[str], bool]] = None,
+                 max_chitchat_chars: int = 16):
+        self.min_query_chars = min_query_chars
+        self.max_chitchat_chars = max_chitchat_chars
+        phrases = chitchat_phrases if chitchat_phrases is not None else DEFAULT_CHITCHAT_PHRASES
+        self._phrases = {self._strip(phrase) for phrase in phrases}
+        self.classifier = classifier
+
+    @staticmethod
+    def _strip(text: str) -> str:
+        return _PUNCTUATION.sub("", normalize_query(text))
+
+    def should_retrieve(self, query: str) -> bool:
+        text = self._strip(query)
+        if len(text) < self.min_query_chars:
+            return False
+        # 寒暄通常很短，只对短文本做短语匹配
+        if len(text) <= self.max_chitchat_chars and self._is_phrase_sequence(text):
+            return False
+        if self.classifier is not None:
+            return bool(self.classifier(query))
+        return True
+
+    def _is_phrase_sequence(self, text: str) -> bool:
+        # 判断文本能否完全拆分为若干寒暄短语（可夹带语气词），如 "好的呀"、"好的，谢谢"
+        reachable = [False] * (len(text) + 1)
+        reachable[0] = True
+        for start in range(len(text)):
+            if not reachable[start]:
+                continue
+            if text[start] in _PARTICLES:
+                reachable[start + 1] = True
+            for phrase in self._phrases:
+                if phrase and text.startswith(phrase, start):
+                    reachable[start + len(phrase)] = True
+        return reachable[len(text)]
+
+class RetrievalPolicy(BaseModel):
+    """
+    检索结果的筛选策略。得分的含义取决于 RAG 实现（ChromaDBRAG 为 1 - 距离，
+    NumpyVectorRAG 为余弦相似度，LexicalRAG 为 BM25 得分），min_score 需按所用实现设定。
+    """
+    max_k: int = Field(3, description="最多检索的片段数（传给 RAG 的 top_k）")
+    min_k: int = Field(0, description="至少保留的片段数（不受得分阈值约束）")
+    min_score: Optional[float] = Field(None, description="最低得分，低于该值的片段被丢弃")
+    relative_score: Optional[float] = Field(None, description="自适应 k：仅保留得分不低于 最高分 * relative_score 的片段")
+
+    def apply(self, memory: ProfessionalMemory) -> ProfessionalMemory:
+        """
+        按得分降序筛选片段，返回新的 ProfessionalMemory。
+        没有得分（score 为 None）的片段排在最后，且不受得分阈值约束。
+        """
+        results = sorted(
+            memory.results, key=lambda result: result.score if result.score is not None else float("-inf"), reverse=True
+        )[:self.max_k]
+        if not results:
+            return ProfessionalMemory(error=memory.error)
+        best = results[0].score
+        kept = [
+            result for i, result in enumerate(results)
+            if i < self.min_k or result.score is None or (
+                (self.min_score is None or result.score >= self.min_score)
+                and (self.relative_score is None or best <= 0 or result.score >= best * self.relative_score)
+            )
+        ]
+        return ProfessionalMemory(results=kept, error=memory.error)
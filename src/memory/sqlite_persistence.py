@@ -0,0 +1,250 @@
+import os
+import json
+import sqlite3
+import threading
+from datetime import datetime
+from typing import Optional, Iterable, List, Tuple
+from memory.types import DialogueMemory, ActiveMemory, ActiveMemoryItem, Message
+from memory.persistence import PersistenceLayer
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS messages (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id TEXT NOT NULL,
+    role_id TEXT NOT NULL,
+    sender TEXT NOT NULL,
+    content TEXT NOT NULL,
+    timestamp TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_messages_session
+    ON messages (user_id, role_id, timestamp);
+
+CREATE TABLE IF NOT EXISTS dialogue_sessions (
+    user_id TEXT NOT NULL,
+    role_id TEXT NOT NULL,
+    last_updated TEXT NOT NULL,
+    PRIMARY KEY (user_id, role_id)
+);
+
+CREATE TABLE IF NOT EXISTS active_items (
+    user_id TEXT NOT NULL,
+    role_id TEXT NOT NULL,
+    key TEXT NOT NULL,
+    value TEXT NOT NULL,
+    last_accessed TEXT NOT NULL,
+    access_count INTEGER NOT NULL DEFAULT 0,
+    created_at TEXT,
+    PRIMARY KEY (user_id, role_id, key)
+);
+"""
+
+# 旧版本数据库缺少的列：(表, 列, 定义)
+MIGRATIONS = [
+    ("active_items", "access_count", "INTEGER NOT NULL DEFAULT 0"),
+    ("active_items", "created_at", "TEXT"),
+]
+
+class SQLitePersistenceLayer(PersistenceLayer):
+    """
+    基于 SQLite 的持久化实现。
+
+    所有用户和角色的记忆保存在同一个数据库文件中（WAL 模式），对话消息按行存储并以
+    (user_id, role_id, timestamp) 建立索引，支持"最近 N 条"和分页查询而无需加载完整历史；
+    激活记忆的每个键单独成行，单键更新不会重写整个记忆。
+    """
+    def __init__(self, db_path: str = "data/memory_store/memory.db"):
+        self.db_path = db_path
+        db_dir = os.path.dirname(self.db_path)
+        if db_dir:
+            os.makedirs(db_dir, exist_ok=True)
+
+        # 同一连接可能被多个线程使用，由锁串行化访问
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(SCHEMA)
+        self._migrate()
+        self._conn.commit()
+
+    def _migrate(self):
+        for table, column, definition in MIGRATIONS:
+            columns = {row[1] for row in self._conn.execute(f"PRAGMA table_info({table})")}
+            if column not in columns:
+                self._conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+
+    def close(self):
+        """关闭数据库连接。"""
+        with self._lock:
+            self._conn.close()
+
+    # ------------------------------------------------------------------
+    # 对话记忆
+    # ------------------------------------------------------------------
+
+    def load_dialogue_memory(self, user_id: str, role_id: str) -> Optional[DialogueMemory]:
+        memory = DialogueMemory(user_id=user_id, role_id=role_id)
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT sender, content, timestamp FROM messages "
+                "WHERE user_id = ? AND role_id = ? ORDER BY timestamp, id",
+                (user_id, role_id)
+            ).fetchall()
+            session = self._conn.execute(
+                "SELECT last_updated FROM dialogue_sessions WHERE user_id = ? AND role_id = ?",
+                (user_id, role_id)
+            ).fetchone()
+
+        # 直接写入紧凑存储，不逐条创建 Message
+        for sender, content, timestamp in rows:
+            memory.messages.append_raw(sender, content, datetime.fromisoformat(timestamp))
+        if session:
+            memory.last_updated = datetime.fromisoformat(session[0])
+        return memory
+
+    def save_dialogue_memory(self, memory: DialogueMemory):
+        rows = [self._message_to_row(memory, message) for message in memory.messages]
+        with self._lock, self._conn:
+            self._conn.execute(
+                "DELETE FROM messages WHERE user_id = ? AND role_id = ?",
+                (memory.user_id, memory.role_id)
+            )
+            self._conn.executemany(
+                "INSERT INTO messages (user_id, role_id, sender, content, timestamp) VALUES (?, ?, ?, ?, ?)",
+                rows
+            )
+            self._touch_session(memory)
+
+    def append_dialogue_message(self, memory: DialogueMemory, message: Message):
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT INTO messages (user_id, role_id, sender, content, timestamp) VALUES (?, ?, ?, ?, ?)",
+                self._message_to_row(memory, message)
+            )
+            self._touch_session(memory)
+
+    def append_dialogue_messages(self, memory: DialogueMemory, messages: List[Message]):
+        if not messages:
+            return
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "INSERT INTO messages (user_id, role_id, sender, content, timestamp) VALUES (?, ?, ?, ?, ?)",
+                [self._message_to_row(memory, message) for message in messages]
+            )
+            self._touch_session(memory)
+
+    def load_recent_messages(self, user_id: str, role_id: str, n: int) -> List[Message]:
+        if n <= 0:
+            return []
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT sender, content, timestamp FROM messages "
+                "WHERE user_id = ? AND role_id = ? ORDER BY timestamp DESC, id DESC LIMIT ?",
+                (user_id, role_id, n)
+            ).fetchall()
+        return [self._row_to_message(row) for row in reversed(rows)]
+
+    def load_messages(self, user_id: str, role_id: str, offset: int = 0, limit: Optional[int] = None) -> List[Message]:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT sender, content, timestamp FROM messages "
+                "WHERE user_id = ? AND role_id = ? ORDER BY timestamp, id LIMIT ? OFFSET ?",
+                (user_id, role_id, -1 if limit is None else limit, offset)
+            ).fetchall()
+        return [self._row_to_message(row) for row in rows]
+
+    def count_messages(self, user_id: str, role_id: str) -> int:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT COUNT(*) FROM messages WHERE user_id = ? AND role_id = ?",
+                (user_id, role_id)
+            ).fetchone()
+        return row[0]
+
+    @property
+    def supports_partial_dialogue(self) -> bool:
+        return True
+
+    def _touch_session(self, memory: DialogueMemory):
+        self._conn.execute(
+            "INSERT INTO dialogue_sessions (user_id, role_id, last_updated) VALUES (?, ?, ?) "
+            "ON CONFLICT (user_id, role_id) DO UPDATE SET last_updated = excluded.last_updated",
+            (memory.user_id, memory.role_id, memory.last_updated.isoformat())
+        )
+
+    def _message_to_row(self, memory: DialogueMemory, message: Message) -> Tuple[str, str, str, str, str]:
+        return (memory.user_id, memory.role_id, message.sender, message.content, message.timestamp.isoformat())
+
+    def _row_to_message(self, row) -> Message:
+        sender, content, timestamp = row
+        # 数据来自本层写入，使用 model_construct 跳过重复校验
+        return Message.model_construct(sender=sender, content=content, timestamp=datetime.fromisoformat(timestamp))
+
+    # ------------------------------------------------------------------
+    # 激活记忆
+    # ------------------------------------------------------------------
+
+    def load_active_memory(self, user_id: str, role_id: str) -> Optional[ActiveMemory]:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT key, value, last_accessed, access_count, created_at FROM active_items "
+                "WHERE user_id = ? AND role_id = ?",
+                (user_id, role_id)
+            ).fetchall()
+        items = {}
+        for key, value, last_accessed, access_count, created_at in rows:
+            items[key] = ActiveMemoryItem(
+                key=key,
+                value=json.loads(value),
+                last_accessed=datetime.fromisoformat(last_accessed),
+                access_count=access_count,
+                # 旧数据没有写入时间，以最后访问时间代替
+                created_at=datetime.fromisoformat(created_at or last_accessed)
+            )
+        return ActiveMemory(user_id=user_id, role_id=role_id, items=items)
+
+    def save_active_memory(self, memory: ActiveMemory):
+        with self._lock, self._conn:
+            self._conn.execute(
+                "DELETE FROM active_items WHERE user_id = ? AND role_id = ?",
+                (memory.user_id, memory.role_id)
+            )
+            self._conn.executemany(
+                "INSERT INTO active_items (user_id, role_id, key, value, last_accessed, access_count, created_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                [self._item_to_row(memory, item) for item in memory.items.values()]
+            )
+
+    def save_active_memory_item(self, memory: ActiveMemory, key: str):
+        self.save_active_memory_items(memory, [key])
+
+    def save_active_memory_items(self, memory: ActiveMemory, keys: Iterable[str]):
+        # 同一事务内逐键写入或删除，不影响其他键
+        upserts, deletes = [], []
+        for key in keys:
+            item = memory.items.get(key)
+            if item is None:
+                deletes.append((memory.user_id, memory.role_id, key))
+            else:
+                upserts.append(self._item_to_row(memory, item))
+        if not upserts and not deletes:
+            return
+        with self._lock, self._conn:
+            if deletes:
+                self._conn.executemany(
+                    "DELETE FROM active_items WHERE user_id = ? AND role_id = ? AND key = ?", deletes
+                )
+            if upserts:
+                self._conn.executemany(
+                    "INSERT INTO active_items (user_id, role_id, key, value, last_accessed, access_count, created_at) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?) "
+                    "ON CONFLICT (user_id, role_id, key) DO UPDATE SET "
+                    "value = excluded.value, last_accessed = excluded.last_accessed, "
+                    "access_count = excluded.access_count, created_at = excluded.created_at",
+                    upserts
+                )
+
+    def _item_to_row(self, memory: ActiveMemory, item: ActiveMemoryItem) -> Tuple[str, str, str, str, str, int, str]:
+        value = json.dumps(item.model_dump(mode='json')['value'], ensure_ascii=False)
+        return (memory.user_id, memory.role_id, item.key, value, item.last_accessed.isoformat(),
+                item.access_count, item.created_at.isoformat())
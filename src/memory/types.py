@@ -1,28 +1,299 @@
-from typing import List, Dict, Any, Optional
-from datetime import datetime
-from pydantic import BaseModel, Field
+import sys
+import threading
+from array import array
+from collections import OrderedDict
+from typing import List, Dict, Any, Optional, Iterable, Iterator, Tuple, Union
+from datetime import datetime, timedelta
+from pydantic import BaseModel, ConfigDict, Field, GetCoreSchemaHandler, GetJsonSchemaHandler, PrivateAttr, field_validator
+from pydantic_core import core_schema
 
 # ----------------------------------------------------------------------
 # 1. 对话记忆 (Dialogue Memory)
 # ----------------------------------------------------------------------
 
 class Message(BaseModel):
-    """单条对话消息"""
+    """
+    单条对话消息（不可变）。DialogueMemory.messages 在读取时按需创建 Message，
+    修改其字段不会写回存储，因此赋值直接抛出 ValidationError；
+    需要修改时以 messages[i] = messages[i].model_copy(update={...}) 整条替换。
+    """
+    model_config = ConfigDict(frozen=True)
+
     sender: str = Field(..., description="发送者，如 'user' 或 'assistant'")
     content: str = Field(..., description="消息内容")
     timestamp: datetime = Field(default_factory=datetime.now, description="消息时间戳")
 
+# 全局共享的发送者字符串表：每条消息只保存 2 字节的下标
+_SENDER_NAMES: List[str] = []
+_SENDER_IDS: Dict[str, int] = {}
+_SENDER_LOCK = threading.Lock()
+
+# 时间戳以自 1970-01-01 起的微秒整数保存（按 naive 本地时间计，往返无损）
+_EPOCH = datetime(1970, 1, 1)
+_TICK = timedelta(microseconds=1)
+
+def _sender_id(sender: str) -> int:
+    sender_id = _SENDER_IDS.get(sender)
+    if sender_id is None:
+        with _SENDER_LOCK:
+            sender_id = _SENDER_IDS.get(sender)
+            if sender_id is None:
+                if len(_SENDER_NAMES) >= 1 << 16:
+                    raise ValueError("发送者种类过多，无法放入紧凑对话存储")
+                sender_id = len(_SENDER_NAMES)
+                _SENDER_NAMES.append(sys.intern(sender))
+                _SENDER_IDS[sender] = sender_id
+    return sender_id
+
+def _to_ticks(timestamp: Union[datetime, str]) -> int:
+    if isinstance(timestamp, str):
+        timestamp = datetime.fromisoformat(timestamp)
+    elif not isinstance(timestamp, datetime):
+        raise ValueError(f"无效的时间戳: {timestamp!r}")
+    if timestamp.tzinfo is not None:
+        # 带时区的时间统一转换为本地 naive 时间，与 datetime.now() 生成的时间戳一致
+        timestamp = timestamp.astimezone().replace(tzinfo=None)
+    return (timestamp - _EPOCH) // _TICK
+
+class CompactMessageList:
+    """
+    对话消息的紧凑列式存储，作为 DialogueMemory.messages 的内部表示。
+
+    每条消息只占用：8 字节时间戳（微秒整数）、2 字节发送者下标（发送者字符串全局驻留）、
+    8 字节内容偏移，以及内容的 UTF-8 字节（所有内容连续存放在一个 bytearray 中）。
+    索引、切片和迭代时才创建 Message（API 边界），加载时不逐条做 pydantic 校验。
+
+    支持 list 的常用操作：len、下标/切片读取（切片返回 List[Message]）、迭代、append、
+    extend、下标赋值和删除（删除开头若干条为 O(1) 偏移调整，供对话窗口裁剪使用）。
+
+    读取返回的 Message 是从列式存储新建的只读副本（Message 为 frozen 模型），
+    修改消息需整条替换：messages[i] = messages[i].model_copy(update={"content": ...})。
+    """
+    __slots__ = ("_timestamps", "_senders", "_starts", "_data", "_base")
+
+    def __init__(self, messages: Iterable[Any] = ()):
+        self._timestamps = array('q')
+        self._senders = array('H')
+        # 每条内容在 _data 中的绝对起始位置；_base 为 _data[0] 的绝对位置（删除开头时前移）
+        self._starts = array('Q')
+        self._data = bytearray()
+        self._base = 0
+        self.extend(messages)
+
+    # ------------------------------------------------------------------
+    # 写入
+    # ------------------------------------------------------------------
+
+    def append_raw(self, sender: str, content: str, timestamp: Union[datetime, str, None] = None):
+        """直接追加字段，不创建 Message。"""
+        ticks = _to_ticks(timestamp if timestamp is not None else datetime.now())
+        sender_id = _sender_id(sender)
+        start = self._base + len(self._data)
+        self._data += content.encode('utf-8')
+        self._starts.append(start)
+        self._senders.append(sender_id)
+        # 时间戳列最后写入：并发读取以其长度作为消息条数
+        self._timestamps.append(ticks)
+
+    def append_record(self, record: Dict[str, Any]):
+        """追加一条序列化后的消息（如 model_dump 或 JSON 解析结果）；字段缺失或类型错误时抛出 ValueError。"""
+        try:
+            sender, content = record["sender"], record["content"]
+        except (KeyError, TypeError) as e:
+            raise ValueError(f"无效的消息记录: {record!r}") from e
+        if not isinstance(sender, str) or not isinstance(content, str):
+            raise ValueError(f"无效的消息记录: {record!r}")
+        self.append_raw(sender, content, record.get("timestamp"))
+
+    def append(self, message: Union["Message", Dict[str, Any]]):
+        if isinstance(message, Message):
+            self.append_raw(message.sender, message.content, message.timestamp)
+        else:
+            self.append_record(message)
+
+    def extend(self, messages: Iterable[Any]):
+        if isinstance(messages, CompactMessageList):
+            for i in range(len(messages)):
+                self.append_raw(*messages._fields(i))
+            return
+        for message in messages:
+            self.append(message)
+
+    # ------------------------------------------------------------------
+    # 读取
+    # ------------------------------------------------------------------
+
+    def __len__(self) -> int:
+        return len(self._timestamps)
+
+    def _content(self, i: int) -> str:
+        start = self._starts[i] - self._base
+        end = self._starts[i + 1] - self._base if i + 1 < len(self._starts) else len(self._data)
+        return self._data[start:end].decode('utf-8')
+
+    def _fields(self, i: int) -> Tuple[str, str, datetime]:
+        return (
+            _SENDER_NAMES[self._senders[i]],
+            self._content(i),
+            _EPOCH + timedelta(microseconds=self._timestamps[i]),
+        )
+
+    def _message(self, i: int) -> "Message":
+        sender, content, timestamp = self._fields(i)
+        # 字段来自已校验的数据，跳过 pydantic 校验
+        return Message.model_construct(sender=sender, content=content, timestamp=timestamp)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self._message(i) for i in range(*index.indices(len(self)))]
+        n = len(self)
+        if index < 0:
+            index += n
+        if not 0 <= index < n:
+            raise IndexError("消息下标越界")
+        return self._message(index)
+
+    def __iter__(self) -> Iterator["Message"]:
+        for i in range(len(self)):
+            yield self._message(i)
+
+    def __bool__(self) -> bool:
+        return len(self) > 0
+
+    def __eq__(self, other) -> bool:
+        if isinstance(other, (CompactMessageList, list)):
+            return len(self) == len(other) and all(a == b for a, b in zip(self, other))
+        return NotImplemented
+
+    def __repr__(self) -> str:
+        return f"CompactMessageList({len(self)} messages, {self.nbytes()} bytes)"
+
+    def records(self, mode: str = "python") -> Iterator[Dict[str, Any]]:
+        """逐条产出序列化字典（与 Message.model_dump 的结构一致），不创建 Message。"""
+        for i in range(len(self)):
+            sender, content, timestamp = self._fields(i)
+            yield {
+                "sender": sender,
+                "content": content,
+                "timestamp": timestamp.isoformat() if mode == "json" else timestamp,
+            }
+
+    # ------------------------------------------------------------------
+    # 替换与删除
+    # ------------------------------------------------------------------
+
+    def __setitem__(self, index: int, message: Union["Message", Dict[str, Any]]):
+        """整条替换第 index 条消息；其后的消息重新追加（替换末尾消息为 O(1)）。"""
+        n = len(self)
+        if index < 0:
+            index += n
+        if not 0 <= index < n:
+            raise IndexError("消息下标越界")
+        following = [self._fields(i) for i in range(index + 1, n)]
+        self._drop_tail(index)
+        self.append(message)
+        for fields in following:
+            self.append_raw(*fields)
+
+    def _drop_tail(self, start: int):
+        # 删除第 start 条及之后的所有消息；时间戳列先删除，与追加时的写入顺序相反
+        cut = self._starts[start] - self._base
+        del self._timestamps[start:]
+        del self._senders[start:]
+        del self._starts[start:]
+        del self._data[cut:]
+
+    def __delitem__(self, index):
+        n = len(self)
+        if isinstance(index, slice):
+            start, stop, step = index.indices(n)
+            if step == 1 and start == 0:
+                self._drop_head(max(stop, 0))
+                return
+            doomed = set(range(start, stop, step))
+        else:
+            if index < 0:
+                index += n
+            if not 0 <= index < n:
+                raise IndexError("消息下标越界")
+            if index == 0:
+                self._drop_head(1)
+                return
+            doomed = {index}
+        kept = [self._fields(i) for i in range(n) if i not in doomed]
+        self.clear()
+        for fields in kept:
+            self.append_raw(*fields)
+
+    def _drop_head(self, count: int):
+        count = min(count, len(self))
+        if count <= 0:
+            return
+        cut = self._starts[count] if count < len(self) else self._base + len(self._data)
+        del self._timestamps[:count]
+        del self._senders[:count]
+        del self._starts[:count]
+        del self._data[:cut - self._base]
+        self._base = cut
+
+    def clear(self):
+        del self._timestamps[:]
+        del self._senders[:]
+        del self._starts[:]
+        self._data = bytearray()
+        self._base = 0
+
+    def nbytes(self) -> int:
+        """存储本身占用的近似字节数（各列数组与内容缓冲区）。"""
+        return (
+            sys.getsizeof(self._timestamps) + sys.getsizeof(self._senders)
+            + sys.getsizeof(self._starts) + sys.getsizeof(self._data)
+        )
+
+    # ------------------------------------------------------------------
+    # pydantic 集成：接受 List[Message | dict]，序列化为消息字典列表
+    # ------------------------------------------------------------------
+
+    @classmethod
+    def _validate(cls, value: Any) -> "CompactMessageList":
+        if isinstance(value, CompactMessageList):
+            return value
+        if isinstance(value, (list, tuple)):
+            return cls(value)
+        raise ValueError("messages 必须是消息列表")
+
+    def _serialize(self, info) -> List[Dict[str, Any]]:
+        return list(self.records(mode="json" if info.mode == "json" else "python"))
+
+    @classmethod
+    def __get_pydantic_core_schema__(cls, source_type: Any, handler: GetCoreSchemaHandler) -> core_schema.CoreSchema:
+        return core_schema.no_info_plain_validator_function(
+            cls._validate,
+            serialization=core_schema.plain_serializer_function_ser_schema(cls._serialize, info_arg=True),
+        )
+
+    @classmethod
+    def __get_pydantic_json_schema__(cls, schema: core_schema.CoreSchema, handler: GetJsonSchemaHandler) -> Dict[str, Any]:
+        return handler(core_schema.list_schema(Message.__pydantic_core_schema__))
+
 class DialogueMemory(BaseModel):
-    """用户与智能体的对话历史"""
+    """
+    用户与智能体的对话历史。messages 以 CompactMessageList 紧凑存储，
+    赋值为 Message 列表时自动转换（validate_assignment）。
+    """
+    model_config = ConfigDict(validate_assignment=True)
+
     user_id: str = Field(..., description="用户唯一ID")
     role_id: str = Field(..., description="角色唯一ID")
-    messages: List[Message] = Field(default_factory=list, description="对话消息列表")
+    messages: CompactMessageList = Field(default_factory=CompactMessageList, description="对话消息列表（紧凑列式存储）")
     last_updated: datetime = Field(default_factory=datetime.now, description="最后更新时间")
     
-    def add_message(self, sender: str, content: str):
-        """添加一条新消息"""
-        self.messages.append(Message(sender=sender, content=content))
+    def add_message(self, sender: str, content: str) -> Message:
+        """添加一条新消息，并返回新建的 Message 以便持久化层增量写入"""
+        message = Message(sender=sender, content=content)
+        self.messages.append(message)
         self.last_updated = datetime.now()
+        return message
 
 # ----------------------------------------------------------------------
 # 2. 激活记忆 (Active Memory)
@@ -33,24 +304,271 @@ class ActiveMemoryItem(BaseModel):
     key: str = Field(..., description="记忆键名，如 'user_preference_food'")
     value: Any = Field(..., description="记忆值")
     last_accessed: datetime = Field(default_factory=datetime.now, description="最后访问时间")
-    
+    access_count: int = Field(0, description="累计读取次数")
+    created_at: datetime = Field(default_factory=datetime.now, description="最近一次写入时间（TTL 自此计时）")
+
+EVICTION_POLICIES = ("lru", "lfu", "ttl")
+
+class ActiveMemoryConfig(BaseModel):
+    """激活记忆的容量、淘汰策略与 Prompt 注入上限"""
+    capacity: Optional[int] = Field(None, ge=1, description="最多保留的键数，None 表示不限")
+    policy: str = Field("lru", description="淘汰策略：lru（最近最少使用）、lfu（最少使用次数）、ttl（最早写入）")
+    ttl_seconds: Optional[float] = Field(None, description="条目自写入起的存活时间（秒），None 表示不过期；对所有策略生效")
+    context_items: Optional[int] = Field(None, ge=0, description="融合进 Prompt 的最多条目数（按策略排名取前 N），None 表示全部")
+
+class _ItemDict(dict):
+    """
+    ActiveMemory.items 使用的 dict：记录修改次数（version），
+    据此发现绕过 ActiveMemory 方法对 items 的直接增删（如持久化层逐项加载、调用方直接赋值）。
+    """
+    # 类属性作为初始值：pickle / deepcopy 重建时不调用 __init__
+    version = 0
+
+    def __setitem__(self, key, value):
+        super().__setitem__(key, value)
+        self.version += 1
+
+    def __delitem__(self, key):
+        super().__delitem__(key)
+        self.version += 1
+
+    def pop(self, key, *default):
+        if key in self:
+            self.version += 1
+        return super().pop(key, *default)
+
+    def popitem(self):
+        self.version += 1
+        return super().popitem()
+
+    def setdefault(self, key, default=None):
+        if key not in self:
+            self.version += 1
+        return super().setdefault(key, default)
+
+    def update(self, *args, **kwargs):
+        super().update(*args, **kwargs)
+        self.version += 1
+
+    def clear(self):
+        super().clear()
+        self.version += 1
+
+class _EvictionIndex:
+    """
+    ActiveMemory 的淘汰顺序索引，所有操作 O(1)。
+    lru / ttl：有序字典，队首最先淘汰（lru 访问时移到队尾，ttl 只在写入时入队）；
+    lfu：读取次数 -> 该次数下的键（按进入该桶的先后排序），并维护当前最小次数。
+    """
+    __slots__ = ("policy", "order", "buckets", "min_count", "source", "version")
+
+    def __init__(self, policy: str, items: Dict[str, ActiveMemoryItem]):
+        self.policy = policy
+        # 根据持久化的访问统计恢复顺序
+        if policy == "ttl":
+            keys = sorted(items, key=lambda key: items[key].created_at)
+        else:
+            keys = sorted(items, key=lambda key: items[key].last_accessed)
+        self.order: "OrderedDict[str, None]" = OrderedDict.fromkeys(keys)
+        self.buckets: Dict[int, "OrderedDict[str, None]"] = {}
+        if policy == "lfu":
+            for key in keys:
+                self.buckets.setdefault(items[key].access_count, OrderedDict())[key] = None
+        self.min_count = min(self.buckets) if self.buckets else 0
+        # 建立索引时的 items 及其修改次数，不一致时需要重建
+        self.source = items
+        self.version = getattr(items, "version", None)
+
+    def add(self, key: str, count: int):
+        self.order[key] = None
+        if self.policy == "lfu":
+            self.buckets.setdefault(count, OrderedDict())[key] = None
+            if count < self.min_count or len(self.buckets) == 1:
+                self.min_count = count
+
+    def remove(self, key: str, count: int):
+        self.order.pop(key, None)
+        if self.policy == "lfu":
+            bucket = self.buckets.get(count)
+            if bucket is None:
+                return
+            bucket.pop(key, None)
+            if not bucket:
+                del self.buckets[count]
+                if count == self.min_count:
+                    # 不同的读取次数通常很少，取最小值的代价可忽略
+                    self.min_count = min(self.buckets) if self.buckets else 0
+
+    def touch(self, key: str, count: int):
+        """key 被读取一次，count 为读取后的次数。"""
+        if self.policy == "lru":
+            self.order.move_to_end(key)
+        elif self.policy == "lfu":
+            # 从 n 次桶移到 n+1 次桶；若 n 次桶因此清空且为最小值，新的最小值即 n+1
+            previous = count - 1
+            bucket = self.buckets[previous]
+            del bucket[key]
+            if not bucket:
+                del self.buckets[previous]
+                if self.min_count == previous:
+                    self.min_count = count
+            self.buckets.setdefault(count, OrderedDict())[key] = None
+
+    def victim(self) -> str:
+        if self.policy == "lfu":
+            return next(iter(self.buckets[self.min_count]))
+        return next(iter(self.order))
+
+    def ranked_keys(self) -> List[str]:
+        """保留优先级从高到低（最不可能被淘汰的在前）。"""
+        if self.policy == "lfu":
+            return [key for count in sorted(self.buckets, reverse=True) for key in reversed(self.buckets[count])]
+        return list(reversed(self.order))
+
 class ActiveMemory(BaseModel):
-    """高频、近期的关键信息缓存 (KV 形式)"""
+    """
+    高频、近期的关键信息缓存 (KV 形式)。
+
+    按 config 限制容量：写入新键时若已满，按策略淘汰——lru 淘汰最久未访问的键，lfu 淘汰读取次数
+    最少的键（次数相同时淘汰较早的），ttl 淘汰最早写入的键；设置 ttl_seconds 时过期条目在读取时
+    惰性删除。get / set 均为 O(1)。访问统计（last_accessed、access_count）随条目持久化，
+    加载后据此恢复淘汰顺序。items 保持写入顺序，便于 Prompt 中的条目顺序稳定。
+    """
     user_id: str = Field(..., description="用户唯一ID")
     role_id: str = Field(..., description="角色唯一ID")
     items: Dict[str, ActiveMemoryItem] = Field(default_factory=dict, description="激活记忆键值对")
-    
+    config: ActiveMemoryConfig = Field(default_factory=ActiveMemoryConfig, exclude=True, description="容量与淘汰策略（不持久化）")
+
+    _index: Optional[_EvictionIndex] = PrivateAttr(None)
+
+    @field_validator("items", mode="after")
+    @classmethod
+    def _track_items(cls, items: Dict[str, ActiveMemoryItem]) -> Dict[str, ActiveMemoryItem]:
+        return _ItemDict(items)
+
+    def configure(self, config: ActiveMemoryConfig) -> List[str]:
+        """
+        应用新的容量与淘汰策略，并立即清理过期和超出容量的条目。
+        :return: 被删除的键，调用方需同步到持久化层。
+        """
+        if config.policy not in EVICTION_POLICIES:
+            raise ValueError(f"未知的淘汰策略: {config.policy}，可选 {EVICTION_POLICIES}")
+        self.config = config
+        self._index = None
+        return self.purge_expired() + self._evict(reserve=0)
+
+    def _get_index(self) -> _EvictionIndex:
+        # 首次使用、items 被整体替换或被直接增删（修改次数与索引记录的不一致）后重建索引
+        items = self.items
+        if not isinstance(items, _ItemDict):
+            items = self.items = _ItemDict(items)
+        index = self._index
+        if index is None or index.source is not items or index.version != items.version:
+            index = self._index = _EvictionIndex(self.config.policy, items)
+        return index
+
+    def _synced(self, index: _EvictionIndex):
+        # 本类方法同时修改了 items 与索引，二者仍一致
+        index.version = self.items.version
+
+    def _expired(self, item: ActiveMemoryItem, now: datetime) -> bool:
+        ttl = self.config.ttl_seconds
+        return ttl is not None and (now - item.created_at).total_seconds() >= ttl
+
     def get(self, key: str) -> Optional[Any]:
-        """获取激活记忆项的值"""
+        """获取激活记忆项的值，并更新其访问时间和读取次数；已过期的条目被删除并返回 None"""
         item = self.items.get(key)
-        if item:
-            item.last_accessed = datetime.now()
-            return item.value
-        return None
+        if item is None:
+            return None
+        index = self._get_index()
+        now = datetime.now()
+        if self._expired(item, now):
+            del self.items[key]
+            index.remove(key, item.access_count)
+            self._synced(index)
+            return None
+        item.last_accessed = now
+        item.access_count += 1
+        index.touch(key, item.access_count)
+        return item.value
+
+    def set(self, key: str, value: Any) -> List[str]:
+        """
+        设置或更新激活记忆项（保留该键已有的读取次数，TTL 重新计时）。
+        :return: 因容量已满被淘汰的键。
+        """
+        index = self._get_index()
+        access_count = 0
+        evicted: List[str] = []
+        existing = self.items.pop(key, None)
+        if existing is not None:
+            access_count = existing.access_count
+            index.remove(key, access_count)
+        elif self.config.capacity is not None and len(self.items) >= self.config.capacity:
+            evicted = self._evict(reserve=1)
+            index = self._get_index()
+        self.items[key] = ActiveMemoryItem(key=key, value=value, access_count=access_count)
+        index.add(key, access_count)
+        self._synced(index)
+        return evicted
+
+    def delete(self, key: str) -> bool:
+        """删除激活记忆项，返回该键是否存在"""
+        index = self._get_index()
+        item = self.items.pop(key, None)
+        if item is None:
+            return False
+        index.remove(key, item.access_count)
+        self._synced(index)
+        return True
 
-    def set(self, key: str, value: Any):
-        """设置或更新激活记忆项"""
-        self.items[key] = ActiveMemoryItem(key=key, value=value)
+    def purge_expired(self) -> List[str]:
+        """删除所有已过期的条目，返回被删除的键"""
+        if self.config.ttl_seconds is None:
+            return []
+        index = self._get_index()
+        now = datetime.now()
+        expired = [key for key, item in self.items.items() if self._expired(item, now)]
+        for key in expired:
+            index.remove(key, self.items.pop(key).access_count)
+        self._synced(index)
+        return expired
+
+    def _evict(self, reserve: int) -> List[str]:
+        # 淘汰至 len(items) + reserve <= capacity，优先删除已过期的条目
+        capacity = self.config.capacity
+        if capacity is None or len(self.items) + reserve <= capacity:
+            return []
+        evicted = self.purge_expired()
+        index = self._get_index()
+        while self.items and len(self.items) + reserve > capacity:
+            victim = index.victim()
+            index.remove(victim, self.items.pop(victim).access_count)
+            evicted.append(victim)
+        self._synced(index)
+        return evicted
+
+    def ranked_items(self, limit: Optional[int] = None) -> List[ActiveMemoryItem]:
+        """
+        按淘汰策略的保留优先级排序，跳过已过期条目，最多返回 limit 个：
+        lru 按最近访问、lfu 按读取次数（其次最近访问）、ttl 按最近写入。
+        """
+        now = datetime.now()
+        ranked = [self.items[key] for key in self._get_index().ranked_keys()]
+        ranked = [item for item in ranked if not self._expired(item, now)]
+        return ranked if limit is None else ranked[:limit]
+
+    def context_items(self, limit: Optional[int] = None) -> List[ActiveMemoryItem]:
+        """
+        选出排名前 limit 的条目用于 Prompt，按写入顺序返回（读取不会改变 Prompt 中的顺序，利于前缀缓存）。
+        limit 为 None 时使用 config.context_items。
+        """
+        limit = self.config.context_items if limit is None else limit
+        if limit is None:
+            now = datetime.now()
+            return [item for item in self.items.values() if not self._expired(item, now)]
+        selected = {item.key for item in self.ranked_items(limit)}
+        return [item for key, item in self.items.items() if key in selected]
 
 # ----------------------------------------------------------------------
 # 3. 专业记忆 (Professional Memory) - 仅定义接口，具体实现依赖外部 RAG/VectorDB
@@ -72,6 +590,7 @@ class ProfessionalMemoryResult(BaseModel):
 class ProfessionalMemory(BaseModel):
     """专业记忆的抽象表示"""
     results: List[ProfessionalMemoryResult] = Field(default_factory=list, description="检索到的专业知识列表")
+    error: Optional[str] = Field(None, description="检索失败时的错误信息（此时结果为空，不应被缓存）")
     
     def to_prompt_context(self) -> str:
         """将检索结果格式化为可用于 Prompt 的上下文"""
@@ -80,9 +599,14 @@ class ProfessionalMemory(BaseModel):
         
         context = "以下是与用户查询相关的专业知识片段，请参考并融合到你的回答中：\n"
         for i, result in enumerate(self.results):
-            context += f"--- 知识片段 {i+1} ---\n"
-            context += f"{result.content}\n"
-            if result.source:
-                context += f"来源: {result.source}\n"
+            context += self.format_result(i, result)
         context += "------------------------\n"
         return context
+
+    @staticmethod
+    def format_result(i: int, result: ProfessionalMemoryResult) -> str:
+        """格式化单个知识片段"""
+        text = f"--- 知识片段 {i+1} ---\n{result.content}\n"
+        if result.source:
+            text += f"来源: {result.source}\n"
+        return text
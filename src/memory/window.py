@@ -0,0 +1,90 @@
+from typing import Optional, List, Dict, Any, Iterator, Callable
+from memory.types import DialogueMemory, Message
+from memory.persistence import PersistenceLayer
+
+class DialogueWindow:
+    """
+    对话记忆的窗口视图。
+
+    内存中只保留最近 window_size 条消息（self.memory.messages），更早的历史按需
+    通过持久化层分页加载，使每个会话的常驻内存为 O(window) 而非 O(history)。
+    window_size 为 None 时退化为完整加载，行为与直接持有 DialogueMemory 一致。
+    """
+    def __init__(self, persistence: PersistenceLayer, user_id: str, role_id: str,
+                 window_size: Optional[int] = 100,
+                 before_read: Optional[Callable[[], None]] = None):
+        """
+        :param before_read: 从持久化层读取历史前的回调（如写回模式下先落盘未写入的消息）。
+        """
+        if window_size is not None and window_size <= 0:
+            raise ValueError("window_size 必须为正整数或 None")
+
+        self.persistence = persistence
+        self.before_read = before_read
+        self.user_id = user_id
+        self.role_id = role_id
+        self.window_size = window_size
+
+        if window_size is None:
+            self.memory: DialogueMemory = persistence.load_dialogue_memory(user_id, role_id)
+            self.total_count = len(self.memory.messages)
+        else:
+            self.memory = DialogueMemory(user_id=user_id, role_id=role_id)
+            self.memory.messages = persistence.load_recent_messages(user_id, role_id, window_size)
+            if self.memory.messages:
+                self.memory.last_updated = self.memory.messages[-1].timestamp
+            self.total_count = persistence.count_messages(user_id, role_id)
+
+    def add_message(self, sender: str, content: str) -> Message:
+        """添加一条新消息，超出窗口的旧消息从内存中移除（仍保留在持久化层中）。"""
+        message = self.memory.add_message(sender, content)
+        self.total_count += 1
+        if self.window_size is not None:
+            overflow = len(self.memory.messages) - self.window_size
+            if overflow > 0:
+                del self.memory.messages[:overflow]
+        return message
+
+    def recent(self, n: int) -> List[Message]:
+        """获取最近 n 条消息；超出内存窗口的部分从持久化层读取。"""
+        if n <= 0:
+            return []
+        resident = self.memory.messages
+        if n <= len(resident) or len(resident) >= self.total_count:
+            return resident[-n:]
+        self._sync()
+        return self.persistence.load_recent_messages(self.user_id, self.role_id, n)
+
+    def load_page(self, offset: int = 0, limit: int = 50) -> List[Message]:
+        """分页加载历史消息（offset 从最早的消息开始计数）。"""
+        resident_start = self.total_count - len(self.memory.messages)
+        if offset >= resident_start:
+            start = offset - resident_start
+            return self.memory.messages[start:start + limit]
+        self._sync()
+        return self.persistence.load_messages(self.user_id, self.role_id, offset=offset, limit=limit)
+
+    def _sync(self):
+        if self.before_read is not None:
+            self.before_read()
+
+    def iter_history(self, page_size: int = 200) -> Iterator[Message]:
+        """按时间正序逐页遍历完整历史，任意时刻只持有一页消息。"""
+        offset = 0
+        while offset < self.total_count:
+            page = self.load_page(offset, page_size)
+            if not page:
+                break
+            yield from page
+            offset += len(page)
+
+    def memory_stats(self) -> Dict[str, Any]:
+        """
+        返回内存占用统计。resident_bytes 为常驻消息紧凑存储（各列数组与内容缓冲区）的近似字节数。
+        """
+        return {
+            "window_size": self.window_size,
+            "resident_messages": len(self.memory.messages),
+            "total_messages": self.total_count,
+            "resident_bytes": self.memory.messages.nbytes(),
+        }
@@ -0,0 +1,192 @@
+import time
+import atexit
+import threading
+from typing import Any, Dict, Optional, Tuple, TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from memory.manager import MemoryManager
+
+class WriteBehindError(RuntimeError):
+    """背压等待超时且有会话持续写入失败：待写消息无法回落到上限以内。"""
+
+class WriteBehindFlusher:
+    """
+    记忆写回（write-behind）后台刷新器，可由多个 MemoryManager 共享。
+
+    开启写回模式的 MemoryManager 在 add_dialogue / set_active_memory 时只把变更记入内存并
+    标记为脏，由后台线程合并写盘：每个会话在第一次未落盘的变更发生后最多 max_staleness 秒
+    内完成一次写入，期间的多条消息与激活记忆变更合并为一次批量写入。
+
+    所有会话的待写消息总数超过 max_pending 时，调用方阻塞等待（背压）并触发立即刷新；
+    等待超过 backpressure_timeout 秒且仍有会话写入失败时，向调用方抛出 WriteBehindError
+    （以最近一次写入异常为 __cause__），避免存储持续不可用时生产者无限期阻塞。
+    失败的变更保留在内存中，后台线程继续按 max_staleness 间隔重试。
+    close()（进程退出时自动调用）会将所有未落盘的变更同步写入。
+    """
+    def __init__(self, max_staleness: float = 2.0, max_pending: int = 10000,
+                 backpressure_timeout: Optional[float] = 30.0):
+        """
+        :param max_staleness: 变更在内存中停留的最长时间（秒），即崩溃时最多丢失的时间窗口。
+        :param max_pending: 待写消息总数上限，超过时 add_dialogue 阻塞直至刷新完成。
+        :param backpressure_timeout: 背压等待的最长时间（秒），超时且有会话写入失败时抛出
+            WriteBehindError；None 表示一直等待。
+        """
+        self.max_staleness = max_staleness
+        self.max_pending = max_pending
+        self.backpressure_timeout = backpressure_timeout
+
+        self._cond = threading.Condition()
+        # id(manager) -> (刷新截止时间, manager)
+        self._dirty: Dict[int, Tuple[float, "MemoryManager"]] = {}
+        # id(manager) -> 该会话最近一次写入失败的异常（写入成功后移除）
+        self._failures: Dict[int, BaseException] = {}
+        self._pending = 0
+        self._urgent = False
+        self._closed = False
+
+        self.flushes = 0
+        self.messages_written = 0
+        self.backpressure_waits = 0
+        self.errors = 0
+
+        self._thread = threading.Thread(target=self._run, name="memory-write-behind", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def record(self, manager: "MemoryManager", messages: int = 0) -> bool:
+        """
+        登记会话有未落盘的变更并计入 messages 条新增待写消息，不阻塞。
+        新增消息时应在持有会话待写队列锁、消息入队的同时调用：后台刷新取走消息后才扣减计数，
+        计数因此不会多于实际待写的消息。
+        :return: False 表示刷新器已关闭（进程退出中），调用方需自行同步写入。
+        """
+        with self._cond:
+            if self._closed:
+                return False
+            key = id(manager)
+            if key not in self._dirty:
+                self._dirty[key] = (time.monotonic() + self.max_staleness, manager)
+                self._cond.notify_all()
+            self._pending += messages
+            return True
+
+    def mark_dirty(self, manager: "MemoryManager", block: bool = True):
+        """
+        标记会话有未落盘的变更（不新增待写消息，如激活记忆的修改）。
+        block=True 且待写总数超过上限时阻塞等待后台刷新。
+        """
+        if not self.record(manager):
+            # 刷新器已关闭（进程退出中）：直接同步写入
+            manager.flush_pending()
+        elif block:
+            self.wait_for_capacity()
+
+    @property
+    def over_capacity(self) -> bool:
+        return self._pending > self.max_pending
+
+    def wait_for_capacity(self):
+        """阻塞直至待写消息总数回落到上限以内；超时且有会话写入失败时抛出 WriteBehindError。"""
+        with self._cond:
+            self._wait_for_capacity_locked()
+
+    def _wait_for_capacity_locked(self):
+        if self._pending > self.max_pending:
+            self.backpressure_waits += 1
+            # 触发一次立即刷新；失败的会话此后按 max_staleness 间隔重试，等待方不再反复触发
+            self._urgent = True
+            self._cond.notify_all()
+        started = time.monotonic()
+        while self._pending > self.max_pending and not self._closed:
+            if (self.backpressure_timeout is not None and self._failures
+                    and time.monotonic() - started >= self.backpressure_timeout):
+                error = list(self._failures.values())[-1]
+                raise WriteBehindError(
+                    f"写回背压等待超过 {self.backpressure_timeout} 秒，{len(self._failures)} 个会话写入失败，"
+                    f"待写消息 {self._pending} 条: {error}"
+                ) from error
+            timeout = self.max_staleness
+            if self.backpressure_timeout is not None:
+                remaining = started + self.backpressure_timeout - time.monotonic()
+                if remaining > 0:
+                    timeout = min(timeout, remaining)
+            self._cond.wait(timeout=timeout)
+
+    def flushed(self, manager: "MemoryManager", written: int, error: Optional[BaseException] = None,
+                pending: bool = False):
+        """
+        由 MemoryManager 在每次写入后、持有其待写队列锁时回调，更新计数并从脏集合中移除。
+        error 为写入失败时的异常；pending 表示写入期间又有新变更（仍保留在脏集合中）。
+        """
+        failed = error is not None
+        with self._cond:
+            self._pending = max(self._pending - written, 0)
+            self.messages_written += written
+            key = id(manager)
+            if failed:
+                self.errors += 1
+                self._failures.pop(key, None)
+                self._failures[key] = error
+            else:
+                self.flushes += 1
+                self._failures.pop(key, None)
+            if failed or pending:
+                # 写入失败或写入期间又有新变更：保留在脏集合中，稍后再次刷新
+                self._dirty[key] = (time.monotonic() + self.max_staleness, manager)
+            else:
+                self._dirty.pop(key, None)
+            self._cond.notify_all()
+
+    def flush_all(self):
+        """立即同步刷新所有脏会话。"""
+        with self._cond:
+            managers = [manager for _, manager in self._dirty.values()]
+        for manager in managers:
+            self._flush(manager)
+
+    def close(self):
+        """停止后台线程，并同步写入所有未落盘的变更。可重复调用。"""
+        with self._cond:
+            if self._closed:
+                return
+            self._closed = True
+            self._cond.notify_all()
+        self._thread.join()
+        self.flush_all()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._cond:
+            return {
+                "dirty_sessions": len(self._dirty),
+                "failing_sessions": len(self._failures),
+                "pending_messages": self._pending,
+                "flushes": self.flushes,
+                "messages_written": self.messages_written,
+                "backpressure_waits": self.backpressure_waits,
+                "errors": self.errors,
+            }
+
+    def _flush(self, manager: "MemoryManager"):
+        try:
+            manager.flush_pending()
+        except Exception as e:
+            print(f"会话 ({manager.user_id}, {manager.role.role_id}) 写回失败，稍后重试: {e}")
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._closed and not self._dirty:
+                    self._cond.wait()
+                if self._closed:
+                    return
+                now = time.monotonic()
+                if self._urgent:
+                    due = [manager for _, manager in self._dirty.values()]
+                    self._urgent = False
+                else:
+                    due = [manager for deadline, manager in self._dirty.values() if deadline <= now]
+                if not due:
+                    self._cond.wait(timeout=min(deadline for deadline, _ in self._dirty.values()) - now)
+                    continue
+            for manager in due:
+                self._flush(manager)
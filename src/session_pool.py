@@ -0,0 +1,215 @@
+import time
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Optional, Tuple, Any
+from role import Role
+from agent import RolePlayingAgent
+
+SessionKey = Tuple[str, str]
+
+class AgentPool:
+    """
+    智能体会话池。按 (user_id, role_id) 缓存常驻的 RolePlayingAgent，避免每条消息都重新
+    构建 MemoryManager、持久化层和向量库客户端并从磁盘重新加载记忆。
+
+    冷会话按 LRU 顺序淘汰：超过 max_sessions、空闲超过 idle_timeout 秒，或所有会话的
+    估算常驻内存超过 max_resident_bytes 时淘汰，淘汰前调用 MemoryManager.flush() 落盘。
+
+    创建智能体（从磁盘加载记忆）与淘汰时的落盘均在池锁之外执行，慢会话不会阻塞其他会话的 get；
+    同一会话的并发 get 共享一次加载，正在落盘的会话需等落盘完成后才会重新加载。
+    查询结束后应调用 release()（或使用 session() 上下文管理器），使本轮增长的内存计入上限。
+    """
+    def __init__(self, roles: Dict[str, Role],
+                 agent_factory: Optional[Callable[[str, Role], RolePlayingAgent]] = None,
+                 max_sessions: int = 10000,
+                 idle_timeout: Optional[float] = 1800.0,
+                 max_resident_bytes: Optional[int] = None):
+        """
+        :param roles: role_id -> Role 的映射。
+        :param agent_factory: 创建智能体的函数 (user_id, role) -> RolePlayingAgent，
+            可在其中注入共享的 LLMConnector、持久化层和 RAG 系统。默认使用 RolePlayingAgent 的默认配置。
+        :param max_sessions: 最大常驻会话数。
+        :param idle_timeout: 空闲淘汰时间（秒），None 表示不按空闲时间淘汰。
+        :param max_resident_bytes: 所有会话估算常驻内存的上限（字节），None 表示不限制。
+        """
+        self.roles = roles
+        self.agent_factory = agent_factory if agent_factory else (lambda user_id, role: RolePlayingAgent(user_id, role))
+        self.max_sessions = max_sessions
+        self.idle_timeout = idle_timeout
+        self.max_resident_bytes = max_resident_bytes
+
+        self._lock = threading.RLock()
+        # 按最近访问排序：最久未访问的会话在最前
+        self._sessions: "OrderedDict[SessionKey, RolePlayingAgent]" = OrderedDict()
+        self._last_access: Dict[SessionKey, float] = {}
+        self._sizes: Dict[SessionKey, int] = {}
+        self._resident_bytes = 0
+        # 正在创建的会话（同一会话的并发 get 等待同一个 Future）与正在淘汰落盘的会话
+        self._loading: Dict[SessionKey, "Future[RolePlayingAgent]"] = {}
+        self._flushing: Dict[SessionKey, "Future[None]"] = {}
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, user_id: str, role_id: str) -> RolePlayingAgent:
+        """获取会话对应的智能体，不存在时创建并加入会话池。"""
+        key = (user_id, role_id)
+        victims: List[Tuple[SessionKey, RolePlayingAgent]] = []
+        try:
+            with self._lock:
+                victims.extend(self._pop_idle())
+                agent = self._sessions.get(key)
+                if agent is not None:
+                    self.hits += 1
+                    self._sessions.move_to_end(key)
+                    self._last_access[key] = time.monotonic()
+                    return agent
+                self.misses += 1
+                loading = self._loading.get(key)
+                if loading is None:
+                    role = self.roles.get(role_id)
+                    if role is None:
+                        raise KeyError(f"未知的角色: {role_id}")
+                    loading = self._loading[key] = Future()
+                    flushing = self._flushing.get(key)
+                    owner = True
+                else:
+                    owner = False
+        finally:
+            self._flush_evicted(victims)
+
+        if not owner:
+            return loading.result()
+
+        try:
+            # 该会话刚被淘汰时，等待落盘完成后再从磁盘加载
+            if flushing is not None:
+                flushing.result()
+            agent = self.agent_factory(user_id, role)
+        except BaseException as e:
+            with self._lock:
+                del self._loading[key]
+            loading.set_exception(e)
+            raise
+
+        with self._lock:
+            del self._loading[key]
+            self._sessions[key] = agent
+            self._sizes[key] = 0
+            self._last_access[key] = time.monotonic()
+            self._refresh_size(key)
+            victims = self._pop_over_limit(protect=key)
+        loading.set_result(agent)
+        self._flush_evicted(victims)
+        return agent
+
+    def release(self, user_id: str, role_id: str):
+        """
+        查询结束后调用：重新估算该会话的常驻内存（计入本轮对话的增长），超过上限时淘汰其他冷会话。
+        """
+        key = (user_id, role_id)
+        with self._lock:
+            if key not in self._sessions:
+                return
+            self._refresh_size(key)
+            victims = self._pop_over_limit(protect=key)
+        self._flush_evicted(victims)
+
+    @contextmanager
+    def session(self, user_id: str, role_id: str) -> Iterator[RolePlayingAgent]:
+        """get() 与 release() 的上下文管理器形式：with pool.session(user_id, role_id) as agent: ..."""
+        agent = self.get(user_id, role_id)
+        try:
+            yield agent
+        finally:
+            self.release(user_id, role_id)
+
+    def evict(self, user_id: str, role_id: str) -> bool:
+        """主动淘汰指定会话（先落盘）。返回该会话是否在池中。"""
+        key = (user_id, role_id)
+        with self._lock:
+            if key not in self._sessions:
+                return False
+            victims = [self._pop(key)]
+        self._flush_evicted(victims)
+        return True
+
+    def flush_all(self):
+        """将所有常驻会话落盘（不淘汰）。"""
+        with self._lock:
+            agents = list(self._sessions.values())
+        for agent in agents:
+            agent.memory_manager.flush()
+
+    def close(self):
+        """落盘并清空所有会话，用于进程退出前。"""
+        with self._lock:
+            victims = [self._pop(key) for key in list(self._sessions)]
+        self._flush_evicted(victims)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "resident_sessions": len(self._sessions),
+                "resident_bytes": self._resident_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+            }
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+    def _refresh_size(self, key: SessionKey):
+        size = self._sessions[key].memory_manager.estimate_resident_bytes()
+        self._resident_bytes += size - self._sizes[key]
+        self._sizes[key] = size
+
+    def _pop_idle(self) -> List[Tuple[SessionKey, RolePlayingAgent]]:
+        if self.idle_timeout is None:
+            return []
+        deadline = time.monotonic() - self.idle_timeout
+        victims = []
+        # 会话按访问顺序排列，遇到第一个未超时的即可停止
+        while self._sessions:
+            key = next(iter(self._sessions))
+            if self._last_access[key] > deadline:
+                break
+            victims.append(self._pop(key))
+        return victims
+
+    def _pop_over_limit(self, protect: SessionKey) -> List[Tuple[SessionKey, RolePlayingAgent]]:
+        victims = []
+        while len(self._sessions) > self.max_sessions or (
+            self.max_resident_bytes is not None and self._resident_bytes > self.max_resident_bytes
+        ):
+            key = next(iter(self._sessions))
+            if key == protect:
+                break
+            victims.append(self._pop(key))
+        return victims
+
+    def _pop(self, key: SessionKey) -> Tuple[SessionKey, RolePlayingAgent]:
+        """在池锁内移出会话，并登记为正在落盘（由 _flush_evicted 在锁外完成）。"""
+        agent = self._sessions.pop(key)
+        self._last_access.pop(key, None)
+        self._resident_bytes -= self._sizes.pop(key, 0)
+        self.evictions += 1
+        self._flushing[key] = Future()
+        return key, agent
+
+    def _flush_evicted(self, victims: List[Tuple[SessionKey, RolePlayingAgent]]):
+        for key, agent in victims:
+            try:
+                agent.memory_manager.flush()
+            except Exception as e:
+                print(f"会话 {key} 淘汰时落盘失败: {e}")
+            finally:
+                with self._lock:
+                    done = self._flushing.pop(key)
+                done.set_result(None)
@@ -0,0 +1,61 @@
+import os
+import sys
+import json
+import shutil
+import tempfile
+import argparse
+import subprocess
+from typing import Any, Dict, Tuple
+
+# 构建智能体时不应导入的重量级依赖（均应在首次检索 / 首次真实 LLM 调用时才加载）
+HEAVY_MODULES: Tuple[str, ...] = ("chromadb", "openai", "sentence_transformers", "langchain_community", "torch")
+
+_CHILD_SCRIPT = """
+import sys, json, time
+started = time.perf_counter()
+from agent import RolePlayingAgent
+from role import Role
+from llm.connector import MockLLMConnector
+from memory.manager import MemoryManager
+from memory.persistence import FilePersistenceLayer
+
+role = Role("startup_check", "启动检查", "你是一个用于启动检查的角色。", professional_knowledge_path="startup_check")
+manager = MemoryManager("startup_user", role, persistence_layer=FilePersistenceLayer(sys.argv[1]))
+RolePlayingAgent("startup_user", role, llm_connector=MockLLMConnector(), memory_manager=manager)
+elapsed = time.perf_counter() - started
+print(json.dumps({"elapsed_ms": round(elapsed * 1000, 1), "modules": sorted(sys.modules)}))
+"""
+
+def check_startup(heavy_modules: Tuple[str, ...] = HEAVY_MODULES) -> Dict[str, Any]:
+    """
+    导入时间回归检查：在全新的子进程中导入 agent 并以 MockLLMConnector 构建 RolePlayingAgent，
+    确认 heavy_modules 中的依赖均未被导入（延迟加载未被破坏），并报告导入与构建耗时。
+    """
+    src_dir = os.path.dirname(os.path.abspath(__file__))
+    base_path = tempfile.mkdtemp(prefix="startup_check_")
+    try:
+        completed = subprocess.run(
+            [sys.executable, "-c", _CHILD_SCRIPT, base_path],
+            cwd=src_dir, capture_output=True, text=True, check=True
+        )
+    finally:
+        shutil.rmtree(base_path, ignore_errors=True)
+
+    child = json.loads(completed.stdout.strip().splitlines()[-1])
+    loaded = set(child["modules"])
+    imported = [name for name in heavy_modules if name in loaded]
+    return {
+        "elapsed_ms": child["elapsed_ms"],
+        "heavy_imported": imported,
+        "ok": not imported,
+    }
+
+if __name__ == '__main__':
+    # cd src && python -m startup_check
+    parser = argparse.ArgumentParser(description="启动导入检查：构建智能体时不应加载 chromadb / openai / 嵌入模型等重量级依赖")
+    parser.add_argument("--module", action="append", help="额外检查的模块名，可重复指定")
+    args = parser.parse_args()
+
+    result = check_startup(HEAVY_MODULES + tuple(args.module or ()))
+    print(result)
+    sys.exit(0 if result["ok"] else 1)